@@ -0,0 +1,156 @@
+"""
+Bay-aware slot availability.
+
+A CapacityIndex is a per-day grid of (time bucket x service bay) occupancy for a
+date range. It is filled from a single range query over Booking, using each
+booking's end_time (derived from ServicePackage.duration_minutes) so a two-hour
+detail blocks both of the hourly buckets it spans.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import Booking
+
+OPENING_HOUR = getattr(settings, 'SHOP_OPENING_HOUR', 9)
+CLOSING_HOUR = getattr(settings, 'SHOP_CLOSING_HOUR', 18)
+SLOT_MINUTES = getattr(settings, 'BOOKING_SLOT_MINUTES', 60)
+SERVICE_BAYS = list(getattr(settings, 'SERVICE_BAYS', ['Bay 1', 'Bay 2']))
+
+# Calendar screens ask for a week or a month; anything larger is a client bug.
+MAX_RANGE_DAYS = 62
+
+SLOT_LABEL_FORMAT = "%I:%M %p"
+
+
+def _aware(day, at):
+    return timezone.make_aware(datetime.combine(day, at), timezone.get_current_timezone())
+
+
+class CapacityIndex:
+    """Occupancy of every bay in every bookable bucket between two dates (inclusive)."""
+
+    def __init__(self, start_date, end_date, bays=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.bays = list(bays if bays is not None else SERVICE_BAYS)
+        self.bucket_starts = [
+            time(minute // 60, minute % 60)
+            for minute in range(OPENING_HOUR * 60, CLOSING_HOUR * 60, SLOT_MINUTES)
+        ]
+        day_count = (end_date - start_date).days + 1
+        # One Counter per (day, bucket): keys are bay labels, None for "any free bay".
+        self._load = [[Counter() for _ in self.bucket_starts] for _ in range(day_count)]
+
+    @classmethod
+    def for_range(cls, start_date, end_date, bays=None):
+        index = cls(start_date, end_date, bays=bays)
+        index.fill(index.booking_windows())
+        return index
+
+    def booking_windows(self):
+        """Single indexed range query: (time_slot, end_time, bay_assignment) for live bookings."""
+        return (
+            Booking.objects
+            .filter(
+                time_slot__gte=_aware(self.start_date, time.min),
+                time_slot__lt=_aware(self.end_date, time(CLOSING_HOUR)),
+            )
+            .exclude(status='CANCELLED')
+            .values_list('time_slot', 'end_time', 'bay_assignment')
+        )
+
+    def fill(self, windows):
+        slot = timedelta(minutes=SLOT_MINUTES)
+        for start, end, bay in windows:
+            start = timezone.localtime(start)
+            end = timezone.localtime(end) if end else start + slot
+            day_offset = (start.date() - self.start_date).days
+            if not 0 <= day_offset < len(self._load):
+                continue
+            opening = _aware(start.date(), time(OPENING_HOUR))
+            first = max(0, int((start - opening).total_seconds() // (SLOT_MINUTES * 60)))
+            for bucket in range(first, len(self.bucket_starts)):
+                bucket_start = opening + bucket * slot
+                if bucket_start >= end:
+                    break
+                if bucket_start + slot > start:
+                    self._load[day_offset][bucket][bay or None] += 1
+
+    def free_bays(self, day, bucket):
+        load = self._load[(day - self.start_date).days][bucket]
+        pinned = sum(1 for bay in self.bays if load[bay])
+        floating = sum(count for key, count in load.items() if key not in self.bays)
+        return max(0, len(self.bays) - pinned - floating)
+
+    def is_available(self, day, bucket, bay=None):
+        if bay is not None and bay in self.bays:
+            load = self._load[(day - self.start_date).days][bucket]
+            return not load[bay] and self.free_bays(day, bucket) > 0
+        return self.free_bays(day, bucket) > 0
+
+    def days(self):
+        for offset in range(len(self._load)):
+            yield self.start_date + timedelta(days=offset)
+
+    def available_slots(self, day):
+        return [
+            bucket_start.strftime(SLOT_LABEL_FORMAT)
+            for bucket, bucket_start in enumerate(self.bucket_starts)
+            if self.is_available(day, bucket)
+        ]
+
+
+def overlapping_bookings(time_slot, end_time, technician=None, bay=None, exclude_pk=None):
+    """
+    Live bookings whose window intersects [time_slot, end_time), scoped to one
+    technician and/or bay. The lower bound on time_slot is the earliest start
+    among bookings still running at time_slot (found on the end_time index),
+    so the scan stays on the composite (scope, time_slot, end_time) indexes
+    however much history the table holds, and a booking whose end_time runs
+    past its package duration is still seen.
+    """
+    live = Booking.objects.exclude(status='CANCELLED')
+    if technician is not None:
+        live = live.filter(technician=technician)
+    if bay is not None:
+        live = live.filter(bay_assignment=bay)
+    if exclude_pk is not None:
+        live = live.exclude(pk=exclude_pk)
+
+    # Same scope as the scan below, so a cancelled or unrelated long booking can't widen it.
+    running = live.filter(end_time__gt=time_slot, time_slot__lt=time_slot)
+    earliest = running.aggregate(earliest=Min('time_slot'))['earliest']
+    since = time_slot - timedelta(minutes=SLOT_MINUTES)
+    if earliest is not None:
+        since = min(since, earliest)
+
+    return live.filter(
+        time_slot__gte=since,
+        time_slot__lt=end_time,
+    ).filter(
+        Q(end_time__gt=time_slot) |
+        Q(end_time__isnull=True, time_slot__gt=time_slot - timedelta(minutes=SLOT_MINUTES))
+    )
+
+
+def bays_exhausted(time_slot, end_time, exclude_pk=None, bays=None):
+    """True if every service bay is taken at some instant of [time_slot, end_time)."""
+    bays = list(bays if bays is not None else SERVICE_BAYS)
+    windows = overlapping_bookings(time_slot, end_time, exclude_pk=exclude_pk).values_list('time_slot', 'end_time')
+
+    # Sweep the (few) overlapping windows to find peak concurrency.
+    events = []
+    for start, end in windows:
+        events.append((max(start, time_slot), 1))
+        events.append((min(end or start + timedelta(minutes=SLOT_MINUTES), end_time), -1))
+    events.sort(key=lambda e: (e[0], e[1]))
+
+    busy = peak = 0
+    for _, delta in events:
+        busy += delta
+        peak = max(peak, busy)
+    return peak >= len(bays)
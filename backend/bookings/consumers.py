@@ -1,10 +1,46 @@
+import asyncio
 import json
+import uuid
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .projections import live_queue_projection, parse_cursor, INACTIVE_STATUSES
+
+PROTOCOL_VERSION = 2
+COALESCE_SECONDS = getattr(settings, 'LIVE_QUEUE_COALESCE_SECONDS', 0.25)
+
 
 class QueueConsumer(AsyncWebsocketConsumer):
+    """
+    Live queue feed for Kanban boards and TV displays.
+
+    Legacy clients get one `queue_update` message per booking change. Clients
+    that connect with `?protocol=2` (or `?since=<seq>`) get the versioned feed:
+    a `queue_snapshot` on connect, then numbered `queue_delta` messages with
+    bursts on the same booking merged. Each delta carries `base_seq` and a
+    `cursor`; a client that spots a gap, or reconnects, sends
+    `{"type": "resume", "cursor": <last cursor>}` (or reconnects with
+    `?since=<cursor>`) and is replayed from the projection journal instead of
+    refetching over REST. A cursor from another worker gets a fresh snapshot.
+    """
+
     async def connect(self):
         self.group_name = 'live_queue'
 
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        since = params.get('since', [None])[0]
+        try:
+            self.protocol = int(params.get('protocol', [PROTOCOL_VERSION if since else 1])[0])
+        except ValueError:
+            self.protocol = 1
+
+        self.last_seq = 0
+        self._pending = {}
+        self._flush_task = None
+
         await self.channel_layer.group_add(
             self.group_name,
             self.channel_name
@@ -12,16 +48,112 @@ class QueueConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
+        if self.protocol >= PROTOCOL_VERSION:
+            await self.send_sync_state(since)
+
     async def disconnect(self, close_code):
+        if self._flush_task:
+            self._flush_task.cancel()
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
         )
 
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            message = json.loads(text_data or '{}')
+        except ValueError:
+            return
+
+        if message.get('type') == 'resume':
+            await self.send_sync_state(message.get('cursor'))
+        elif message.get('type') == 'snapshot':
+            await self.send_sync_state(None)
+
+    async def send_sync_state(self, since):
+        payload = await database_sync_to_async(self._sync_state)(since)
+        self.last_seq = payload['seq']
+        # Anything buffered so far is covered by the state we just sent.
+        self._pending = {}
+        await self.send(text_data=json.dumps(payload))
+
+    def _sync_state(self, since):
+        if since is not None:
+            try:
+                delta = live_queue_projection.changes_since(since)
+            except ValueError:
+                delta = None
+            if delta is not None:
+                seq, changed, removed = delta
+                return {
+                    'type': 'queue_delta',
+                    'version': PROTOCOL_VERSION,
+                    'base_seq': parse_cursor(since)[1],
+                    'seq': seq,
+                    'cursor': live_queue_projection.cursor(seq),
+                    'changed': changed,
+                    'removed': removed,
+                    'resumed': True,
+                }
+
+        seq, cards = live_queue_projection.snapshot()
+        return {
+            'type': 'queue_snapshot', 'version': PROTOCOL_VERSION, 'seq': seq,
+            'cursor': live_queue_projection.cursor(seq), 'cards': cards,
+        }
+
     async def queue_update(self, event):
-        booking_data = event['data']
+        await self._absorb(event.get('batch_id'), [event['data']])
+
+    async def queue_batch(self, event):
+        """All booking changes from one committed transaction, delivered as a single layer message."""
+        await self._absorb(event.get('batch_id'), event['cards'])
+
+    async def _absorb(self, batch_id, cards):
+        # The projection applies each batch once per process (the first consumer to
+        # see it, or publish_queue_changes in the writing process), so every socket
+        # gets the same sequence numbers as the snapshots and replays it hands out.
+        seqs = live_queue_projection.apply_batch(batch_id or uuid.uuid4().hex, cards)
+        for booking_data, seq in zip(cards, seqs):
+            await self._deliver(booking_data, seq)
+
+    async def _deliver(self, booking_data, seq):
+        if self.protocol < PROTOCOL_VERSION:
+            await self.send(text_data=json.dumps({
+                'type': 'queue_update',
+                'seq': seq,
+                'data': booking_data
+            }))
+            return
+
+        if seq <= self.last_seq:
+            return
+        self._pending[booking_data['id']] = (seq, booking_data)
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_after_window())
+
+    async def _flush_after_window(self):
+        await asyncio.sleep(COALESCE_SECONDS)
+        self._flush_task = None
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        changed, removed = [], []
+        for seq, card in pending.values():
+            if card.get('status') in INACTIVE_STATUSES or card.get('status') == 'DELETED':
+                removed.append(card['id'])
+            else:
+                changed.append(card)
 
+        base_seq = self.last_seq
+        self.last_seq = max(seq for seq, _ in pending.values())
         await self.send(text_data=json.dumps({
-            'type': 'queue_update',
-            'data': booking_data
+            'type': 'queue_delta',
+            'version': PROTOCOL_VERSION,
+            'base_seq': base_seq,
+            'seq': self.last_seq,
+            'cursor': live_queue_projection.cursor(self.last_seq),
+            'changed': changed,
+            'removed': removed,
         }))
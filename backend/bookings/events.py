@@ -0,0 +1,118 @@
+"""
+Booking domain events.
+
+A Booking save used to fan out to several post_save receivers (queue broadcast,
+loyalty points, email notifications). Each one lazily reloaded the vehicle,
+customer, user, package and technician, and all of them ran inside the request
+before the transaction committed.
+
+Now a single receiver records what changed and queues it with
+transaction.on_commit. When the transaction commits, the bookings touched are
+loaded once, with their related rows joined, and the whole batch goes to every
+subscriber. Several saves of the same booking in one transaction (as checkout
+does) collapse into one event. A save outside any transaction (autocommit) is
+dispatched on its own straight away.
+"""
+import threading
+
+from django.db import transaction
+
+_subscribers = []
+_local = threading.local()
+
+
+class BookingEvent:
+    """What happened to one booking during a transaction."""
+
+    __slots__ = ('booking_id', 'created', 'deleted', 'old_status', 'status', 'booking')
+
+    def __init__(self, booking_id, created, deleted, old_status, status):
+        self.booking_id = booking_id
+        self.created = created
+        self.deleted = deleted
+        self.old_status = old_status
+        self.status = status
+        self.booking = None  # Booking with related rows joined, set on flush
+
+    def entered(self, status):
+        """True if the booking moved into `status` during this transaction."""
+        return not self.deleted and self.status == status and self.old_status != status
+
+    def merge(self, later):
+        self.created = self.created or later.created
+        self.deleted = later.deleted
+        self.status = later.status
+
+
+def booking_event_subscriber(func):
+    """Register `func(events)` to receive every committed batch of BookingEvents."""
+    _subscribers.append(func)
+    return func
+
+
+def record(instance, created=False, deleted=False):
+    """Queue an event for `instance`; delivered to subscribers when the current transaction commits."""
+    event = BookingEvent(
+        booking_id=instance.pk,
+        created=created,
+        deleted=deleted,
+        old_status=None if created else getattr(instance, '_old_status', None),
+        status=instance.status,
+    )
+
+    if not transaction.get_connection().in_atomic_block:
+        # Autocommit: the write is already committed, and on_commit would run the
+        # batch right away, before the event is added to it.
+        dispatch([event])
+        return
+
+    batch = getattr(_local, 'batch', None)
+    if batch is None or not batch.is_scheduled():
+        # First event of this transaction (or the previous batch was rolled back).
+        batch = _local.batch = _Batch()
+        transaction.on_commit(batch)
+    batch.add(event)
+
+
+class _Batch:
+    def __init__(self):
+        self.events = {}
+
+    def add(self, event):
+        if event.booking_id in self.events:
+            self.events[event.booking_id].merge(event)
+        else:
+            self.events[event.booking_id] = event
+
+    def is_scheduled(self):
+        connection = transaction.get_connection()
+        return connection.in_atomic_block and any(entry[1] is self for entry in connection.run_on_commit)
+
+    def __call__(self):
+        if getattr(_local, 'batch', None) is self:
+            _local.batch = None
+        dispatch(list(self.events.values()))
+
+
+def dispatch(events):
+    """Load the bookings behind `events` in one query and hand the batch to every subscriber."""
+    from .models import Booking
+    bookings = Booking.objects.select_related(
+        'vehicle', 'customer__user', 'service_package', 'technician'
+    ).in_bulk([event.booking_id for event in events if not event.deleted])
+
+    ready = []
+    for event in events:
+        if not event.deleted:
+            event.booking = bookings.get(event.booking_id)
+            if event.booking is None:
+                continue
+        ready.append(event)
+    if not ready:
+        return
+
+    for subscriber in _subscribers:
+        try:
+            subscriber(ready)
+        except Exception as e:
+            print(f"[Event Error] {subscriber.__module__}.{subscriber.__name__} failed: {e}")
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0011_alter_booking_vehicle'),
+        ('customers', '0005_customervehicle'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['time_slot', 'end_time'], name='booking_time_window_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0012_booking_time_window_idx'),
+        ('customers', '0005_customervehicle'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['technician', 'time_slot', 'end_time'], name='booking_tech_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['bay_assignment', 'time_slot', 'end_time'], name='booking_bay_window_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:31
+
+from django.conf import settings
+from django.db import migrations, models
+
+STATUS_CODES = [
+    ('PENDING', 'Pending'),
+    ('CONFIRMED', 'Confirmed'),
+    ('WAITING', 'Waiting'),
+    ('IN_BAY_1', 'In Bay 1'),
+    ('IN_BAY_2', 'In Bay 2'),
+    ('DETAILING', 'Detailing'),
+    ('READY', 'Ready for Pickup'),
+    ('IN_PROGRESS', 'In Progress'),
+    ('COMPLETED', 'Completed'),
+    ('CANCELLED', 'Cancelled'),
+]
+LEGACY_COMPLETED_STATUSES = ('CHECKOUT', 'DELIVERED', 'PICK UP', 'PICKUP')
+
+
+def normalize_statuses(apps, schema_editor):
+    """Rewrite every non-canonical status spelling in one UPDATE per distinct value."""
+    Booking = apps.get_model('bookings', 'Booking')
+    canonical = {code for code, _ in STATUS_CODES}
+    for value in Booking.objects.exclude(status__in=canonical).values_list('status', flat=True).distinct():
+        key = (value or '').strip().upper()
+        target = 'COMPLETED' if key in LEGACY_COMPLETED_STATUSES else None
+        for code, label in STATUS_CODES:
+            if key in (code, label.upper(), code.replace('_', ' ')):
+                target = code
+        if target:
+            Booking.objects.filter(status=value).update(status=target)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0013_booking_scope_window_idx'),
+        ('customers', '0005_customervehicle'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_statuses, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='booking_status_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:18
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0014_normalize_booking_status'),
+        # Recipes are copied into finance.RecipeLine first.
+        ('finance', '0014_recipe_line'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='servicepackage',
+            name='chemical_recipe',
+        ),
+    ]
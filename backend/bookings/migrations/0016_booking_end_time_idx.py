@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0015_remove_servicepackage_chemical_recipe'),
+        ('customers', '0006_vehicle_search_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['end_time'], name='booking_end_time_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0016_booking_end_time_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from customers.models import Customer, CustomerVehicle
 from django.contrib.auth.models import User
+from core.models import ChangeTrackingMixin
 
 class ServicePackage(models.Model):
     name = models.CharField(max_length=100)
@@ -8,14 +9,35 @@ class ServicePackage(models.Model):
     description = models.TextField()
     duration_minutes = models.IntegerField(default=60)
     
-    # Financial Links
-    chemical_recipe = models.JSONField(default=dict, help_text="Dictionary of chemical names and amounts (e.g. {'soap': 0.5})")
+    # Financial Links (chemicals used per wash: finance.RecipeLine)
     commission_rule = models.ForeignKey('finance.CommissionRule', on_delete=models.SET_NULL, null=True, blank=True)
 
     def __str__(self):
         return self.name
 
-class Booking(models.Model):
+    @property
+    def chemical_recipe(self):
+        """{chemical name: amount per wash}; prefetch 'recipe_lines__chemical' when listing packages."""
+        return {line.chemical.name: line.amount for line in self.recipe_lines.all()}
+
+# Spellings older clients and imports used for finished jobs.
+LEGACY_COMPLETED_STATUSES = ('CHECKOUT', 'DELIVERED', 'PICK UP', 'PICKUP')
+
+
+def normalize_status(value):
+    """Map any case/label variant of a booking status to its canonical code (e.g. 'Pick Up' -> 'COMPLETED')."""
+    if not value:
+        return value
+    key = value.strip().upper()
+    if key in LEGACY_COMPLETED_STATUSES:
+        return 'COMPLETED'
+    for code, label in Booking.STATUS_CHOICES:
+        if key in (code, label.upper(), code.replace('_', ' ')):
+            return code
+    return value
+
+
+class Booking(ChangeTrackingMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('CONFIRMED', 'Confirmed'),
@@ -36,6 +58,8 @@ class Booking(models.Model):
     time_slot = models.DateTimeField()
     end_time = models.DateTimeField(null=True, blank=True)
     start_time = models.DateTimeField(null=True, blank=True)
+    # When the wash was actually finished (READY/COMPLETED); end_time stays the scheduled end.
+    finished_at = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='WAITING')
     bay_assignment = models.CharField(max_length=50, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -46,8 +70,25 @@ class Booking(models.Model):
     latitude = models.FloatField(default=0.0)
     longitude = models.FloatField(default=0.0)
 
+    # Values as loaded, so saves can detect transitions without another SELECT.
+    tracked_fields = ('status', 'time_slot', 'service_package_id')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['time_slot', 'end_time'], name='booking_time_window_idx'),
+            models.Index(fields=['technician', 'time_slot', 'end_time'], name='booking_tech_window_idx'),
+            models.Index(fields=['bay_assignment', 'time_slot', 'end_time'], name='booking_bay_window_idx'),
+            models.Index(fields=['end_time'], name='booking_end_time_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='booking_status_feed_idx'),
+        ]
+
     def save(self, *args, **kwargs):
-        if self.service_package and self.time_slot:
+        self.status = normalize_status(self.status)
+        # Only touch the package (a lazy load) when the window could have moved.
+        schedule_changed = (
+            self.end_time is None or self.has_changed('time_slot') or self.has_changed('service_package_id')
+        )
+        if schedule_changed and self.service_package_id and self.time_slot:
             from datetime import timedelta
             self.end_time = self.time_slot + timedelta(minutes=self.service_package.duration_minutes)
         super().save(*args, **kwargs)
@@ -0,0 +1,196 @@
+"""
+Materialized projection of the live queue (Kanban board & TV displays).
+
+Instead of re-querying and re-serializing every active booking on each poll,
+the projection keeps the queue cards in memory and is updated by Booking writes
+(see bookings.signals). Every change is stamped with a monotonic sequence number
+and recorded in a bounded journal, so clients can ask for just the cards that
+changed since the last sequence they saw.
+
+The projection is per-process. Writes made by another gunicorn worker are picked
+up by a periodic refresh, which diffs the database against the cached cards and
+journals the differences. That keeps every cursor valid across refreshes.
+
+Sequence numbers only mean something to the projection that issued them, so
+clients get an opaque cursor, "<epoch>:<seq>", where the epoch is random per
+projection lifetime. A cursor from another worker (or from before a restart)
+has a different epoch and is answered with a fresh snapshot instead of an
+unrelated slice of this worker's journal.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+INACTIVE_STATUSES = ('COMPLETED', 'CANCELLED')
+
+JOURNAL_SIZE = getattr(settings, 'LIVE_QUEUE_JOURNAL_SIZE', 1024)
+MAX_AGE_SECONDS = getattr(settings, 'LIVE_QUEUE_MAX_AGE_SECONDS', 30)
+# Broadcast batches remembered so each is applied once per process.
+APPLIED_BATCHES = 1024
+
+
+def queue_card(b):
+    """The Kanban card for one booking (same shape the live-queue endpoint has always returned)."""
+    return {
+        'id': b.id,
+        'status': b.status,
+        'bay_assignment': b.bay_assignment,
+        'plate_number': b.vehicle.plate_number if b.vehicle else '???',
+        'vehicle_model': b.vehicle.model if b.vehicle else 'Unknown',
+        'service_name': b.service_package.name if b.service_package else 'Walk-In',
+        'customer_name': str(b.customer) if b.customer else 'Walk-In',
+        'customer_id': b.customer.id if b.customer else None,
+        'price': float(b.service_package.price) if b.service_package else 0.0,
+        'technician_name': b.technician.get_full_name() or b.technician.username if b.technician else None,
+        'technician_id': b.technician.id if b.technician else None,
+        'created_at': b.created_at.isoformat() if b.created_at else None,
+        'time_slot': b.time_slot.isoformat() if b.time_slot else None,
+    }
+
+
+def _card_order(card):
+    return card['time_slot'] or ''
+
+
+def parse_cursor(cursor):
+    """(epoch, seq) from a cursor. A bare sequence number (older clients) has no epoch. Raises ValueError."""
+    epoch, sep, seq = str(cursor).rpartition(':')
+    return (epoch if sep else None), int(seq)
+
+
+class LiveQueueProjection:
+    def __init__(self, journal_size=JOURNAL_SIZE, max_age=MAX_AGE_SECONDS):
+        self._lock = threading.RLock()
+        self._epoch = uuid.uuid4().hex[:12]
+        self._cards = None  # booking id -> card, loaded lazily
+        self._loaded_at = 0.0
+        self._seq = 0
+        self._journal = deque(maxlen=journal_size)  # (seq, booking_id, card or None)
+        self._batches = OrderedDict()  # batch id -> seqs its cards were applied at
+        self.max_age = max_age
+
+    # --- Reads -------------------------------------------------------------
+
+    def snapshot(self):
+        """(seq, cards ordered by time_slot). No queries while the projection is fresh."""
+        with self._lock:
+            self._ensure_fresh()
+            return self._seq, sorted(self._cards.values(), key=_card_order)
+
+    def changes_since(self, cursor):
+        """
+        (seq, changed_cards, removed_ids) for everything after `cursor`, with
+        repeated updates of the same booking merged. Returns None when the cursor
+        cannot be served from the journal (too old, or issued by another process
+        or projection lifetime) and the client should take a fresh snapshot.
+        Raises ValueError for a malformed cursor.
+        """
+        epoch, since = parse_cursor(cursor)
+        with self._lock:
+            self._ensure_fresh()
+            if epoch != self._epoch:
+                return None
+            if since == self._seq:
+                return self._seq, [], []
+            if since > self._seq or not self._journal or since < self._journal[0][0] - 1:
+                return None
+
+            merged = {}
+            for seq, booking_id, card in self._journal:
+                if seq > since:
+                    merged[booking_id] = card
+            changed = sorted((c for c in merged.values() if c is not None), key=_card_order)
+            removed = [booking_id for booking_id, card in merged.items() if card is None]
+            return self._seq, changed, removed
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def cursor(self, seq):
+        """The client-facing cursor for `seq` of this projection."""
+        return f'{self._epoch}:{seq}'
+
+    # --- Writes ------------------------------------------------------------
+
+    def apply(self, card):
+        """Upsert (or drop, for finished bookings) one card. Idempotent; returns the current sequence number."""
+        with self._lock:
+            if card['status'] in INACTIVE_STATUSES:
+                return self._record(card['id'], None)
+            if self._cards is not None and self._cards.get(card['id']) == card:
+                return self._seq
+            return self._record(card['id'], card)
+
+    def remove(self, booking_id):
+        with self._lock:
+            return self._record(booking_id, None)
+
+    def apply_batch(self, batch_id, cards):
+        """
+        Apply a broadcast batch of cards ({'id', 'status': 'DELETED'} drops a
+        booking) once per process. Every consumer in the process receives the
+        same layer message; the first applies it and the rest get the same
+        sequence numbers back, one per card.
+        """
+        with self._lock:
+            if batch_id not in self._batches:
+                self._batches[batch_id] = [
+                    self.remove(card['id']) if card.get('status') == 'DELETED' else self.apply(card)
+                    for card in cards
+                ]
+                if len(self._batches) > APPLIED_BATCHES:
+                    self._batches.popitem(last=False)
+            return self._batches[batch_id]
+
+    def refresh(self):
+        """Reload active bookings from the database and journal whatever differs."""
+        cards = {card['id']: card for card in self._load()}
+        with self._lock:
+            if self._cards is not None:
+                for booking_id in list(self._cards):
+                    if booking_id not in cards:
+                        self._record(booking_id, None)
+                for booking_id, card in cards.items():
+                    if self._cards.get(booking_id) != card:
+                        self._record(booking_id, card)
+            self._cards = cards
+            self._loaded_at = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self._epoch = uuid.uuid4().hex[:12]
+            self._cards = None
+            self._loaded_at = 0.0
+            self._journal.clear()
+            self._batches.clear()
+
+    # --- Internals ---------------------------------------------------------
+
+    def _record(self, booking_id, card):
+        if self._cards is not None:
+            if card is None:
+                if self._cards.pop(booking_id, None) is None:
+                    return self._seq
+            else:
+                self._cards[booking_id] = card
+        self._seq += 1
+        self._journal.append((self._seq, booking_id, card))
+        return self._seq
+
+    def _ensure_fresh(self):
+        if self._cards is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.refresh()
+
+    def _load(self):
+        from .models import Booking
+        bookings = Booking.objects.exclude(
+            status__in=INACTIVE_STATUSES
+        ).select_related('vehicle', 'customer__user', 'service_package', 'technician')
+        return [queue_card(b) for b in bookings]
+
+
+live_queue_projection = LiveQueueProjection()
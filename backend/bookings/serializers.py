@@ -2,10 +2,46 @@ from rest_framework import serializers
 from .models import Booking, ServicePackage
 
 class ServicePackageSerializer(serializers.ModelSerializer):
+    # {chemical name: amount per wash}, stored as finance.RecipeLine rows
+    chemical_recipe = serializers.DictField(
+        child=serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, coerce_to_string=False),
+        required=False,
+    )
+
     class Meta:
         model = ServicePackage
         fields = '__all__'
 
+    def validate_chemical_recipe(self, recipe):
+        from finance.models import ChemicalInventory
+        chemicals = {}
+        for chemical in ChemicalInventory.objects.order_by('id'):
+            chemicals.setdefault(chemical.name.strip().lower(), chemical)
+        unknown = [name for name in recipe if name.strip().lower() not in chemicals]
+        if unknown:
+            raise serializers.ValidationError(f"Unknown chemicals: {', '.join(unknown)}")
+        return {chemicals[name.strip().lower()]: amount for name, amount in recipe.items()}
+
+    def create(self, validated_data):
+        recipe = validated_data.pop('chemical_recipe', None)
+        package = super().create(validated_data)
+        if recipe is not None:
+            self._save_recipe(package, recipe)
+        return package
+
+    def update(self, instance, validated_data):
+        recipe = validated_data.pop('chemical_recipe', None)
+        package = super().update(instance, validated_data)
+        if recipe is not None:
+            self._save_recipe(package, recipe)
+        return package
+
+    def _save_recipe(self, package, recipe):
+        from finance.logic import set_recipe
+        set_recipe(package, recipe)
+        # Drop any prefetched lines so the response shows the new recipe
+        getattr(package, '_prefetched_objects_cache', {}).pop('recipe_lines', None)
+
 class BookingSerializer(serializers.ModelSerializer):
     service_package_details = serializers.SerializerMethodField()
     technician_name = serializers.ReadOnlyField(source='technician.username')
@@ -25,15 +61,22 @@ class BookingSerializer(serializers.ModelSerializer):
     class Meta:
         model = Booking
         fields = ['id', 'customer', 'customer_name', 'vehicle', 'vehicle_info', 'vehicle_plate', 'technician', 'technician_name', 
-                  'service_package', 'service_package_name', 'service_package_details', 'time_slot', 'end_time', 'status',
+                  'service_package', 'service_package_name', 'service_package_details', 'time_slot', 'end_time', 'finished_at', 'status', 'bay_assignment',
                   'address', 'latitude', 'longitude', 'transaction_id', 'payment_method', 'split_cash', 'payment_status',
                   'created_at', 'invoice_status', 'invoice_amount']
-        read_only_fields = ['customer', 'end_time', 'status', 'created_at']
+        read_only_fields = ['customer', 'end_time', 'finished_at', 'status', 'created_at']
         extra_kwargs = {
             'address': {'required': False, 'allow_blank': True},
             'latitude': {'required': False},
             'longitude': {'required': False},
             'technician': {'required': False, 'allow_null': True},
+            'bay_assignment': {'required': False, 'allow_null': True},
+        }
+        # Relations read by the SerializerMethodFields (see core.query_planner).
+        related_hints = {
+            'invoice_status': ['invoice'],
+            'invoice_amount': ['invoice'],
+            'service_package_details': ['service_package.recipe_lines.chemical'],
         }
 
     def get_invoice_status(self, obj):
@@ -56,7 +99,7 @@ class BookingSerializer(serializers.ModelSerializer):
                 'name': obj.service_package.name,
                 'description': obj.service_package.description,
                 'duration_minutes': obj.service_package.duration_minutes,
-                'chemical_recipe': obj.service_package.chemical_recipe,
+                'chemical_recipe': {name: float(amount) for name, amount in obj.service_package.chemical_recipe.items()},
             }
         return None
 
@@ -81,17 +124,20 @@ class BookingSerializer(serializers.ModelSerializer):
         duration = service_package.duration_minutes
         end_time = time_slot + timedelta(minutes=duration)
 
-        # Check for overlaps
-        # Overlap if: (StartA < EndB) and (EndA > StartB)
-        overlaps = Booking.objects.filter(
-            time_slot__lt=end_time,
-            end_time__gt=time_slot
-        ).exclude(status='CANCELLED')
-        
-        if self.instance:
-            overlaps = overlaps.exclude(pk=self.instance.pk)
+        # Overlap if: (StartA < EndB) and (EndA > StartB), scoped to what is actually being reserved:
+        # the technician's time, and either the requested bay or any free bay in the shop.
+        from .availability import overlapping_bookings, bays_exhausted
+        exclude_pk = self.instance.pk if self.instance else None
+        technician = data.get('technician', self.instance.technician if self.instance else None)
+        bay = data.get('bay_assignment', self.instance.bay_assignment if self.instance else None)
+
+        if technician and overlapping_bookings(time_slot, end_time, technician=technician, exclude_pk=exclude_pk).exists():
+            raise serializers.ValidationError("This technician is already booked for this time slot.")
 
-        if overlaps.exists():
+        # A pinned bay must be free, and floating bookings must still leave the shop a bay for it.
+        if bay and overlapping_bookings(time_slot, end_time, bay=bay, exclude_pk=exclude_pk).exists():
             raise serializers.ValidationError("This time slot is already booked.")
-            
+        if bays_exhausted(time_slot, end_time, exclude_pk=exclude_pk):
+            raise serializers.ValidationError("This time slot is already booked.")
+
         return data
@@ -1,16 +1,11 @@
-from django.db.models.signals import pre_save, pre_delete, post_save
+from django.db.models.signals import pre_save, pre_delete, post_save, post_delete
 from django.dispatch import receiver
-from django.core.exceptions import ValidationError
 from django.utils import timezone
 from .models import Booking
-# Need to securely import DailyRegisterAudit for the lock check
-from finance.models import DailyRegisterAudit
+from .projections import live_queue_projection, queue_card
+from finance.register_lock import check_register_lock
 from notifications.services import send_customer_notification
 
-def check_register_lock(target_date):
-    if DailyRegisterAudit.objects.filter(date=target_date, is_locked=True).exists():
-        raise ValidationError("Security Alert: The financial register for this date is closed. This record is permanently locked and cannot be modified or deleted.")
-
 @receiver([pre_save, pre_delete], sender=Booking)
 def freeze_booking(sender, instance, **kwargs):
     target_date = (instance.created_at or timezone.now()).date()
@@ -20,29 +15,41 @@ def freeze_booking(sender, instance, **kwargs):
 @receiver(pre_save, sender=Booking)
 def cache_old_booking_status(sender, instance, **kwargs):
     """Cache the old status before save so post_save can detect actual transitions."""
-    if instance.pk:
-        try:
-            old = Booking.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
-            instance._old_status = old
-        except Exception:
-            instance._old_status = None
-    else:
+    if not instance.pk:
         instance._old_status = None
+    elif instance.is_tracked('status'):
+        # Loaded from the database: the tracker already knows the previous value.
+        instance._old_status = instance.loaded_value('status')
+    else:
+        # Built by hand or loaded with status deferred.
+        instance._old_status = Booking.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
 
 
+import uuid
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
+from . import events
+from .events import booking_event_subscriber
+
 
 @receiver(post_save, sender=Booking)
-def notify_customer_on_ready(sender, instance, created, **kwargs):
-    """Fires WhatsApp notification ONLY when status transitions to READY (not on every save)."""
-    if created:
-        return
+def record_booking_saved(sender, instance, created, **kwargs):
+    events.record(instance, created=created)
+
+
+@receiver(post_delete, sender=Booking)
+def record_booking_deleted(sender, instance, **kwargs):
+    events.record(instance, deleted=True)
 
-    old_status = getattr(instance, '_old_status', None)
 
-    # Only trigger when the status *actually changed* to READY
-    if instance.status == 'READY' and old_status != 'READY':
+@booking_event_subscriber
+def notify_customer_on_ready(booking_events):
+    """Fires WhatsApp notification ONLY when status transitions to READY (not on every save)."""
+    for event in booking_events:
+        if event.created or not event.entered('READY'):
+            continue
+
+        instance = event.booking
         try:
             plate = instance.vehicle.plate_number if instance.vehicle else 'your car'
             phone = instance.customer.phone_number if instance.customer else None
@@ -60,28 +67,27 @@ def notify_customer_on_ready(sender, instance, created, **kwargs):
         except Exception as e:
             print(f"[Signal Error] Could not send ready notification: {e}")
 
-    # Broadcast update to Kanban Board
+
+@booking_event_subscriber
+def publish_queue_changes(booking_events):
+    """Apply the batch to the live-queue projection, then push it to connected boards in one message."""
+    cards = []
+    for event in booking_events:
+        if event.deleted:
+            cards.append({"id": event.booking_id, "status": "DELETED"})
+        else:
+            cards.append(queue_card(event.booking))
+
+    if cards:
+        # Consumers in this process find the batch id already applied; other processes apply it once each.
+        batch_id = uuid.uuid4().hex
+        seqs = live_queue_projection.apply_batch(batch_id, cards)
+        _broadcast_queue_event({"type": "queue_batch", "batch_id": batch_id, "seq": seqs[-1], "cards": cards})
+
+
+def _broadcast_queue_event(event):
     try:
         channel_layer = get_channel_layer()
-        booking_data = {
-            "id": instance.id,
-            "status": instance.status,
-            "plate_number": instance.vehicle.plate_number if instance.vehicle else "",
-            "vehicle_model": instance.vehicle.model if instance.vehicle else "",
-            "service_name": instance.service_package.name if instance.service_package else "",
-            "customer_name": f"{instance.customer.first_name} {instance.customer.last_name}" if instance.customer else "",
-            "technician_name": f"{instance.technician.first_name} {instance.technician.last_name}" if instance.technician else None,
-            "created_at": instance.created_at.isoformat() if getattr(instance, 'created_at', None) else None,
-            "time_slot": instance.time_slot.isoformat() if getattr(instance, 'time_slot', None) else None,
-            "bay_assignment": instance.bay_assignment
-        }
-        async_to_sync(channel_layer.group_send)(
-            "live_queue",
-            {
-                "type": "queue_update",
-                "data": booking_data
-            }
-        )
+        async_to_sync(channel_layer.group_send)("live_queue", event)
     except Exception as e:
         print(f"[Signal Error] Could not broadcast queue update: {e}")
-
@@ -1,39 +1,50 @@
 from django.test import TestCase
 from django.utils import timezone
 from .models import Booking, ServicePackage
-from customers.models import Customer
-from fleet.models import Vehicle
+from customers.models import Customer, CustomerVehicle
 from django.contrib.auth.models import User
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from .availability import overlapping_bookings
 from .serializers import BookingSerializer
 
 class BookingValidationTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='password')
         self.customer = Customer.objects.create(user=self.user)
-        self.vehicle = Vehicle.objects.create(owner=self.customer, model='Test Car', plate_number='TEST-123')
+        self.vehicle = CustomerVehicle.objects.create(customer=self.user, make='Test', model='Car', plate_number='TEST-123')
         self.package = ServicePackage.objects.create(name='Basic Wash', price=10.0, duration_minutes=60, description='Basic')
+        self.technician = User.objects.create_user(username='tech', password='password')
 
-    def test_prevent_double_booking(self):
-        now = timezone.now()
-        
-        # Create first booking
-        Booking.objects.create(
+    def book(self, time_slot, **kwargs):
+        return Booking.objects.create(
             customer=self.customer,
             vehicle=self.vehicle,
             service_package=self.package,
-            time_slot=now
+            time_slot=time_slot,
+            **kwargs
         )
-        
-        # Try to create overlapping booking (same time)
-        from .serializers import BookingSerializer
+
+    def payload(self, time_slot, **kwargs):
         data = {
-            'customer': self.customer.id,
             'vehicle': self.vehicle.id,
             'service_package': self.package.id,
-            'time_slot': now
+            'time_slot': time_slot,
         }
-        serializer = BookingSerializer(data=data)
+        data.update(kwargs)
+        return data
+
+    def test_prevent_double_booking(self):
+        now = timezone.now()
+        
+        # Fill every service bay
+        self.book(now, bay_assignment='Bay 1')
+        self.book(now, bay_assignment='Bay 2')
+        
+        # Try to create overlapping booking (same time)
+        serializer = BookingSerializer(data=self.payload(now))
         self.assertFalse(serializer.is_valid())
         self.assertIn('This time slot is already booked.', str(serializer.errors))
 
@@ -41,20 +52,142 @@ class BookingValidationTest(TestCase):
         now = timezone.now()
         
         # Create first booking
-        Booking.objects.create(
-            customer=self.customer,
-            vehicle=self.vehicle,
-            service_package=self.package,
-            time_slot=now
-        )
+        self.book(now, bay_assignment='Bay 1')
+        self.book(now, bay_assignment='Bay 2')
         
         # Create second booking after first one ends
         later = now + timedelta(minutes=61)
-        data = {
-            'customer': self.customer.id,
-            'vehicle': self.vehicle.id,
-            'service_package': self.package.id,
-            'time_slot': later
-        }
-        serializer = BookingSerializer(data=data)
-        self.assertTrue(serializer.is_valid())
+        serializer = BookingSerializer(data=self.payload(later))
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+
+    def test_overlap_is_scoped_to_requested_bay(self):
+        now = timezone.now()
+        self.book(now, bay_assignment='Bay 1')
+
+        self.assertFalse(BookingSerializer(data=self.payload(now, bay_assignment='Bay 1')).is_valid())
+        self.assertTrue(BookingSerializer(data=self.payload(now, bay_assignment='Bay 2')).is_valid())
+
+    def test_overlap_lookback_is_scoped(self):
+        now = timezone.now().replace(microsecond=0)
+        for status, bay in (('CANCELLED', 'Bay 1'), ('WAITING', 'Bay 2')):
+            stale = self.book(now - timedelta(days=30), bay_assignment=bay, status=status)
+            Booking.objects.filter(pk=stale.pk).update(end_time=now + timedelta(hours=1))
+
+        # Neither the cancelled booking nor Bay 2's pulls Bay 1's scan back a month.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(overlapping_bookings(now, now + timedelta(hours=1), bay='Bay 1').exists())
+        self.assertNotIn((now - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S'), queries[-1]['sql'])
+        self.assertTrue(overlapping_bookings(now, now + timedelta(hours=1), bay='Bay 2').exists())
+
+    def test_overlap_is_scoped_to_technician(self):
+        now = timezone.now()
+        self.book(now, technician=self.technician, bay_assignment='Bay 1')
+
+        serializer = BookingSerializer(data=self.payload(now + timedelta(minutes=30), technician=self.technician.id))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('technician is already booked', str(serializer.errors))
+
+        self.assertTrue(BookingSerializer(data=self.payload(now + timedelta(minutes=30))).is_valid())
+
+    def test_pinned_bay_respects_floating_bookings(self):
+        now = timezone.now()
+        self.book(now)
+        self.book(now)
+
+        serializer = BookingSerializer(data=self.payload(now, bay_assignment='Bay 1'))
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('This time slot is already booked.', str(serializer.errors))
+
+    def test_overlap_sees_windows_longer_than_any_package(self):
+        now = timezone.now()
+        long_running = self.book(now - timedelta(hours=5), bay_assignment='Bay 1')
+        Booking.objects.filter(pk=long_running.pk).update(end_time=now + timedelta(hours=1))
+
+        self.assertFalse(BookingSerializer(data=self.payload(now, bay_assignment='Bay 1')).is_valid())
+        self.assertTrue(BookingSerializer(data=self.payload(now, bay_assignment='Bay 2')).is_valid())
+
+
+class AvailableSlotsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='slotuser', password='password')
+        self.customer = Customer.objects.create(user=self.user)
+        self.vehicle = CustomerVehicle.objects.create(customer=self.user, make='Test', model='Car', plate_number='SLOT-1')
+        self.detail = ServicePackage.objects.create(name='Detail', price=100.0, duration_minutes=120, description='Detail')
+        self.wash = ServicePackage.objects.create(name='Wash', price=10.0, duration_minutes=60, description='Wash')
+        self.day = timezone.localdate() + timedelta(days=7)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def book(self, package, hour, bay=None):
+        slot = timezone.make_aware(datetime.combine(self.day, time(hour)))
+        return Booking.objects.create(customer=self.customer, vehicle=self.vehicle, service_package=package,
+                                      time_slot=slot, bay_assignment=bay)
+
+    def test_slot_stays_open_while_a_bay_is_free(self):
+        self.book(self.detail, 10, bay='Bay 1')
+
+        response = self.client.get('/api/bookings/available_slots/', {'date': self.day.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('10:00 AM', response.data['slots'])
+
+        self.book(self.wash, 10)
+        response = self.client.get('/api/bookings/available_slots/', {'date': self.day.isoformat()})
+        self.assertNotIn('10:00 AM', response.data['slots'])
+        # The detail still holds Bay 1 at 11:00, but Bay 2 is free again.
+        self.assertIn('11:00 AM', response.data['slots'])
+
+    def test_range_query_returns_every_day(self):
+        self.book(self.detail, 9, bay='Bay 1')
+        self.book(self.detail, 9, bay='Bay 2')
+
+        response = self.client.get('/api/bookings/available_slots/', {
+            'start_date': self.day.isoformat(),
+            'end_date': (self.day + timedelta(days=6)).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['days']), 7)
+        first = response.data['days'][0]
+        self.assertNotIn('09:00 AM', first['slots'])
+        self.assertNotIn('10:00 AM', first['slots'])
+        self.assertIn('11:00 AM', first['slots'])
+        self.assertEqual(len(response.data['days'][1]['slots']), 9)
+
+
+class CompletedFeedTest(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='manager', password='password', is_staff=True)
+        self.customer = Customer.objects.create(user=User.objects.create_user(username='cust', password='pwd'))
+        self.vehicle = CustomerVehicle.objects.create(customer=self.customer.user, make='Test', model='Car', plate_number='KL-9')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def book(self, status, created_at):
+        booking = Booking.objects.create(customer=self.customer, vehicle=self.vehicle, time_slot=created_at, status=status)
+        Booking.objects.filter(pk=booking.pk).update(created_at=created_at)
+        return booking
+
+    def test_status_variants_are_normalized(self):
+        self.assertEqual(self.book('Pick Up', timezone.now()).status, 'COMPLETED')
+        self.assertEqual(self.book('in bay 1', timezone.now()).status, 'IN_BAY_1')
+        self.assertEqual(self.book('Ready for Pickup', timezone.now()).status, 'READY')
+
+    def test_keyset_pages_and_date_filter(self):
+        start = timezone.now() - timedelta(days=10)
+        completed = [self.book('COMPLETED', start + timedelta(days=n)) for n in range(5)]
+        # Same created_at: the id breaks the tie so nothing is skipped or repeated.
+        completed.append(self.book('COMPLETED', start + timedelta(days=4)))
+        self.book('WAITING', start)
+
+        seen = []
+        url = '/api/bookings/completed/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [row['id'] for row in response.data['results']]
+            url = response.data['next']
+        expected = sorted(completed, key=lambda b: (Booking.objects.get(pk=b.pk).created_at, b.pk), reverse=True)
+        self.assertEqual(seen, [b.pk for b in expected])
+
+        day = (start + timedelta(days=1)).date().isoformat()
+        response = self.client.get('/api/bookings/completed/', {'start_date': day, 'end_date': day})
+        self.assertEqual([row['id'] for row in response.data['results']], [completed[1].pk])
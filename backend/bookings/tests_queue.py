@@ -0,0 +1,250 @@
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from .models import Booking, ServicePackage
+from .projections import live_queue_projection
+from customers.models import Customer, CustomerVehicle
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from .consumers import QueueConsumer
+from unittest import mock
+from django.db import transaction
+from django.test import TransactionTestCase
+from .events import booking_event_subscriber, _subscribers
+
+
+class QueueTestCase(TestCase):
+    def setUp(self):
+        live_queue_projection.reset()
+        self.user = User.objects.create_user(username='manager', password='password', is_staff=True)
+        self.package = ServicePackage.objects.create(name='Basic Wash', price=10.0, duration_minutes=60, description='Basic')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        live_queue_projection.reset()
+
+    def make_booking(self, n, status='WAITING', commit=True):
+        owner = User.objects.create_user(username=f'cust{n}', password='pwd')
+        customer = Customer.objects.create(user=owner)
+        vehicle = CustomerVehicle.objects.create(customer=owner, make='Test', model='Car', plate_number=f'Q-{n}')
+        if not commit:
+            return Booking.objects.create(customer=customer, vehicle=vehicle, service_package=self.package,
+                                          time_slot=timezone.now(), status=status)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Booking.objects.create(customer=customer, vehicle=vehicle, service_package=self.package,
+                                          time_slot=timezone.now(), status=status)
+
+
+class LiveQueueProjectionTest(QueueTestCase):
+    def test_snapshot_is_served_from_memory(self):
+        for n in range(5):
+            self.make_booking(n)
+
+        # Initial load is a single joined query, regardless of queue length.
+        with self.assertNumQueries(1):
+            live_queue_projection.snapshot()
+
+        response = self.client.get('/api/bookings/live-queue/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(response.data[0]['customer_name'], 'cust0')
+
+        with self.assertNumQueries(0):
+            seq, cards = live_queue_projection.snapshot()
+        self.assertEqual(len(cards), 5)
+
+    def test_since_returns_only_changes(self):
+        first = self.make_booking(1)
+        second = self.make_booking(2)
+        cursor = self.client.get('/api/bookings/live-queue/')['X-Queue-Seq']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.status = 'READY'
+            first.save()
+            first.status = 'IN_PROGRESS'
+            first.save()
+            second.status = 'COMPLETED'
+            second.save()
+
+        response = self.client.get('/api/bookings/live-queue/', {'since': cursor})
+        self.assertFalse(response.data['reset'])
+        self.assertEqual([c['id'] for c in response.data['changed']], [first.id])
+        self.assertEqual(response.data['changed'][0]['status'], 'IN_PROGRESS')
+        self.assertEqual(response.data['removed'], [second.id])
+
+        again = self.client.get('/api/bookings/live-queue/', {'since': response.data['cursor']})
+        self.assertEqual(again.data['changed'], [])
+        self.assertEqual(again.data['removed'], [])
+
+    def test_unknown_cursor_forces_reset(self):
+        self.make_booking(1)
+        response = self.client.get('/api/bookings/live-queue/', {'since': 10_000})
+        self.assertTrue(response.data['reset'])
+        self.assertEqual(len(response.data['changed']), 1)
+        self.assertEqual(self.client.get('/api/bookings/live-queue/', {'since': 'abc'}).status_code, 400)
+
+    def test_cursor_from_another_process_forces_reset(self):
+        self.make_booking(1)
+        seq = live_queue_projection.snapshot()[0]
+        # Same sequence number, but issued by another worker's projection.
+        response = self.client.get('/api/bookings/live-queue/', {'since': f'otherworker:{seq}'})
+        self.assertTrue(response.data['reset'])
+        self.assertEqual(len(response.data['changed']), 1)
+
+        response = self.client.get('/api/bookings/live-queue/', {'since': live_queue_projection.cursor(seq)})
+        self.assertFalse(response.data['reset'])
+        self.assertEqual(response.data['changed'], [])
+
+
+class QueueConsumerProtocolTest(QueueTestCase):
+    def test_snapshot_then_coalesced_deltas(self):
+        booking = self.make_booking(1)
+        card = live_queue_projection.snapshot()[1][0]
+
+        async def scenario():
+            communicator = WebsocketCommunicator(QueueConsumer.as_asgi(), '/ws/queue/?protocol=2')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            snapshot = await communicator.receive_json_from()
+            self.assertEqual(snapshot['type'], 'queue_snapshot')
+            self.assertEqual([c['id'] for c in snapshot['cards']], [booking.id])
+
+            layer = get_channel_layer()
+            for status in ('IN_PROGRESS', 'READY'):
+                await layer.group_send('live_queue', {'type': 'queue_update', 'data': dict(card, status=status)})
+
+            delta = await communicator.receive_json_from(timeout=2)
+            self.assertEqual(delta['type'], 'queue_delta')
+            self.assertEqual(delta['base_seq'], snapshot['seq'])
+            self.assertEqual([c['status'] for c in delta['changed']], ['READY'])
+            self.assertTrue(await communicator.receive_nothing(timeout=0.5))
+
+            # A reconnecting board resumes from its last cursor.
+            await communicator.send_json_to({'type': 'resume', 'cursor': snapshot['cursor']})
+            resumed = await communicator.receive_json_from()
+            self.assertTrue(resumed['resumed'])
+            self.assertEqual(resumed['seq'], delta['seq'])
+            self.assertEqual([c['status'] for c in resumed['changed']], ['READY'])
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_legacy_clients_get_per_event_updates(self):
+        booking = self.make_booking(1)
+        card = live_queue_projection.snapshot()[1][0]
+
+        async def scenario():
+            communicator = WebsocketCommunicator(QueueConsumer.as_asgi(), '/ws/queue/')
+            await communicator.connect()
+            await get_channel_layer().group_send('live_queue', {'type': 'queue_update', 'data': dict(card, status='READY')})
+            message = await communicator.receive_json_from()
+            self.assertEqual(message['type'], 'queue_update')
+            self.assertEqual(message['data']['id'], booking.id)
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_every_socket_sees_a_batch_at_the_same_seq(self):
+        self.make_booking(1)
+        card = live_queue_projection.snapshot()[1][0]
+        live_queue_projection.reset()  # cards not loaded: every apply would bump seq
+
+        async def scenario():
+            sockets = [WebsocketCommunicator(QueueConsumer.as_asgi(), '/ws/queue/') for _ in range(3)]
+            for communicator in sockets:
+                await communicator.connect()
+            await get_channel_layer().group_send('live_queue', {
+                'type': 'queue_batch', 'batch_id': 'batch-1', 'cards': [dict(card, status='READY')],
+            })
+            seqs = [(await communicator.receive_json_from())['seq'] for communicator in sockets]
+            for communicator in sockets:
+                await communicator.disconnect()
+            return seqs
+
+        seqs = async_to_sync(scenario)()
+        self.assertEqual(len(set(seqs)), 1)
+        self.assertEqual(live_queue_projection.seq, seqs[0])
+        # Seen before: not applied again, same seq handed back.
+        self.assertEqual(live_queue_projection.apply_batch('batch-1', [dict(card, status='WAITING')]), [seqs[0]])
+
+
+class BookingEventPipelineTest(QueueTestCase):
+    def test_transaction_dispatches_one_batch(self):
+        with mock.patch('bookings.signals._broadcast_queue_event') as broadcast:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                bookings = [self.make_booking(n, commit=False) for n in range(3)]
+                for booking in bookings:
+                    booking.status = 'READY'
+                    booking.save()
+
+            self.assertEqual(len(callbacks), 1)
+            # One joined load of the touched bookings + one bulk insert of notification logs.
+            with self.assertNumQueries(2):
+                callbacks[0]()
+
+        broadcast.assert_called_once()
+        message = broadcast.call_args[0][0]
+        self.assertEqual(message['type'], 'queue_batch')
+        self.assertEqual({card['id'] for card in message['cards']}, {b.id for b in bookings})
+        self.assertTrue(all(card['status'] == 'READY' for card in message['cards']))
+
+
+class BookingSaveOverheadTest(QueueTestCase):
+    def test_status_drag_is_a_single_update(self):
+        booking = Booking.objects.get(pk=self.make_booking(1).pk)
+        booking.status = 'IN_BAY_1'
+        # No re-SELECT of the old status, no lock lookup, no package load: just the UPDATE.
+        with self.captureOnCommitCallbacks(execute=False), self.assertNumQueries(1):
+            booking.save()
+        self.assertEqual(booking._old_status, 'WAITING')
+        self.assertFalse(booking.has_changed('status'))
+
+    def test_closing_the_register_locks_bookings(self):
+        from django.core.exceptions import ValidationError
+        from finance.models import DailyRegisterAudit
+
+        booking = Booking.objects.get(pk=self.make_booking(1).pk)
+        booking.save()  # warms the locked-dates cache
+
+        DailyRegisterAudit.objects.create(date=booking.created_at.date(), closed_by=self.user, gross_revenue=0,
+                                          expected_cash_in_till=0, total_expenses=0)
+        booking.status = 'READY'
+        with self.assertRaises(ValidationError):
+            booking.save()
+
+
+class AutocommitEventTest(TransactionTestCase):
+    def setUp(self):
+        live_queue_projection.reset()
+        self.delivered = []
+        self.subscriber = booking_event_subscriber(lambda events: self.delivered.append([(e.booking_id, e.status) for e in events]))
+        owner = User.objects.create_user(username='cust', password='pwd')
+        self.customer = Customer.objects.create(user=owner)
+        self.vehicle = CustomerVehicle.objects.create(customer=owner, make='Test', model='Car', plate_number='AC-1')
+        self.package = ServicePackage.objects.create(name='Basic Wash', price=100, duration_minutes=60, description='Basic')
+
+    def tearDown(self):
+        _subscribers.remove(self.subscriber)
+        live_queue_projection.reset()
+
+    def book(self, **kwargs):
+        return Booking.objects.create(customer=self.customer, vehicle=self.vehicle, service_package=self.package,
+                                      time_slot=timezone.now(), **kwargs)
+
+    def test_saves_outside_a_transaction_are_delivered(self):
+        booking = self.book()
+        booking.status = 'COMPLETED'
+        booking.save()
+
+        self.assertEqual(self.delivered, [[(booking.id, 'WAITING')], [(booking.id, 'COMPLETED')]])
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.loyalty_points, 10)
+
+    def test_saves_inside_a_transaction_still_batch(self):
+        with transaction.atomic():
+            first, second = self.book(), self.book()
+            self.assertEqual(self.delivered, [])
+        self.assertEqual(self.delivered, [[(first.id, 'WAITING'), (second.id, 'WAITING')]])
@@ -0,0 +1,158 @@
+from decimal import Decimal
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from .models import Booking, ServicePackage
+from .projections import live_queue_projection
+from customers.models import Customer, CustomerVehicle
+from finance.models import DailyFinanceRollup, DailyRegisterAudit, Invoice, KhataLedger, PayrollEntry
+from finance.rollups import rebuild_rollups
+
+
+class BookingTransitionTest(TestCase):
+    def setUp(self):
+        live_queue_projection.reset()
+        self.manager = User.objects.create_user(username='manager', password='password', is_staff=True)
+        self.washer = User.objects.create_user(username='washer', password='password')
+        self.owner = User.objects.create_user(username='cust', password='pwd')
+        self.customer = Customer.objects.create(user=self.owner)
+        self.vehicle = CustomerVehicle.objects.create(customer=self.owner, make='Test', model='Car', plate_number='KL-11')
+        self.package = ServicePackage.objects.create(name='Basic Wash', price=500, duration_minutes=60, description='Basic')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def tearDown(self):
+        live_queue_projection.reset()
+
+    def book(self, status='WAITING', **kwargs):
+        return Booking.objects.create(customer=self.customer, vehicle=self.vehicle, service_package=self.package,
+                                      time_slot=timezone.now(), status=status, **kwargs)
+
+    def test_kanban_checkout_with_khata(self):
+        booking = self.book('READY', technician=self.washer)
+        response = self.client.patch(f'/api/bookings/update-stage/{booking.id}/', {
+            'new_status': 'COMPLETED', 'payment_cash': 200, 'payment_khata': 300,
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        invoice = Invoice.objects.get(booking=booking)
+        self.assertTrue(invoice.is_paid)
+        self.assertEqual(invoice.payment_method, 'SPLIT')
+        self.assertEqual(invoice.split_khata, Decimal('300'))
+        self.assertEqual(KhataLedger.objects.get(related_booking=booking).amount, Decimal('300'))
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.outstanding_balance, Decimal('300'))
+        self.assertTrue(PayrollEntry.objects.filter(staff_user=self.washer).exists())
+
+        # Completed bookings are final: a repeated checkout must not charge twice.
+        response = self.client.post(f'/api/bookings/{booking.id}/checkout/', {'amount_khata': 300}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(KhataLedger.objects.filter(related_booking=booking).count(), 1)
+
+    def test_worker_start_and_finish(self):
+        booking = self.book(technician=self.washer)
+        scheduled_end = booking.end_time
+        self.client.force_authenticate(self.washer)
+
+        response = self.client.patch(f'/api/bookings/task/{booking.id}/finish/')
+        self.assertEqual(response.data['error'], 'Task must be in-progress before finishing.')
+
+        self.assertEqual(self.client.patch(f'/api/bookings/task/{booking.id}/start/').status_code, 200)
+        response = self.client.patch(f'/api/bookings/task/{booking.id}/start/')
+        self.assertEqual(response.data['error'], 'Task is already in progress.')
+
+        self.assertEqual(self.client.patch(f'/api/bookings/task/{booking.id}/finish/').status_code, 200)
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'READY')
+        self.assertIsNotNone(booking.start_time)
+        self.assertIsNotNone(booking.finished_at)
+        # The schedule is untouched: availability keeps reading the booked window.
+        self.assertEqual(booking.end_time, scheduled_end)
+
+    def test_bulk_close_ready_cards(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ready = [self.book('READY') for _ in range(3)]
+            waiting = self.book('WAITING')
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post('/api/bookings/bulk-transition/', {
+                'from_status': 'READY', 'new_status': 'COMPLETED', 'payment_method': 'CASH',
+            }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['updated'], 3)
+        # The whole batch is one domain event dispatch.
+        self.assertEqual(len(callbacks), 1)
+
+        self.assertEqual(Booking.objects.filter(status='COMPLETED').count(), 3)
+        self.assertEqual(Invoice.objects.filter(booking__in=ready, is_paid=True, payment_method='CASH').count(), 3)
+        waiting.refresh_from_db()
+        self.assertEqual(waiting.status, 'WAITING')
+
+    def test_bulk_is_all_or_nothing(self):
+        ready = self.book('READY')
+        cancelled = self.book('CANCELLED')
+
+        response = self.client.post('/api/bookings/bulk-transition/', {
+            'booking_ids': [ready.id, cancelled.id], 'new_status': 'COMPLETED',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(cancelled.id, response.data['errors'])
+        ready.refresh_from_db()
+        self.assertEqual(ready.status, 'READY')
+
+        self.client.force_authenticate(self.washer)
+        response = self.client.post('/api/bookings/bulk-transition/', {
+            'booking_ids': [ready.id], 'new_status': 'COMPLETED',
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_bulk_rejects_unknown_payment_method(self):
+        ready = self.book('READY')
+        response = self.client.post('/api/bookings/bulk-transition/', {
+            'booking_ids': [ready.id], 'new_status': 'COMPLETED', 'payment_method': 'CHEQUE',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        ready.refresh_from_db()
+        self.assertEqual(ready.status, 'READY')
+
+    def test_checkout_on_a_closed_day_is_a_bad_request(self):
+        ready = self.book('READY')
+        yesterday = timezone.now() - timezone.timedelta(days=1)
+        Booking.objects.filter(pk=ready.pk).update(created_at=yesterday)
+        DailyRegisterAudit.objects.create(date=yesterday.date(), closed_by=self.manager, gross_revenue=0,
+                                          expected_cash_in_till=0, total_expenses=0)
+
+        response = self.client.post(f'/api/bookings/{ready.id}/checkout/', {'amount_cash': 500}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('closed', response.data['error'].lower())
+        ready.refresh_from_db()
+        self.assertEqual(ready.status, 'READY')
+
+    def test_bulk_close_collects_closed_day_invoices_today(self):
+        ready = self.book('READY')
+        invoice = Invoice.objects.create(booking=ready, amount=500)
+        yesterday = timezone.now() - timezone.timedelta(days=1)
+        Invoice.objects.filter(pk=invoice.pk).update(created_at=yesterday)
+        rebuild_rollups()
+        DailyRegisterAudit.objects.create(date=yesterday.date(), closed_by=self.manager, gross_revenue=0,
+                                          expected_cash_in_till=0, total_expenses=0)
+
+        response = self.client.post('/api/bookings/bulk-transition/', {
+            'booking_ids': [ready.id], 'new_status': 'COMPLETED', 'payment_method': 'CASH',
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        invoice.refresh_from_db()
+        self.assertTrue(invoice.is_paid)
+        self.assertEqual(DailyFinanceRollup.objects.get(date=timezone.localdate()).cash_revenue, Decimal('500'))
+        self.assertEqual(DailyFinanceRollup.objects.get(date=yesterday.date()).paid_revenue, Decimal('0'))
+
+        # Nothing is billed or collected on a day that is already closed.
+        other = self.book('READY')
+        Booking.objects.filter(pk=other.pk).update(created_at=timezone.now() - timezone.timedelta(days=2))
+        DailyRegisterAudit.objects.create(date=timezone.now().date(), closed_by=self.manager, gross_revenue=0,
+                                          expected_cash_in_till=0, total_expenses=0)
+        response = self.client.post('/api/bookings/bulk-transition/', {
+            'booking_ids': [other.id], 'new_status': 'COMPLETED', 'payment_method': 'CASH',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
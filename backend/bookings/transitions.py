@@ -0,0 +1,294 @@
+"""
+Booking status transitions.
+
+Every place that moves a booking through the workflow (Kanban drag, POS
+checkout, driver app, worker start/finish buttons, end-of-day bulk close) goes
+through this module, so the rules and the completion side effects (walk-in
+khata customer, khata charge, invoice, chemical usage, payroll) live in one
+place. A transition reads the booking once, row-locked and with its related
+rows joined, and writes it once.
+"""
+import random
+import string
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import events
+from .models import Booking
+
+TERMINAL_STATUSES = ('COMPLETED', 'CANCELLED')
+VALID_STATUSES = [s[0] for s in Booking.STATUS_CHOICES]
+
+# Timestamp recorded when a booking enters a status.
+STATUS_TIMESTAMPS = {
+    'IN_PROGRESS': 'start_time',
+    'READY': 'finished_at',
+    'COMPLETED': 'finished_at',
+}
+
+BULK_TRANSITION_LIMIT = 500
+BULK_PAYMENT_METHODS = ('CASH', 'ONLINE')
+
+
+class TransitionError(Exception):
+    """The requested transition is not allowed; the message is safe to show to the user."""
+
+
+class BulkTransitionError(TransitionError):
+    def __init__(self, errors):
+        super().__init__('Some bookings cannot be moved. Nothing was changed.')
+        self.errors = errors
+
+
+class Payment:
+    """How a completed booking was paid: cash, online (UPI) and khata (credit) amounts."""
+
+    def __init__(self, cash=0, online=0, khata=0, customer_name=None):
+        self.cash = Decimal(str(cash or 0))
+        self.online = Decimal(str(online or 0))
+        self.khata = Decimal(str(khata or 0))
+        self.customer_name = customer_name
+
+    @classmethod
+    def from_data(cls, data, cash_key, online_key, khata_key):
+        return cls(
+            cash=float(data.get(cash_key, 0) or 0),
+            online=float(data.get(online_key, 0) or 0),
+            khata=float(data.get(khata_key, 0) or 0),
+            customer_name=data.get('customer_name'),
+        )
+
+    @property
+    def method(self):
+        if self.cash > 0 and self.online == 0 and self.khata == 0:
+            return 'CASH'
+        if self.online > 0 and self.cash == 0 and self.khata == 0:
+            return 'ONLINE'
+        return 'SPLIT'
+
+
+def locked_bookings(queryset=None):
+    """Bookings row-locked for update, with everything a transition touches joined in."""
+    queryset = queryset if queryset is not None else Booking.objects.all()
+    return queryset.select_for_update(of=('self',)).select_related(
+        'customer', 'vehicle', 'service_package__commission_rule', 'technician__staff_profile', 'invoice'
+    )
+
+
+def check_transition(booking, new_status, allowed_from=None, error=None):
+    if new_status not in VALID_STATUSES:
+        raise TransitionError(f'Invalid status. Valid options: {VALID_STATUSES}')
+    if booking.status in TERMINAL_STATUSES:
+        raise TransitionError(f'Booking is already {booking.status.lower()}.')
+    if allowed_from is not None and booking.status not in allowed_from:
+        raise TransitionError(error or f'Cannot move booking from {booking.status} to {new_status}.')
+
+
+def _apply_status(booking, new_status, now):
+    """Set the status (and its timestamp) on the instance. Returns True if the status actually changed."""
+    if booking.status == new_status:
+        return False
+    booking.status = new_status
+    if new_status in STATUS_TIMESTAMPS:
+        setattr(booking, STATUS_TIMESTAMPS[new_status], now)
+    return True
+
+
+def transition_booking(booking_id, new_status=None, *, bay_assignment=None, technician_id=None,
+                       payment=None, allowed_from=None, error=None, queryset=None):
+    """
+    Move one booking to `new_status` (and/or reassign its bay or technician) in
+    a single transaction. Entering COMPLETED runs the completion side effects.
+    Raises Booking.DoesNotExist or TransitionError.
+    """
+    from django.core.exceptions import ValidationError
+    try:
+        return _transition_booking(booking_id, new_status, bay_assignment, technician_id, payment,
+                                   allowed_from, error, queryset)
+    except ValidationError as e:
+        # A closed register (the booking's or an invoice's day) rejected one of the writes.
+        raise TransitionError(e.messages[0])
+
+
+def _transition_booking(booking_id, new_status, bay_assignment, technician_id, payment, allowed_from, error, queryset):
+    with transaction.atomic():
+        booking = locked_bookings(queryset).get(pk=booking_id)
+        if new_status:
+            check_transition(booking, new_status, allowed_from, error)
+
+        if payment is not None and payment.khata > 0 and not booking.customer_id:
+            booking.customer = _create_walkin_khata_customer(payment.customer_name)
+
+        entered = bool(new_status) and _apply_status(booking, new_status, timezone.now())
+        if bay_assignment is not None:
+            booking.bay_assignment = bay_assignment
+        if technician_id:
+            booking.technician_id = technician_id
+        booking.save()
+
+        if entered and new_status == 'COMPLETED':
+            _complete(booking, payment)
+    return booking
+
+
+def bulk_transition(new_status, *, booking_ids=None, from_status=None, payment_method=None):
+    """
+    Move many bookings to `new_status` in one transaction, e.g. every READY
+    card to COMPLETED at closing. All-or-nothing: if any booking cannot make the
+    transition, BulkTransitionError lists them and nothing is written.
+    `payment_method` ('CASH' or 'ONLINE') marks completed invoices as paid in full.
+    """
+    from django.core.exceptions import ValidationError
+    from finance.register_lock import check_register_lock
+
+    if payment_method not in (None, '', *BULK_PAYMENT_METHODS):
+        raise TransitionError(f'Invalid payment_method. Valid options: {list(BULK_PAYMENT_METHODS)}')
+    if new_status == 'COMPLETED':
+        # Completion bills and collects invoices today; bulk writes skip the Invoice pre_save lock.
+        try:
+            check_register_lock(timezone.now().date())
+        except ValidationError as e:
+            raise TransitionError(e.messages[0])
+
+    with transaction.atomic():
+        queryset = Booking.objects.all()
+        if booking_ids is not None:
+            queryset = queryset.filter(pk__in=booking_ids)
+        if from_status:
+            queryset = queryset.filter(status=from_status)
+        bookings = list(locked_bookings(queryset).order_by('pk')[:BULK_TRANSITION_LIMIT + 1])
+        if len(bookings) > BULK_TRANSITION_LIMIT:
+            raise TransitionError(f'At most {BULK_TRANSITION_LIMIT} bookings can be moved at once.')
+
+        errors = {}
+        if booking_ids is not None:
+            found = {booking.pk for booking in bookings}
+            for booking_id in booking_ids:
+                if booking_id not in found:
+                    errors[booking_id] = 'Booking not found.' if not from_status else f'Booking is not {from_status}.'
+        for booking in bookings:
+            try:
+                check_transition(booking, new_status)
+                check_register_lock((booking.created_at or timezone.now()).date())
+            except Exception as e:
+                errors[booking.pk] = e.messages[0] if hasattr(e, 'messages') else str(e)
+        if errors:
+            raise BulkTransitionError(errors)
+
+        now = timezone.now()
+        moved = []
+        for booking in bookings:
+            booking._old_status = booking.status
+            if _apply_status(booking, new_status, now):
+                moved.append(booking)
+        if not moved:
+            return []
+
+        fields = ['status'] + ([STATUS_TIMESTAMPS[new_status]] if new_status in STATUS_TIMESTAMPS else [])
+        # One UPDATE for the whole batch; bulk_update skips model signals, so
+        # record the events the post_save receiver would have.
+        Booking.objects.bulk_update(moved, fields)
+        for booking in moved:
+            booking._snapshot_tracked_fields()
+            events.record(booking)
+
+        if new_status == 'COMPLETED':
+            _complete_many(moved, payment_method)
+    return moved
+
+
+def _create_walkin_khata_customer(customer_name):
+    from django.contrib.auth.models import User
+    from customers.models import Customer
+
+    username = f"walkin_khata_{random.randint(100000, 999999)}"
+    while User.objects.filter(username=username).exists():
+        username = f"walkin_khata_{random.randint(100000, 999999)}"
+
+    new_user = User(username=username, first_name=customer_name or "Walk-In Guest")
+    new_user.set_password(''.join(random.choices(string.ascii_letters + string.digits, k=12)))
+    new_user.save()
+    return Customer.objects.create(user=new_user, phone_number='')
+
+
+def _package_price(booking):
+    return booking.service_package.price if booking.service_package else Decimal('0.00')
+
+
+def _complete(booking, payment):
+    from finance.models import Invoice
+    from finance import khata
+
+    if payment is not None and payment.khata > 0 and booking.customer_id:
+        khata.charge(
+            booking.customer_id,
+            payment.khata,
+            f'Service completed for {booking.vehicle.plate_number if booking.vehicle else "Walk-In"}',
+            booking=booking,
+            check_limit=False,
+        )
+
+    invoice = getattr(booking, 'invoice', None)
+    if invoice is None:
+        invoice = Invoice(booking=booking, amount=_package_price(booking))
+    if payment is not None:
+        _mark_paid(invoice, payment)
+    if invoice.pk is None or payment is not None:
+        invoice.save()
+
+    _run_finance(booking)
+
+
+def _complete_many(bookings, payment_method=None):
+    from finance.models import Invoice
+    from finance.rollups import bulk_written
+
+    created, updated = [], []
+    for booking in bookings:
+        invoice = getattr(booking, 'invoice', None)
+        payment = None
+        if payment_method == 'CASH':
+            payment = Payment(cash=_package_price(booking))
+        elif payment_method == 'ONLINE':
+            payment = Payment(online=_package_price(booking))
+
+        if invoice is None:
+            invoice = Invoice(booking=booking, amount=_package_price(booking))
+            created.append(invoice)
+        elif payment is not None and not invoice.is_paid:
+            updated.append(invoice)
+        else:
+            continue
+        if payment is not None:
+            _mark_paid(invoice, payment)
+
+    # bulk_create/bulk_update send no signals; keep the daily rollup in step here.
+    Invoice.objects.bulk_create(created)
+    bulk_written(created, created=True)
+    if updated:
+        Invoice.objects.bulk_update(updated, ['split_cash', 'split_online', 'split_khata', 'payment_method', 'is_paid', 'paid_at'])
+        bulk_written(updated)
+
+    for booking in bookings:
+        _run_finance(booking)
+
+
+def _mark_paid(invoice, payment):
+    invoice.split_cash = payment.cash
+    invoice.split_online = payment.online
+    invoice.split_khata = payment.khata
+    invoice.payment_method = payment.method
+    if not invoice.is_paid:
+        invoice.paid_at = timezone.now()
+    invoice.is_paid = True
+
+
+def _run_finance(booking):
+    from finance.logic import calculate_wash_cost, process_payroll_event
+    try:
+        calculate_wash_cost(booking)
+        process_payroll_event(booking)
+    except Exception as e:
+        print(f"Finance calculation error: {e}")
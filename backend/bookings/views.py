@@ -16,6 +16,7 @@ import random
 from customers.models import Customer, CustomerVehicle
 from customers.models import Customer
 from django.contrib.auth import get_user_model
+from core.query_planner import QueryPlannerMixin
 User = get_user_model()
 
 class IsAdminUserOrReadOnly(BasePermission):
@@ -24,8 +25,8 @@ class IsAdminUserOrReadOnly(BasePermission):
             return True
         return request.user and request.user.is_staff
 
-class ServicePackageViewSet(viewsets.ModelViewSet):
-    queryset = ServicePackage.objects.all().order_by('price')
+class ServicePackageViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
+    queryset = ServicePackage.objects.prefetch_related('recipe_lines__chemical').order_by('price')
     serializer_class = ServicePackageSerializer
 
     def get_permissions(self):
@@ -45,7 +46,7 @@ class ServicePackageViewSet(viewsets.ModelViewSet):
             if not is_admin_or_manager:
                 self.permission_denied(request, message="Only Admin or Manager can modify service packages.")
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     serializer_class = BookingSerializer
 
     def get_queryset(self):
@@ -78,146 +79,134 @@ class BookingViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def completed(self, request):
         """
-        Returns all bookings ready for invoicing.
-        Queries Booking.objects directly to bypass any active-only queue filters.
+        Completed bookings for invoicing, newest first, a page at a time.
+        Keyset-paginated on (created_at, id): follow `next` (or pass `cursor`)
+        for older rows. Optional `start_date` / `end_date` (YYYY-MM-DD) bound created_at.
         """
-        completed_bookings = Booking.objects.filter(
-            status__in=[
-                'CHECKOUT', 'Checkout', 'checkout', 
-                'COMPLETED', 'Completed', 'completed', 
-                'DELIVERED', 'Delivered', 'delivered',
-                'PICK UP', 'Pick Up', 'pick up', 'PICKUP', 'Pickup'
-            ]
-        ).select_related('customer', 'technician', 'service_package', 'vehicle').order_by('-created_at')
-        
-        serializer = self.get_serializer(completed_bookings, many=True)
-        return Response(serializer.data)
+        from .pagination import CreatedAtKeysetPagination
+
+        completed_bookings = Booking.objects.filter(status='COMPLETED')
+
+        start_date = request.query_params.get('start_date')
+        end_date = request.query_params.get('end_date')
+        for name, value in (('start_date', start_date), ('end_date', end_date)):
+            if value and not parse_date(value):
+                return Response({'error': f'Invalid {name}. Use YYYY-MM-DD'}, status=400)
+        # Half-open datetime bounds keep the filter on the (status, created_at, id) index.
+        tz = timezone.get_current_timezone()
+        if start_date:
+            completed_bookings = completed_bookings.filter(
+                created_at__gte=timezone.make_aware(datetime.combine(parse_date(start_date), time.min), tz))
+        if end_date:
+            completed_bookings = completed_bookings.filter(
+                created_at__lt=timezone.make_aware(datetime.combine(parse_date(end_date) + timedelta(days=1), time.min), tz))
+
+        completed_bookings = completed_bookings.select_related(
+            'customer__user', 'technician', 'service_package', 'vehicle', 'invoice'
+        )
+        paginator = CreatedAtKeysetPagination()
+        page = paginator.paginate_queryset(completed_bookings, request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post'])
-    @transaction.atomic
     def checkout(self, request, pk=None):
+        from .transitions import transition_booking, Payment, TransitionError
         booking = self.get_object()
-        
-        amount_cash = float(request.data.get('amount_cash', 0))
-        amount_upi = float(request.data.get('amount_upi', 0))
-        amount_khata = float(request.data.get('amount_khata', 0))
-
-        if amount_khata > 0 and not booking.customer:
-            customer_name = request.data.get('customer_name') or "Walk-In Guest"
-            from customers.models import Customer
-            from django.contrib.auth.models import User
-            import random
-            import string
-            
-            username = f"walkin_khata_{random.randint(100000, 999999)}"
-            while User.objects.filter(username=username).exists():
-                username = f"walkin_khata_{random.randint(100000, 999999)}"
-            
-            new_user = User.objects.create(username=username, first_name=customer_name)
-            new_user.set_password(''.join(random.choices(string.ascii_letters + string.digits, k=12)))
-            new_user.save()
-            customer = Customer.objects.create(user=new_user, phone_number='')
-            booking.customer = customer
-            booking.save()
-
-        booking.status = 'COMPLETED'
-        booking.end_time = timezone.now()
-        booking.save()
-        
-        if amount_khata > 0 and booking.customer:
-            from finance.models import KhataLedger
-            from decimal import Decimal
-            booking.customer.outstanding_balance += Decimal(amount_khata)
-            booking.customer.save()
-            KhataLedger.objects.create(
-                customer=booking.customer,
-                amount=amount_khata,
-                transaction_type='CHARGE',
-                description=f'Service completed for {booking.vehicle.plate_number if booking.vehicle else "Walk-In"}',
-                related_booking=booking
-            )
-
-        payment_method = 'SPLIT'
-        if amount_cash > 0 and amount_upi == 0 and amount_khata == 0:
-            payment_method = 'CASH'
-        elif amount_upi > 0 and amount_cash == 0 and amount_khata == 0:
-            payment_method = 'ONLINE'
-
-        total_amount = booking.service_package.price if booking.service_package else 0.0
-
-        if not hasattr(booking, 'invoice'):
-            from finance.models import Invoice
-            Invoice.objects.create(
-                booking=booking,
-                amount=total_amount,
-                split_cash=amount_cash,
-                split_online=amount_upi,
-                split_khata=amount_khata,
-                payment_method=payment_method,
-                is_paid=True
-            )
-        else:
-            inv = booking.invoice
-            inv.split_cash = amount_cash
-            inv.split_online = amount_upi
-            inv.split_khata = amount_khata
-            inv.payment_method = payment_method
-            inv.is_paid = True
-            inv.save()
-            
-        from finance.logic import calculate_wash_cost, process_payroll_event
+        payment = Payment.from_data(request.data, 'amount_cash', 'amount_upi', 'amount_khata')
         try:
-            calculate_wash_cost(booking)
-            process_payroll_event(booking)
-        except Exception as e:
-            print(f"Finance calculation error: {e}")
-            
+            booking = transition_booking(booking.pk, 'COMPLETED', payment=payment)
+        except TransitionError as e:
+            return Response({'error': str(e)}, status=400)
+
         return Response({'status': 'success', 'message': 'Checkout completed successfully.', 'booking_id': booking.id})
 
+    @action(detail=False, methods=['post'], url_path='bulk-transition')
+    def bulk_transition(self, request):
+        """
+        Move many cards at once, e.g. `{"from_status": "READY", "new_status": "COMPLETED"}`
+        at closing, or an explicit `booking_ids` list. One transaction: either every
+        booking moves or none do. Optional `payment_method` (CASH / ONLINE) marks the
+        completed invoices as paid in full.
+        """
+        from .transitions import bulk_transition, BulkTransitionError, TransitionError
+        user = request.user
+        is_manager = user.is_superuser or user.is_staff or (
+            hasattr(user, 'staff_profile') and user.staff_profile.role in ['ADMIN', 'MANAGER']
+        )
+        if not is_manager:
+            return Response({'error': 'Only Admin or Manager can move bookings in bulk.'}, status=403)
+
+        new_status = request.data.get('new_status')
+        booking_ids = request.data.get('booking_ids')
+        from_status = request.data.get('from_status')
+        if not new_status or (booking_ids is None and not from_status):
+            return Response({'error': 'new_status and one of booking_ids or from_status are required'}, status=400)
+        try:
+            if booking_ids is not None:
+                booking_ids = [int(booking_id) for booking_id in booking_ids]
+        except (TypeError, ValueError):
+            return Response({'error': 'booking_ids must be a list of integers'}, status=400)
+
+        try:
+            moved = bulk_transition(new_status, booking_ids=booking_ids, from_status=from_status,
+                                    payment_method=request.data.get('payment_method'))
+        except BulkTransitionError as e:
+            return Response({'error': str(e), 'errors': e.errors}, status=400)
+        except TransitionError as e:
+            return Response({'error': str(e)}, status=400)
+
+        return Response({
+            'status': 'success',
+            'new_status': new_status,
+            'updated': len(moved),
+            'booking_ids': [booking.id for booking in moved],
+        })
+
     @action(detail=False, methods=['get'])
     def available_slots(self, request):
+        """
+        Free hourly slots for one `date`, or for every day between `start_date`
+        and `end_date` (inclusive) so calendar screens can load a week or month
+        in one call. A slot stays open while at least one service bay is free.
+        """
+        from .availability import CapacityIndex, MAX_RANGE_DAYS
+
         date_str = request.query_params.get('date')
-        if not date_str:
+        start_str = request.query_params.get('start_date')
+        end_str = request.query_params.get('end_date')
+        if not date_str and not (start_str and end_str):
             return Response({'error': 'Missing date parameter'}, status=400)
-            
+
         try:
-            target_date = parse_date(date_str)
-            if not target_date:
+            start_date = parse_date(date_str or start_str)
+            end_date = parse_date(date_str or end_str)
+            if not start_date or not end_date:
                 raise ValueError
         except ValueError:
             return Response({'error': 'Invalid date format. Use YYYY-MM-DD'}, status=400)
 
-        # 1. Define Standard Operating Hours (1-hour blocks from 9:00 AM to 6:00 PM)
-        all_slots = []
-        for hour in range(9, 18):
-            t = time(hour, 0)
-            all_slots.append(t.strftime("%I:%M %p"))
-
-        # 2. Query ONLINE scheduled bookings that fall on the specified date (ignoring CANCELLED ones)
-        # Walk-ins (created via POS at current time) are ignored because they do not fall exactly on the hour.
-        existing_bookings = Booking.objects.filter(
-            time_slot__date=target_date,
-            time_slot__minute=0
-        ).exclude(status='CANCELLED')
-
-        # 3. Find booked slot times
-        booked_slots = set()
-        for b in existing_bookings:
-            if b.time_slot:
-                local_b_time = timezone.localtime(b.time_slot)
-                # Ensure the string explicitly matches the '%I:%M %p' format (e.g., '09:00 AM', '02:00 PM')
-                # On Windows %I could give '09', just strip leading zeros if necessary, but standard is keep.
-                formatted_time_slot = local_b_time.strftime("%I:%M %p")
-                if formatted_time_slot.startswith("0"): 
-                     pass # It's matched identically with our `for hour in range(9, 18): t.strftime("%I:%M %p")`
-                booked_slots.add(formatted_time_slot)
-
-        # 4. Filter remaining blocks
-        available_slots = [slot for slot in all_slots if slot not in booked_slots]
-            
-        return Response({'date': date_str, 'slots': available_slots})
+        if end_date < start_date:
+            return Response({'error': 'end_date must not be before start_date'}, status=400)
+        if (end_date - start_date).days >= MAX_RANGE_DAYS:
+            return Response({'error': f'Date range is limited to {MAX_RANGE_DAYS} days'}, status=400)
+
+        index = CapacityIndex.for_range(start_date, end_date)
 
-class CalendarViewSet(viewsets.ReadOnlyModelViewSet):
+        if date_str:
+            return Response({'date': date_str, 'slots': index.available_slots(start_date)})
+
+        return Response({
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'bays': len(index.bays),
+            'days': [
+                {'date': day.isoformat(), 'slots': index.available_slots(day)}
+                for day in index.days()
+            ],
+        })
+
+class CalendarViewSet(QueryPlannerMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = BookingSerializer
 
     def get_queryset(self):
@@ -231,7 +220,7 @@ class CalendarViewSet(viewsets.ReadOnlyModelViewSet):
             
         return queryset
 
-class DriverBookingViewSet(viewsets.ReadOnlyModelViewSet):
+class DriverBookingViewSet(QueryPlannerMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = BookingSerializer
 
     def get_queryset(self):
@@ -255,29 +244,16 @@ class DriverBookingViewSet(viewsets.ReadOnlyModelViewSet):
 
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
+        from .transitions import transition_booking, TransitionError
         booking = self.get_object()
         new_status = request.data.get('status')
-        if new_status in dict(Booking.STATUS_CHOICES):
-            booking.status = new_status
-            booking.save()
-            
-            # Auto-generate invoice if completed
-            if new_status == 'COMPLETED':
-                # 1. Generate Invoice (if missing)
-                if not hasattr(booking, 'invoice'):
-                    from finance.models import Invoice
-                    Invoice.objects.create(
-                        booking=booking,
-                        amount=booking.service_package.price if booking.service_package else 0.0
-                    )
-                
-                # 2. Trigger Financial Logic
-                from finance.logic import calculate_wash_cost, process_payroll_event
-                calculate_wash_cost(booking)
-                process_payroll_event(booking)
-            
-            return Response({'status': 'success'})
-        return Response({'status': 'invalid status'}, status=400)
+        if new_status not in dict(Booking.STATUS_CHOICES):
+            return Response({'status': 'invalid status'}, status=400)
+        try:
+            transition_booking(booking.pk, new_status)
+        except TransitionError as e:
+            return Response({'status': 'invalid status', 'error': str(e)}, status=400)
+        return Response({'status': 'success'})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -352,106 +328,25 @@ def express_walkin(request):
 @permission_classes([IsAuthenticated])
 def update_booking_stage(request, booking_id):
     """Kanban board drag-and-drop stage updater."""
-    try:
-        booking = Booking.objects.get(id=booking_id)
-    except Booking.DoesNotExist:
-        return Response({'error': 'Booking not found'}, status=404)
+    from .transitions import transition_booking, Payment, TransitionError
 
     new_status = request.data.get('new_status')
-    bay_assignment = request.data.get('bay_assignment', None)
-    assigned_technician_id = request.data.get('assigned_technician_id', None)
-
-    payment_cash = float(request.data.get('payment_cash', 0))
-    payment_upi = float(request.data.get('payment_upi', 0))
-    payment_khata = float(request.data.get('payment_khata', 0))
-
-    if payment_khata > 0 and not booking.customer:
-        customer_name = request.data.get('customer_name')
-        
-        if not customer_name:
-            customer_name = "Walk-In Guest"
-            
-        from customers.models import Customer
-        from django.contrib.auth.models import User
-        import random
-        import string
-        
-        username = f"walkin_khata_{random.randint(100000, 999999)}"
-        while User.objects.filter(username=username).exists():
-            username = f"walkin_khata_{random.randint(100000, 999999)}"
-        
-        pwd = ''.join(random.choices(string.ascii_letters + string.digits, k=12))
-        new_user = User.objects.create(
-            username=username,
-            first_name=customer_name
-        )
-        new_user.set_password(pwd)
-        new_user.save()
-        
-        customer = Customer.objects.create(
-            user=new_user,
-            phone_number=''
-        )
-            
-        booking.customer = customer
-        booking.save()
-
-    valid_statuses = [s[0] for s in Booking.STATUS_CHOICES]
-    if new_status and new_status not in valid_statuses:
-        return Response({'error': f'Invalid status. Valid options: {valid_statuses}'}, status=400)
-
-    if new_status:
-        booking.status = new_status
-    if bay_assignment is not None:
-        booking.bay_assignment = bay_assignment
-    if assigned_technician_id:
-        booking.technician_id = assigned_technician_id
-
-    booking.save()
-
-    # --- NEW: TRIGGER FINANCE & INVOICE GENERATION ---
+    payment = None
     if new_status == 'COMPLETED':
-        if payment_khata > 0 and booking.customer:
-            from finance.models import KhataLedger
-            from decimal import Decimal
-            booking.customer.outstanding_balance += Decimal(payment_khata)
-            booking.customer.save()
-            KhataLedger.objects.create(
-                customer=booking.customer,
-                amount=payment_khata,
-                transaction_type='CHARGE',
-                description=f'Service completed for {booking.vehicle.plate_number if booking.vehicle else "Walk-In"}',
-                related_booking=booking
-            )
+        payment = Payment.from_data(request.data, 'payment_cash', 'payment_upi', 'payment_khata')
 
-        # 1. Generate Invoice (if missing)
-        if not hasattr(booking, 'invoice'):
-            from finance.models import Invoice
-            Invoice.objects.create(
-                booking=booking,
-                amount=booking.service_package.price if booking.service_package else 0.0,
-                split_cash=payment_cash,
-                split_online=payment_upi,
-                split_khata=payment_khata,
-                payment_method='SPLIT' if (payment_cash > 0 and payment_upi > 0) else ('CASH' if payment_cash > 0 else ('ONLINE' if payment_upi > 0 else 'SPLIT')),
-                is_paid=True  # <-- NEW LINE ADDED HERE
-            )
-        else:
-            inv = booking.invoice
-            inv.split_cash = payment_cash
-            inv.split_online = payment_upi
-            inv.split_khata = payment_khata
-            inv.payment_method = 'SPLIT' if (payment_cash > 0 and payment_upi > 0) else ('CASH' if payment_cash > 0 else ('ONLINE' if payment_upi > 0 else 'SPLIT'))
-            inv.is_paid = True  # <-- NEW LINE ADDED HERE
-            inv.save()
-        
-        # 2. Trigger Shop Costs and Worker Payroll
-        from finance.logic import calculate_wash_cost, process_payroll_event
-        try:
-            calculate_wash_cost(booking)
-            process_payroll_event(booking)
-        except Exception as e:
-            print(f"Finance calculation error: {e}")
+    try:
+        booking = transition_booking(
+            booking_id,
+            new_status,
+            bay_assignment=request.data.get('bay_assignment', None),
+            technician_id=request.data.get('assigned_technician_id', None),
+            payment=payment,
+        )
+    except Booking.DoesNotExist:
+        return Response({'error': 'Booking not found'}, status=404)
+    except TransitionError as e:
+        return Response({'error': str(e)}, status=400)
 
     return Response({'status': 'success', 'booking_id': booking.id, 'new_status': booking.status})
 
@@ -459,30 +354,36 @@ def update_booking_stage(request, booking_id):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def live_queue(request):
-    """Fetch all active bookings for the Kanban board (excludes COMPLETED & CANCELLED)."""
-    bookings = Booking.objects.exclude(
-        status__in=['COMPLETED', 'CANCELLED']
-    ).select_related('vehicle', 'customer', 'service_package', 'technician').order_by('time_slot')
+    """
+    Active bookings for the Kanban board (excludes COMPLETED & CANCELLED), served
+    from the in-memory projection. Pass `?since=<cursor>` (the `cursor` / `X-Queue-Seq`
+    of the previous response) to receive only the cards changed or removed since.
+    """
+    from .projections import live_queue_projection
+
+    since = request.GET.get('since')
+    if since is None:
+        seq, cards = live_queue_projection.snapshot()
+        response = Response(cards)
+        response['X-Queue-Seq'] = live_queue_projection.cursor(seq)
+        return response
 
-    data = []
-    for b in bookings:
-        data.append({
-            'id': b.id,
-            'status': b.status,
-            'bay_assignment': b.bay_assignment,
-            'plate_number': b.vehicle.plate_number if b.vehicle else '???',
-            'vehicle_model': b.vehicle.model if b.vehicle else 'Unknown',
-            'service_name': b.service_package.name if b.service_package else 'Walk-In',
-            'customer_name': str(b.customer) if b.customer else 'Walk-In',
-            'customer_id': b.customer.id if b.customer else None,
-            'price': float(b.service_package.price) if b.service_package else 0.0,
-            'technician_name': b.technician.get_full_name() or b.technician.username if b.technician else None,
-            'technician_id': b.technician.id if b.technician else None,
-            'created_at': b.created_at.isoformat() if b.created_at else None,
-            'time_slot': b.time_slot.isoformat() if b.time_slot else None,
-        })
-
-    return Response(data)
+    try:
+        delta = live_queue_projection.changes_since(since)
+    except ValueError:
+        return Response({'error': 'since must be a cursor from a previous response'}, status=400)
+
+    if delta is None:
+        # Cursor is older than the journal, or from another worker or process: resync.
+        seq, cards = live_queue_projection.snapshot()
+        reset, changed, removed = True, cards, []
+    else:
+        seq, changed, removed = delta
+        reset = False
+    cursor = live_queue_projection.cursor(seq)
+    response = Response({'seq': seq, 'cursor': cursor, 'reset': reset, 'changed': changed, 'removed': removed})
+    response['X-Queue-Seq'] = cursor
+    return response
 
 
 @api_view(['GET'])
@@ -494,17 +395,23 @@ def vehicle_crm_history(request):
     if not q:
         return Response({'error': 'Missing query parameter q (License Plate)'}, status=400)
 
-    # Search for either the License Plate OR the Owner's Phone Number
-    vehicles = Vehicle.objects.filter(
-        Q(plate_number__icontains=q) | 
-        Q(owner__phone_number__icontains=q)
-    ).select_related('owner__user')
-    if not vehicles.exists():
+    # Search for either the License Plate OR the Owner's Phone Number, across
+    # POS vehicles and legacy fleet records, best match first.
+    from customers.search import search_vehicles
+    match = next((hit for hit in search_vehicles(q, limit=5) if hit['id']), None)
+    if match is None:
         return Response({'error': 'No matching vehicle found in the system.'}, status=404)
-    
-    vehicle = vehicles.first()
 
-    completed_bookings = Booking.objects.filter(vehicle=vehicle, status='COMPLETED').order_by('-created_at')
+    # Bookings reference CustomerVehicle; a legacy fleet record is matched by plate.
+    if match['source'] == 'customer_vehicle':
+        vehicle_filter = Q(vehicle_id=match['id'])
+    else:
+        vehicle_filter = Q(vehicle__plate_number__iexact=match['plate_number'])
+
+    completed_bookings = (
+        Booking.objects.filter(vehicle_filter, status='COMPLETED')
+        .select_related('service_package', 'technician').order_by('-created_at')
+    )
     
     total_visits = completed_bookings.count()
     total_lifetime_spend = completed_bookings.aggregate(total=Sum('service_package__price'))['total'] or 0
@@ -528,17 +435,16 @@ def vehicle_crm_history(request):
             'price_paid': float(b.service_package.price) if b.service_package else 0.0,
         })
     
-    owner = vehicle.owner
     outstanding_balance = 0.0
-    owner_name = "Unknown Walk-In"
-    
-    if owner:
-        outstanding_balance = float(owner.outstanding_balance) if hasattr(owner, 'outstanding_balance') else 0.0
-        owner_name = owner.user.get_full_name() or owner.user.username if owner.user else "Unknown Walk-In"
-        
+    owner_name = match['customer_name'] or "Unknown Walk-In"
+    if match['customer_id']:
+        outstanding_balance = float(
+            Customer.objects.filter(pk=match['customer_id']).values_list('outstanding_balance', flat=True).first() or 0
+        )
+
     vehicle_profile = {
-        'plate_number': vehicle.plate_number,
-        'model': vehicle.model or "Unknown Model",
+        'plate_number': match['plate_number'],
+        'model': match['model'] or "Unknown Model",
         'owner_name': owner_name,
         'outstanding_balance': outstanding_balance
     }
@@ -651,17 +557,18 @@ def my_assigned_tasks(request):
 @permission_classes([IsAuthenticated])
 def start_task(request, booking_id):
     """Worker starts a wash — sets status to IN_PROGRESS and records start_time."""
+    from .transitions import transition_booking, TransitionError, VALID_STATUSES
     try:
-        booking = Booking.objects.get(pk=booking_id, technician=request.user)
+        booking = transition_booking(
+            booking_id, 'IN_PROGRESS',
+            allowed_from=[s for s in VALID_STATUSES if s != 'IN_PROGRESS'],
+            error='Task is already in progress.',
+            queryset=Booking.objects.filter(technician=request.user),
+        )
     except Booking.DoesNotExist:
         return Response({'error': 'Task not found or not assigned to you.'}, status=404)
-
-    if booking.status == 'IN_PROGRESS':
-        return Response({'error': 'Task is already in progress.'}, status=400)
-
-    booking.status = 'IN_PROGRESS'
-    booking.start_time = timezone.now()
-    booking.save()
+    except TransitionError as e:
+        return Response({'error': str(e)}, status=400)
 
     return Response({'status': 'success', 'message': 'Task started.', 'booking_id': booking.id})
 
@@ -669,17 +576,18 @@ def start_task(request, booking_id):
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 def finish_task(request, booking_id):
-    """Worker finishes a wash — sets status to READY and records end_time."""
+    """Worker finishes a wash — sets status to READY and records finished_at."""
+    from .transitions import transition_booking, TransitionError
     try:
-        booking = Booking.objects.get(pk=booking_id, technician=request.user)
+        booking = transition_booking(
+            booking_id, 'READY',
+            allowed_from=['IN_PROGRESS'],
+            error='Task must be in-progress before finishing.',
+            queryset=Booking.objects.filter(technician=request.user),
+        )
     except Booking.DoesNotExist:
         return Response({'error': 'Task not found or not assigned to you.'}, status=404)
-
-    if booking.status != 'IN_PROGRESS':
-        return Response({'error': 'Task must be in-progress before finishing.'}, status=400)
-
-    booking.status = 'READY'
-    booking.end_time = timezone.now()
-    booking.save()
+    except TransitionError as e:
+        return Response({'error': str(e)}, status=400)
 
     return Response({'status': 'success', 'message': 'Task finished. Manager alerted.', 'booking_id': booking.id})
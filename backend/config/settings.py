@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import sys
+import tempfile
 from pathlib import Path
 from decouple import config, Csv
 
@@ -144,6 +146,28 @@ STRIPE_PUBLISHABLE_KEY = 'pk_test_12345'
 STRIPE_SECRET_KEY = 'sk_test_12345'
 STRIPE_WEBHOOK_SECRET = 'whsec_12345'
 
+# Shop floor & scheduling
+SHOP_OPENING_HOUR = 9
+SHOP_CLOSING_HOUR = 18
+BOOKING_SLOT_MINUTES = 60
+SERVICE_BAYS = ['Bay 1', 'Bay 2']
+
+# Invoice PDFs
+# Rendered PDFs are cached on disk by content hash (see finance.pdfs); checkout
+# pre-renders them in a small process pool.
+INVOICE_PDF_CACHE_DIR = config('INVOICE_PDF_CACHE_DIR', default=str(BASE_DIR / 'media' / 'invoice_pdfs'))
+INVOICE_PDF_WORKERS = config('INVOICE_PDF_WORKERS', default=2, cast=int)
+INVOICE_PDF_PRERENDER = config('INVOICE_PDF_PRERENDER', default=True, cast=bool)
+if 'test' in sys.argv[1:2]:
+    # Test checkouts must not start the render pool or write into media/
+    INVOICE_PDF_PRERENDER = False
+    INVOICE_PDF_CACHE_DIR = tempfile.mkdtemp(prefix='invoice_pdfs_')
+
+# Closed registers
+# Replaced whenever a day is closed or reopened, so every worker process
+# reloads its in-memory set of locked dates (see finance.register_lock).
+REGISTER_LOCK_VERSION_FILE = config('REGISTER_LOCK_VERSION_FILE', default=str(BASE_DIR / 'register_lock.version'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/6.0/ref/settings/#default-auto-field
 
@@ -166,9 +190,22 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Live queue (Kanban / TV boards)
+LIVE_QUEUE_JOURNAL_SIZE = 1024
+LIVE_QUEUE_MAX_AGE_SECONDS = 30
+LIVE_QUEUE_COALESCE_SECONDS = 0.25
+
 # Channels
+# SQLite-backed layer so group_send from gunicorn workers reaches WebSocket
+# clients held by daphne on the same host (see core.channel_layers).
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
+        "BACKEND": config('CHANNEL_LAYER_BACKEND', default='core.channel_layers.SQLiteChannelLayer'),
+        "CONFIG": {
+            "path": config('CHANNEL_LAYER_PATH', default=str(BASE_DIR / 'channels.sqlite3')),
+            "expiry": 60,
+            "group_expiry": 86400,
+            "capacity": 100,
+        },
     }
 }
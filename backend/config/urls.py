@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from customers.views import CustomerViewSet, SubscriptionPlanViewSet, ReviewViewSet, CouponViewSet, CustomerVehicleViewSet
+from customers.views import CustomerViewSet, SubscriptionPlanViewSet, ReviewViewSet, CouponViewSet, CustomerVehicleViewSet, vehicle_typeahead
 from fleet.views import VehicleViewSet, TechnicianLocationViewSet, ServiceVehicleViewSet, FleetLogViewSet
 from bookings.views import BookingViewSet, ServicePackageViewSet, CalendarViewSet, DriverBookingViewSet
 from finance.views import InvoiceViewSet, DashboardViewSet, GeneralExpenseViewSet, ExpenseCategoryViewSet, ReportingViewSet, KhataViewSet, close_register, analytics_dashboard, generate_invoice_pdf, manual_khata_charge
@@ -54,5 +54,6 @@ urlpatterns = [
     path('api/finance/analytics/', analytics_dashboard, name='analytics-dashboard'),
     path('api/finance/invoice/<int:booking_id>/pdf/', generate_invoice_pdf, name='invoice-pdf'),
     path('api/finance/khata/manual-charge/', manual_khata_charge, name='manual-khata-charge'),
+    path('api/vehicle-search/', vehicle_typeahead, name='vehicle-search'),
     path('api/', include(router.urls)),
 ]
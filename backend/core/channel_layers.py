@@ -0,0 +1,275 @@
+"""
+SQLite-backed channel layer for running several processes on one host without Redis.
+
+InMemoryChannelLayer only delivers within one process, so group_send calls made
+from gunicorn workers never reach WebSocket clients held by daphne. This layer
+keeps messages and group membership in a small SQLite database (WAL mode)
+shared by every process on the box:
+
+* group_send fans a message out to all members with one INSERT ... SELECT,
+  skipping members that are at capacity (the same semantics as the other layers).
+* Each process runs a single poller that collects messages for every channel it
+  is currently receiving on in one query, so polling cost does not grow with the
+  number of connected boards.
+* Messages expire after `expiry` seconds and group memberships after
+  `group_expiry`. A channel whose messages expire unread is dropped from its
+  groups, like InMemoryChannelLayer does.
+"""
+import asyncio
+import base64
+import json
+import random
+import sqlite3
+import string
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    body TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channel_messages_channel_idx ON channel_messages (channel, id);
+CREATE TABLE IF NOT EXISTS channel_groups (
+    group_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (group_name, channel)
+);
+"""
+
+
+def _encode(message):
+    def default(value):
+        if isinstance(value, (bytes, bytearray)):
+            return {'__bytes__': base64.b64encode(value).decode('ascii')}
+        raise TypeError(f"{type(value).__name__} is not serializable over the channel layer")
+    return json.dumps(message, default=default, separators=(',', ':'))
+
+
+def _decode(body):
+    def object_hook(value):
+        if len(value) == 1 and '__bytes__' in value:
+            return base64.b64decode(value['__bytes__'])
+        return value
+    return json.loads(body, object_hook=object_hook)
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ["groups", "flush"]
+
+    def __init__(
+        self,
+        path='channels.sqlite3',
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        poll_interval=0.005,
+        max_poll_interval=0.05,
+        cleanup_interval=5,
+        **kwargs,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.cleanup_interval = cleanup_interval
+
+        # All SQLite work for this layer runs on one thread with one connection.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-channel-layer')
+        self._local = threading.local()
+        self._last_cleanup = 0.0
+
+        # Process-local receive state: per-channel inboxes fed by a single poller.
+        self._inboxes = {}
+        self._waiting = Counter()
+        self._poller = None
+        self._poller_loop = None
+
+    # --- SQLite plumbing ---------------------------------------------------
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _maybe_cleanup(self, conn, now):
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'DELETE FROM channel_groups WHERE expires < ? OR channel IN '
+                '(SELECT DISTINCT channel FROM channel_messages WHERE expires < ?)',
+                (now, now),
+            )
+            conn.execute('DELETE FROM channel_messages WHERE expires < ?', (now,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # --- Channel layer API -------------------------------------------------
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert "__asgi_channel__" not in message
+        sent = await self._run(self._send, channel, _encode(message), self.get_capacity(channel))
+        if not sent:
+            raise ChannelFull(channel)
+
+    def _send(self, channel, body, capacity):
+        conn = self._connection()
+        now = time.time()
+        self._maybe_cleanup(conn, now)
+        cursor = conn.execute(
+            'INSERT INTO channel_messages (channel, body, expires) SELECT ?, ?, ? '
+            'WHERE (SELECT COUNT(*) FROM channel_messages WHERE channel = ? AND expires >= ?) < ?',
+            (channel, body, now + self.expiry, channel, now, capacity),
+        )
+        return cursor.rowcount == 1
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        inbox = self._inboxes.get(channel)
+        if inbox is None:
+            inbox = self._inboxes[channel] = asyncio.Queue()
+        self._waiting[channel] += 1
+        self._ensure_poller()
+        try:
+            return await inbox.get()
+        finally:
+            self._waiting[channel] -= 1
+            if self._waiting[channel] <= 0:
+                del self._waiting[channel]
+                if inbox.empty():
+                    self._inboxes.pop(channel, None)
+
+    async def new_channel(self, prefix="specific."):
+        return "%s.sqlite!%s" % (
+            prefix,
+            "".join(random.choice(string.ascii_letters) for i in range(12)),
+        )
+
+    def _ensure_poller(self):
+        loop = asyncio.get_running_loop()
+        if self._poller is None or self._poller.done() or self._poller_loop is not loop:
+            self._poller_loop = loop
+            self._poller = loop.create_task(self._poll())
+
+    async def _poll(self):
+        delay = self.poll_interval
+        while self._waiting:
+            channels = list(self._waiting)
+            rows = await self._run(self._take, channels)
+            for channel, body in rows:
+                inbox = self._inboxes.get(channel)
+                if inbox is not None:
+                    inbox.put_nowait(_decode(body))
+            if rows:
+                delay = self.poll_interval
+            else:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+
+    def _take(self, channels):
+        conn = self._connection()
+        now = time.time()
+        placeholders = ','.join('?' * len(channels))
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                f'DELETE FROM channel_messages WHERE channel IN ({placeholders}) AND expires >= ? '
+                f'RETURNING id, channel, body',
+                (*channels, now),
+            ).fetchall()
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        rows.sort()
+        return [(channel, body) for _, channel, body in rows]
+
+    # --- Flush extension ---------------------------------------------------
+
+    async def flush(self):
+        await self._run(self._flush)
+
+    def _flush(self):
+        conn = self._connection()
+        conn.execute('DELETE FROM channel_messages')
+        conn.execute('DELETE FROM channel_groups')
+
+    async def close(self):
+        pass
+
+    # --- Groups extension --------------------------------------------------
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._run(self._group_add, group, channel)
+
+    def _group_add(self, group, channel):
+        self._connection().execute(
+            'INSERT INTO channel_groups (group_name, channel, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (group_name, channel) DO UPDATE SET expires = excluded.expires',
+            (group, channel, time.time() + self.group_expiry),
+        )
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        await self._run(self._group_discard, group, channel)
+
+    def _group_discard(self, group, channel):
+        self._connection().execute(
+            'DELETE FROM channel_groups WHERE group_name = ? AND channel = ?', (group, channel)
+        )
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        await self._run(self._group_send, group, _encode(message))
+
+    def _group_send(self, group, body):
+        conn = self._connection()
+        now = time.time()
+        self._maybe_cleanup(conn, now)
+        if not self.channel_capacity:
+            # One statement fans out to every member that still has room.
+            conn.execute(
+                'INSERT INTO channel_messages (channel, body, expires) '
+                'SELECT g.channel, ?, ? FROM channel_groups g '
+                'WHERE g.group_name = ? AND g.expires >= ? AND '
+                '(SELECT COUNT(*) FROM channel_messages m WHERE m.channel = g.channel AND m.expires >= ?) < ?',
+                (body, now + self.expiry, group, now, now, self.capacity),
+            )
+            return
+
+        members = conn.execute(
+            'SELECT channel FROM channel_groups WHERE group_name = ? AND expires >= ?', (group, now)
+        ).fetchall()
+        for (channel,) in members:
+            self._send(channel, body, self.get_capacity(channel))
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from core.channel_layers import SQLiteChannelLayer
+
+
+class Command(BaseCommand):
+    help = 'Measures group_send/receive throughput of the SQLite channel layer against the in-memory layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500, help='Messages sent to the group')
+        parser.add_argument('--consumers', type=int, default=5, help='Channels subscribed to the group')
+
+    def handle(self, *args, **options):
+        messages, consumers = options['messages'], options['consumers']
+        with tempfile.TemporaryDirectory() as tmp:
+            layers = [
+                ('in-memory', InMemoryChannelLayer(capacity=messages)),
+                ('sqlite', SQLiteChannelLayer(path=os.path.join(tmp, 'bench.sqlite3'), capacity=messages)),
+            ]
+            for name, layer in layers:
+                elapsed = asyncio.run(self.run_benchmark(layer, messages, consumers))
+                delivered = messages * consumers
+                self.stdout.write(
+                    f'{name:>10}: {messages} group_send x {consumers} consumers in {elapsed:.3f}s '
+                    f'({messages / elapsed:,.0f} sends/s, {delivered / elapsed:,.0f} deliveries/s)'
+                )
+
+    async def run_benchmark(self, layer, messages, consumers):
+        channels = [await layer.new_channel() for _ in range(consumers)]
+        for channel in channels:
+            await layer.group_add('benchmark', channel)
+
+        async def drain(channel):
+            for _ in range(messages):
+                await layer.receive(channel)
+
+        started = time.perf_counter()
+        receivers = asyncio.gather(*(drain(channel) for channel in channels))
+        for n in range(messages):
+            await layer.group_send('benchmark', {'type': 'queue.update', 'seq': n, 'data': {'id': n}})
+        await receivers
+        elapsed = time.perf_counter() - started
+
+        await layer.flush()
+        return elapsed
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from finance.exports import zip_chunks
+from finance.pdfs import engine
+from finance.reports import invoice_pdf_entries
+
+
+class Command(BaseCommand):
+    help = 'Writes the PDFs of every invoice in a period (optionally of one customer) to a ZIP file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', required=True, help='First invoice date (YYYY-MM-DD)')
+        parser.add_argument('--end', required=True, help='Last invoice date (YYYY-MM-DD)')
+        parser.add_argument('--customer', type=int, help='Only this customer id')
+        parser.add_argument('--output', help='ZIP file to write. Defaults to invoices_<start>_<end>.zip')
+        parser.add_argument('--workers', type=int, help='Render processes. Defaults to the number of CPUs.')
+
+    def handle(self, *args, **options):
+        start, end = (self._date(options[name], name) for name in ('start', 'end'))
+        if start > end:
+            raise CommandError('--start must not be after --end')
+        if engine() is None:
+            raise CommandError('PDF generation not available (install WeasyPrint or xhtml2pdf).')
+
+        output = options['output'] or f'invoices_{start}_{end}.zip'
+        entries = invoice_pdf_entries(start, end, options['customer'], workers=options['workers'])
+
+        count = 0
+
+        def counted():
+            nonlocal count
+            for entry in entries:
+                count += entry[0].endswith('.pdf')
+                yield entry
+
+        started = time.perf_counter()
+        with open(output, 'wb') as f:
+            for chunk in zip_chunks(counted()):
+                f.write(chunk)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} invoice PDF(s) to {output} in {elapsed:.1f}s.'))
+
+    def _date(self, value, name):
+        parsed = parse_date(value)
+        if parsed is None:
+            raise CommandError(f'--{name} must be a date in YYYY-MM-DD format')
+        return parsed
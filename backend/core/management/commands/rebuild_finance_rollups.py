@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from finance.rollups import rebuild_chemical_usage, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recomputes DailyFinanceRollup rows from invoices, chemical usage, payroll and expenses, and ChemicalDailyUsage rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD). Defaults to the earliest data.')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD). Defaults to the latest data.')
+
+    def handle(self, *args, **options):
+        start, end = (self._date(options[name], name) for name in ('start', 'end'))
+        if start and end and start > end:
+            raise CommandError('--start must not be after --end')
+        days = rebuild_rollups(start, end)
+        rebuild_chemical_usage(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt finance rollups for {days} day(s).'))
+
+    def _date(self, value, name):
+        if value is None:
+            return None
+        parsed = parse_date(value)
+        if parsed is None:
+            raise CommandError(f'--{name} must be a date in YYYY-MM-DD format')
+        return parsed
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from customers.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the plate/phone typeahead index from customer vehicles, fleet vehicles and customer phones'
+
+    def handle(self, *args, **kwargs):
+        written = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {written} search keys.'))
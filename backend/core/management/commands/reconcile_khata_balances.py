@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from finance.khata import reconcile
+
+
+class Command(BaseCommand):
+    help = "Compares every customer's outstanding khata balance with their KhataLedger sum and reports drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Set drifting balances to the ledger sum.')
+        parser.add_argument('--show', type=int, default=20, help='How many drifting customers to list (largest first).')
+
+    def handle(self, *args, **options):
+        drifted = reconcile(fix=options['fix'])
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('All khata balances match the ledger.'))
+            return
+
+        total = sum(row['drift'] for row in drifted)
+        self.stdout.write(self.style.WARNING(f'{len(drifted)} customer(s) drift from the ledger, net ₹{total}.'))
+        for row in sorted(drifted, key=lambda r: abs(r['drift']), reverse=True)[:options['show']]:
+            self.stdout.write(
+                f"  customer {row['customer_id']}: stored ₹{row['stored']}, ledger ₹{row['ledger']}, drift ₹{row['drift']}"
+                + ('' if 'fixed' not in row else ' (fixed)' if row['fixed'] else ' (changed meanwhile, not fixed)')
+            )
+        if options['fix']:
+            fixed = sum(1 for row in drifted if row['fixed'])
+            self.stdout.write(self.style.SUCCESS(f'Fixed {fixed} balance(s).'))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from finance.payroll import PERIODS, run_payroll
+
+
+class Command(BaseCommand):
+    help = 'Computes and stores PayrollEntry rows for every staff member over a day, week or month (safe to re-run)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', default='DAY', type=str.upper, choices=PERIODS)
+        parser.add_argument('--date', help='Any day in the period (YYYY-MM-DD). Defaults to today.')
+
+    def handle(self, *args, **options):
+        day = timezone.localdate()
+        if options['date']:
+            day = parse_date(options['date'])
+            if day is None:
+                raise CommandError('--date must be a date in YYYY-MM-DD format')
+
+        started = time.perf_counter()
+        run = run_payroll(options['period'], day)
+        self.stdout.write(self.style.SUCCESS(
+            f'{run}: {run.entry_count} entries, wages ₹{run.total_wages}, commission ₹{run.total_commission}, '
+            f'advances ₹{run.total_advances} ({time.perf_counter() - started:.2f}s)'
+        ))
@@ -1,11 +1,13 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from bookings.models import ServicePackage, Booking
-from finance.models import ExpenseCategory, GeneralExpense
+from finance.models import ExpenseCategory, GeneralExpense, ChemicalInventory
+from finance.logic import set_recipe
 from fleet.models import Vehicle
 from django.contrib.auth.models import User
 import random
 from datetime import timedelta
+from decimal import Decimal
 
 class Command(BaseCommand):
     help = 'Seeds the database with initial data for demo'
@@ -15,9 +17,21 @@ class Command(BaseCommand):
 
         # 1. Service Packages
         if not ServicePackage.objects.exists():
-            ServicePackage.objects.create(name="Gold Wash", price=50.00, description="Exterior wash + Wax + Interior Vacuum", duration_minutes=60, chemical_recipe={'soap': 0.5, 'wax': 0.2})
-            ServicePackage.objects.create(name="Silver Wash", price=30.00, description="Exterior wash + Interior Vacuum", duration_minutes=45, chemical_recipe={'soap': 0.4})
-            ServicePackage.objects.create(name="Platinum Detail", price=120.00, description="Full Detail + Polish + Steam Clean", duration_minutes=120, chemical_recipe={'soap': 1.0, 'polish': 0.5, 'shampoo': 0.5})
+            chemicals = {}
+            for name, cost in [('soap', 2), ('wax', 8), ('polish', 10), ('shampoo', 4)]:
+                chemicals[name], _ = ChemicalInventory.objects.get_or_create(
+                    name=name, defaults={'current_volume': 500, 'cost_per_unit': cost, 'uom': 'oz'}
+                )
+            recipes = {
+                'Gold Wash': {'soap': 0.5, 'wax': 0.2},
+                'Silver Wash': {'soap': 0.4},
+                'Platinum Detail': {'soap': 1.0, 'polish': 0.5, 'shampoo': 0.5},
+            }
+            ServicePackage.objects.create(name="Gold Wash", price=50.00, description="Exterior wash + Wax + Interior Vacuum", duration_minutes=60)
+            ServicePackage.objects.create(name="Silver Wash", price=30.00, description="Exterior wash + Interior Vacuum", duration_minutes=45)
+            ServicePackage.objects.create(name="Platinum Detail", price=120.00, description="Full Detail + Polish + Steam Clean", duration_minutes=120)
+            for package in ServicePackage.objects.all():
+                set_recipe(package, {chemicals[name]: Decimal(str(amount)) for name, amount in recipes[package.name].items()})
             self.stdout.write(self.style.SUCCESS("Created Service Packages"))
         
         # 2. Expense Categories
@@ -2,3 +2,43 @@ from django.db import models
 from django.contrib.auth.models import User
 
 
+
+class ChangeTrackingMixin:
+    """
+    Remembers the values of `tracked_fields` as they were loaded from (or last
+    saved to) the database, so save hooks can tell what changed without
+    re-reading the row. List foreign keys by attname (e.g. 'technician_id').
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_tracked_fields()
+        return instance
+
+    def _snapshot_tracked_fields(self):
+        # Deferred fields are simply not tracked; callers fall back to a query.
+        self._loaded_values = {
+            name: self.__dict__[name] for name in self.tracked_fields if name in self.__dict__
+        }
+
+    def is_tracked(self, name):
+        return name in getattr(self, '_loaded_values', {})
+
+    def loaded_value(self, name, default=None):
+        return getattr(self, '_loaded_values', {}).get(name, default)
+
+    def has_changed(self, name):
+        """True for unsaved instances, untracked fields, or values that differ from what was loaded."""
+        if self._state.adding or not self.is_tracked(name):
+            return True
+        return self._loaded_values[name] != getattr(self, name)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_tracked_fields()
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._snapshot_tracked_fields()
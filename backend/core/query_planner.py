@@ -0,0 +1,131 @@
+"""
+Automatic select_related / prefetch_related for serializer-backed viewsets.
+
+A serializer that reads `customer.user.first_name` or nests a related
+serializer costs one query per row unless the queryset joins or prefetches that
+relation. QueryPlannerMixin reads the serializer's fields once (their `source`
+paths, nested serializers and related fields) and applies the joins to every
+queryset the viewset serves, so list endpoints run a fixed number of queries
+whatever the page size.
+
+SerializerMethodFields are opaque, so a serializer declares what they read in
+`Meta.related_hints`, keyed by field name:
+
+    class Meta:
+        related_hints = {'invoice_status': ['invoice']}
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import ForeignObjectRel
+from rest_framework import serializers
+
+_plans = {}
+
+
+class QueryPlan:
+    def __init__(self, select=(), prefetch=()):
+        self.select = sorted(set(select))
+        self.prefetch = sorted(set(prefetch))
+
+    def apply(self, queryset):
+        if self.select:
+            queryset = queryset.select_related(*self.select)
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch)
+        return queryset
+
+
+def plan_for(serializer_class):
+    """The (cached) QueryPlan covering everything `serializer_class` reads from its model."""
+    if serializer_class not in _plans:
+        select, prefetch = set(), set()
+        model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+        if model is not None:
+            _walk_serializer(serializer_class(), model, (), False, select, prefetch)
+        _plans[serializer_class] = QueryPlan(_leaves(select), _leaves(prefetch))
+    return _plans[serializer_class]
+
+
+def _leaves(paths):
+    # 'customer__user' already joins 'customer'; keep only the longest paths.
+    return [p for p in paths if not any(other.startswith(p + '__') for other in paths)]
+
+
+def _walk_serializer(serializer, model, prefix, many, select, prefetch):
+    hints = getattr(getattr(serializer, 'Meta', None), 'related_hints', {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField):
+            for hint in hints.get(name, ()):
+                _add_path(model, prefix, hint.replace('__', '.').split('.'), many, select, prefetch)
+            continue
+        if field.source == '*':
+            if isinstance(field, serializers.BaseSerializer):
+                _walk_serializer(field, model, prefix, many, select, prefetch)
+            continue
+
+        attrs = list(field.source_attrs)
+        if isinstance(field, serializers.ListSerializer):
+            target = _add_path(model, prefix, attrs, many, select, prefetch)
+            if target:
+                _walk_serializer(field.child, target[0], target[1], True, select, prefetch)
+        elif isinstance(field, serializers.BaseSerializer):
+            target = _add_path(model, prefix, attrs, many, select, prefetch)
+            if target:
+                _walk_serializer(field, target[0], target[1], target[2], select, prefetch)
+        elif isinstance(field, serializers.ManyRelatedField):
+            _add_path(model, prefix, attrs, many, select, prefetch)
+        elif isinstance(field, serializers.RelatedField):
+            if field.use_pk_only_optimization():
+                # A plain FK id column needs no join; only the hops before it do.
+                attrs = attrs[:-1]
+            _add_path(model, prefix, attrs, many, select, prefetch)
+        else:
+            _add_path(model, prefix, attrs, many, select, prefetch)
+
+
+def _add_path(model, prefix, attrs, many, select, prefetch):
+    """
+    Record the relations along `attrs` starting at `model`. Returns
+    (model, path, many) for the last relation reached, or None if the path
+    leaves the model's relations (a plain column, property or method).
+    """
+    path = list(prefix)
+    reached = None
+    for attr in attrs:
+        field = _relation(model, attr)
+        if field is None:
+            break
+        # Reverse relations are joined/prefetched by their accessor name.
+        path.append(field.get_accessor_name() if isinstance(field, ForeignObjectRel) else field.name)
+        many = many or field.many_to_many or field.one_to_many
+        (prefetch if many else select).add('__'.join(path))
+        model = field.related_model
+        reached = (model, tuple(path), many)
+    return reached
+
+
+def _relation(model, attr):
+    for name in (attr, attr[:-4] if attr.endswith('_set') else None):
+        if not name:
+            continue
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.is_relation and field.related_model is not None:
+            return field
+        return None
+    return None
+
+
+class QueryPlannerMixin:
+    """
+    Applies the serializer's QueryPlan to every queryset the viewset serves
+    (list, retrieve and the object lookup behind update/destroy). Hooks
+    filter_queryset so it also covers viewsets that override get_queryset.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return plan_for(self.get_serializer_class()).apply(queryset)
@@ -1,3 +1,146 @@
-from django.test import TestCase
+import asyncio
+import os
+import tempfile
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.mixins import ListModelMixin
+from rest_framework.test import APIClient
+
+from core.channel_layers import SQLiteChannelLayer
+from core.query_planner import QueryPlannerMixin
+
+
+class SQLiteChannelLayerTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'channels.sqlite3')
+
+    def layer(self, **kwargs):
+        return SQLiteChannelLayer(path=self.path, **kwargs)
+
+    def test_group_send_reaches_channels_held_by_another_process(self):
+        sender, receiver = self.layer(), self.layer()
+
+        async def scenario():
+            first = await receiver.new_channel()
+            second = await receiver.new_channel()
+            await receiver.group_add('live_queue', first)
+            await receiver.group_add('live_queue', second)
+
+            await sender.group_send('live_queue', {'type': 'queue.update', 'data': {'id': 1}, 'raw': b'\x00'})
+            await receiver.group_discard('live_queue', second)
+            await sender.group_send('live_queue', {'type': 'queue.update', 'data': {'id': 2}})
+
+            got = [await asyncio.wait_for(receiver.receive(first), 2) for _ in range(2)]
+            other = await asyncio.wait_for(receiver.receive(second), 2)
+            return got, other
+
+        got, other = async_to_sync(scenario)()
+        self.assertEqual([m['data']['id'] for m in got], [1, 2])
+        self.assertEqual(got[0]['raw'], b'\x00')
+        self.assertEqual(other['data'], {'id': 1})
+
+    def test_capacity_and_expiry(self):
+        layer = self.layer(capacity=2, expiry=60)
+
+        async def scenario():
+            channel = await layer.new_channel()
+            await layer.send(channel, {'type': 'a'})
+            await layer.send(channel, {'type': 'b'})
+            with self.assertRaises(ChannelFull):
+                await layer.send(channel, {'type': 'c'})
+
+            # Group sends skip full members instead of raising.
+            await layer.group_add('g', channel)
+            await layer.group_send('g', {'type': 'd'})
+            return [(await layer.receive(channel))['type'] for _ in range(2)]
+
+        self.assertEqual(async_to_sync(scenario)(), ['a', 'b'])
+
+        expiring = self.layer(expiry=0, cleanup_interval=0)
+
+        async def expired():
+            channel = await expiring.new_channel()
+            await expiring.group_add('g', channel)
+            await expiring.send(channel, {'type': 'stale'})
+            await asyncio.sleep(0.01)
+            # Cleanup drops the unread message and the member that never read it.
+            await expiring.group_send('g', {'type': 'fresh'})
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(expiring.receive(channel), 0.2)
+
+        async_to_sync(expired)()
+
+
+class QueryPlannerTest(TestCase):
+    # List endpoints that serialize related rows.
+    LIST_URLS = [
+        '/api/bookings/',
+        '/api/calendar/',
+        '/api/finance/invoices/',
+        '/api/finance/general-expenses/',
+        '/api/customers/',
+        '/api/staff/profiles/',
+        '/api/staff/directory/',
+        '/api/core/users/',
+        '/api/core/staff/',
+    ]
+
+    def setUp(self):
+        from bookings.models import ServicePackage
+        self.admin = User.objects.create_superuser(username='admin', password='password')
+        self.package = ServicePackage.objects.create(name='Basic Wash', price=10, duration_minutes=60, description='Basic')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.rows = 0
+
+    def add_rows(self, count):
+        from bookings.models import Booking
+        from customers.models import Customer, CustomerVehicle
+        from finance.models import ExpenseCategory, GeneralExpense, Invoice
+        from staff.models import StaffProfile
+
+        for _ in range(count):
+            n = self.rows = self.rows + 1
+            owner = User.objects.create_user(username=f'cust{n}', first_name=f'Customer {n}')
+            customer = Customer.objects.create(user=owner)
+            vehicle = CustomerVehicle.objects.create(customer=owner, make='Test', model='Car', plate_number=f'QP-{n}')
+            tech = User.objects.create_user(username=f'tech{n}')
+            StaffProfile.objects.create(user=tech, role='WASHER')
+            booking = Booking.objects.create(customer=customer, vehicle=vehicle, technician=tech,
+                                             service_package=self.package, time_slot=timezone.now())
+            Invoice.objects.create(booking=booking, amount=10)
+            category = ExpenseCategory.objects.create(name=f'Category {n}')
+            GeneralExpense.objects.create(category=category, amount=5, description='Soap', recorded_by=tech,
+                                          date=timezone.localdate())
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        self.add_rows(1)
+        small = {url: self.count_queries(url) for url in self.LIST_URLS}
+        self.add_rows(5)
+        for url in self.LIST_URLS:
+            self.assertEqual(self.count_queries(url), small[url], f'{url} issues per-row queries')
+
+    def test_every_list_viewset_uses_the_planner(self):
+        from config.urls import router as api_router
+        from bookings.urls import router as bookings_router
+        from core.urls import router as core_router
+        from staff.urls import router as staff_router
+
+        for router in (api_router, bookings_router, core_router, staff_router):
+            for prefix, viewset, basename in router.registry:
+                if issubclass(viewset, ListModelMixin):
+                    self.assertTrue(issubclass(viewset, QueryPlannerMixin), f'{viewset.__name__} ({prefix})')
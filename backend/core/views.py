@@ -4,8 +4,9 @@ from rest_framework.response import Response
 from django.contrib.auth.models import User
 from staff.models import StaffProfile
 from .serializers import UserSerializer, StaffProfileSerializer, StaffCreateSerializer
+from core.query_planner import QueryPlannerMixin
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     # permission_classes = [permissions.IsAuthenticated] # Commented out for easier testing initially
@@ -33,7 +34,7 @@ class UserViewSet(viewsets.ModelViewSet):
             
         return Response(data)
 
-class StaffViewSet(viewsets.ModelViewSet):
+class StaffViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = StaffProfile.objects.all()
     serializer_class = StaffProfileSerializer
     # permission_classes = [permissions.IsAuthenticated]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:37
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copy of customers.search as of this migration, so later changes to it can't alter what this step did.
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 32
+BATCH_SIZE = 5000
+
+
+def plate_key(value):
+    return re.sub(r'[^A-Z0-9]', '', (value or '').upper())[:MAX_TERM_LENGTH]
+
+
+def phone_digits(value):
+    return re.sub(r'\D', '', value or '')[:MAX_TERM_LENGTH]
+
+
+def build_search_index(apps, schema_editor):
+    """One VehicleSearchKey per key and each suffix of at least MIN_TERM_LENGTH characters."""
+    SearchKey = apps.get_model('customers', 'VehicleSearchKey')
+    sources = [
+        ('CUSTOMER_VEHICLE', apps.get_model('customers', 'CustomerVehicle'), 'plate_number', plate_key),
+        ('FLEET_VEHICLE', apps.get_model('fleet', 'Vehicle'), 'plate_number', plate_key),
+        ('CUSTOMER', apps.get_model('customers', 'Customer'), 'phone_number', phone_digits),
+    ]
+    for source, model, field, normalize in sources:
+        batch = []
+        for object_id, value in model.objects.values_list('id', field).iterator(chunk_size=BATCH_SIZE):
+            key = normalize(value)
+            batch.extend(
+                SearchKey(term=key[i:], is_prefix=i == 0, source=source, object_id=object_id)
+                for i in range(0, max(1, len(key) - MIN_TERM_LENGTH + 1)) if key[i:]
+            )
+            if len(batch) >= BATCH_SIZE:
+                SearchKey.objects.bulk_create(batch)
+                batch = []
+        SearchKey.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customers', '0005_customervehicle'),
+        ('fleet', '0003_servicevehicle_fleetlog_vehicleassignment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleSearchKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=32)),
+                ('is_prefix', models.BooleanField(default=True, help_text='True when term is the whole key, not a later suffix')),
+                ('source', models.CharField(choices=[('CUSTOMER_VEHICLE', 'Customer Vehicle'), ('FLEET_VEHICLE', 'Fleet Vehicle'), ('CUSTOMER', 'Customer')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('is_prefix', True)), fields=['term'], name='vehicle_search_prefix_idx'), models.Index(condition=models.Q(('is_prefix', False)), fields=['term'], name='vehicle_search_suffix_idx'), models.Index(fields=['source', 'object_id'], name='vehicle_search_object_idx')],
+            },
+        ),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from core.models import ChangeTrackingMixin
 
 class SubscriptionPlan(models.Model):
     name = models.CharField(max_length=100)
@@ -11,7 +12,7 @@ class SubscriptionPlan(models.Model):
     def __str__(self):
         return f"{self.name} (₹{self.price})"
 
-class Customer(models.Model):
+class Customer(ChangeTrackingMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone_number = models.CharField(max_length=15, blank=True)
     address = models.TextField(blank=True)
@@ -19,6 +20,9 @@ class Customer(models.Model):
     outstanding_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     credit_limit = models.DecimalField(max_digits=10, decimal_places=2, default=5000.00)
 
+    # Lets the search index skip re-indexing on saves that leave the phone alone.
+    tracked_fields = ('phone_number',)
+
     def __str__(self):
         return self.user.username
 
@@ -72,3 +76,32 @@ class CustomerVehicle(models.Model):
 
     def __str__(self):
         return f"{self.make} {self.model} ({self.plate_number})"
+
+class VehicleSearchKey(models.Model):
+    """
+    Typeahead index over plates and phone numbers (see customers.search).
+    Each plate key / phone digit string is stored with all of its suffixes, so
+    a substring search becomes an indexed prefix range scan.
+    """
+    SOURCE_CHOICES = [
+        ('CUSTOMER_VEHICLE', 'Customer Vehicle'),
+        ('FLEET_VEHICLE', 'Fleet Vehicle'),
+        ('CUSTOMER', 'Customer'),
+    ]
+
+    term = models.CharField(max_length=32)
+    is_prefix = models.BooleanField(default=True, help_text="True when term is the whole key, not a later suffix")
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    object_id = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            # One partial index per tier: Django renders is_prefix=False as
+            # "NOT is_prefix", which a composite (is_prefix, term) index can't seek on.
+            models.Index(fields=['term'], condition=models.Q(is_prefix=True), name='vehicle_search_prefix_idx'),
+            models.Index(fields=['term'], condition=models.Q(is_prefix=False), name='vehicle_search_suffix_idx'),
+            models.Index(fields=['source', 'object_id'], name='vehicle_search_object_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.term} -> {self.source} #{self.object_id}"
@@ -0,0 +1,177 @@
+"""
+Plate / phone typeahead for the POS counter.
+
+Walk-ins are written to customers.CustomerVehicle, older records live in
+fleet.Vehicle, and phone numbers sit on Customer. All three feed one
+VehicleSearchKey table holding normalized keys: plates uppercased with spaces
+and dashes stripped, phones reduced to digits. Every key is stored with its
+suffixes (down to MIN_TERM_LENGTH), so "1234" finds "KL07AB1234" via an
+indexed range scan instead of a LIKE '%...%' table scan.
+
+Matches are ranked in tiers, each a LIMITed scan of a partial index on term:
+exact key, then keys starting with the query, then keys containing it.
+"""
+import re
+
+from django.apps import apps as global_apps
+from django.db import transaction
+
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 32
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+_PLATE_JUNK = re.compile(r'[^A-Z0-9]')
+_NON_DIGITS = re.compile(r'\D')
+
+
+def plate_key(value):
+    return _PLATE_JUNK.sub('', (value or '').upper())[:MAX_TERM_LENGTH]
+
+
+def phone_digits(value):
+    return _NON_DIGITS.sub('', value or '')[:MAX_TERM_LENGTH]
+
+
+def _terms(key):
+    """(term, is_prefix) for the key and each suffix long enough to be typed."""
+    return [(key[i:], i == 0) for i in range(0, max(1, len(key) - MIN_TERM_LENGTH + 1)) if key[i:]]
+
+
+def _entries(model, source, object_id, key):
+    return [model(term=term, is_prefix=is_prefix, source=source, object_id=object_id) for term, is_prefix in _terms(key)]
+
+
+# --- Index maintenance -------------------------------------------------------
+
+def index_object(source, object_id, key, apps=global_apps):
+    SearchKey = apps.get_model('customers', 'VehicleSearchKey')
+    with transaction.atomic():
+        SearchKey.objects.filter(source=source, object_id=object_id).delete()
+        if key:
+            SearchKey.objects.bulk_create(_entries(SearchKey, source, object_id, key))
+
+
+def unindex_object(source, object_id, apps=global_apps):
+    apps.get_model('customers', 'VehicleSearchKey').objects.filter(source=source, object_id=object_id).delete()
+
+
+def rebuild_index(apps=global_apps, batch_size=5000):
+    """Rebuild the whole table from the three source tables. Returns the number of keys written."""
+    SearchKey = apps.get_model('customers', 'VehicleSearchKey')
+    sources = [
+        ('CUSTOMER_VEHICLE', apps.get_model('customers', 'CustomerVehicle'), 'plate_number', plate_key),
+        ('FLEET_VEHICLE', apps.get_model('fleet', 'Vehicle'), 'plate_number', plate_key),
+        ('CUSTOMER', apps.get_model('customers', 'Customer'), 'phone_number', phone_digits),
+    ]
+    written = 0
+    with transaction.atomic():
+        SearchKey.objects.all().delete()
+        for source, model, field, normalize in sources:
+            batch = []
+            for object_id, value in model.objects.values_list('id', field).iterator(chunk_size=batch_size):
+                key = normalize(value)
+                if key:
+                    batch.extend(_entries(SearchKey, source, object_id, key))
+                if len(batch) >= batch_size:
+                    SearchKey.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            SearchKey.objects.bulk_create(batch)
+            written += len(batch)
+    return written
+
+
+# --- Search ------------------------------------------------------------------
+
+def _upper_bound(term):
+    # Keys are [A-Z0-9], so bumping the last character gives an exclusive upper bound.
+    return term[:-1] + chr(ord(term[-1]) + 1)
+
+
+def _matching(term, is_prefix, limit):
+    from .models import VehicleSearchKey
+    return list(
+        VehicleSearchKey.objects
+        .filter(is_prefix=is_prefix, term__gte=term, term__lt=_upper_bound(term))
+        .order_by('term')
+        .values_list('term', 'source', 'object_id')[:limit]
+    )
+
+
+def search_vehicles(query, limit=DEFAULT_LIMIT):
+    """
+    Ranked vehicles whose plate, or whose owner's phone, matches `query`.
+    Each result: {source, id, plate_number, model, customer_id, customer_name,
+    phone_number, matched_on, rank}; rank 0 = exact, 1 = prefix, 2 = contains.
+    """
+    limit = max(1, min(limit, MAX_LIMIT))
+    # Plates and phones share one key space: a digits-only query normalizes to
+    # the same term either way and matches both.
+    term = plate_key(query)
+    if len(term) < MIN_TERM_LENGTH:
+        return []
+
+    # (rank, source, object_id) in rank order; phone hits are expanded to vehicles below.
+    hits = [(0 if key == term else 1, source, object_id) for key, source, object_id in _matching(term, True, limit)]
+    if len(hits) < limit:
+        hits += [(2, source, object_id) for _, source, object_id in _matching(term, False, limit)]
+    hits.sort(key=lambda hit: hit[0])
+    ranked, seen = [], set()
+    for hit in hits:
+        if (hit[1], hit[2]) not in seen:
+            seen.add((hit[1], hit[2]))
+            ranked.append(hit)
+    return _materialize(ranked, limit)
+
+
+def _materialize(ranked, limit):
+    from fleet.models import Vehicle
+    from .models import Customer, CustomerVehicle
+
+    ids = {'CUSTOMER_VEHICLE': [], 'FLEET_VEHICLE': [], 'CUSTOMER': []}
+    for _, source, object_id in ranked:
+        ids[source].append(object_id)
+
+    customer_vehicles = CustomerVehicle.objects.select_related('customer__customer').in_bulk(ids['CUSTOMER_VEHICLE'])
+    fleet_vehicles = Vehicle.objects.select_related('owner__user').in_bulk(ids['FLEET_VEHICLE'])
+    customers = Customer.objects.select_related('user').in_bulk(ids['CUSTOMER'])
+    owned = {}
+    if customers:
+        for vehicle in CustomerVehicle.objects.filter(customer__customer__in=customers.values()).select_related('customer__customer'):
+            owned.setdefault(vehicle.customer.customer.pk, []).append(('CUSTOMER_VEHICLE', vehicle))
+        for vehicle in Vehicle.objects.filter(owner__in=customers.values()).select_related('owner__user'):
+            owned.setdefault(vehicle.owner_id, []).append(('FLEET_VEHICLE', vehicle))
+
+    results, emitted = [], set()
+
+    def emit(rank, source, vehicle, customer, matched_on):
+        if (source, vehicle.pk if vehicle else None, customer.pk if customer else None) in emitted:
+            return
+        emitted.add((source, vehicle.pk if vehicle else None, customer.pk if customer else None))
+        results.append({
+            'source': source.lower(),
+            'id': vehicle.pk if vehicle else None,
+            'plate_number': vehicle.plate_number if vehicle else None,
+            'model': vehicle.model if vehicle else None,
+            'customer_id': customer.pk if customer else None,
+            'customer_name': (customer.user.get_full_name() or customer.user.username) if customer else None,
+            'phone_number': customer.phone_number if customer else None,
+            'matched_on': matched_on,
+            'rank': rank,
+        })
+
+    for rank, source, object_id in ranked:
+        if source == 'CUSTOMER_VEHICLE' and object_id in customer_vehicles:
+            vehicle = customer_vehicles[object_id]
+            emit(rank, source, vehicle, getattr(vehicle.customer, 'customer', None), 'plate')
+        elif source == 'FLEET_VEHICLE' and object_id in fleet_vehicles:
+            vehicle = fleet_vehicles[object_id]
+            emit(rank, source, vehicle, vehicle.owner, 'plate')
+        elif source == 'CUSTOMER' and object_id in customers:
+            customer = customers[object_id]
+            for vehicle_source, vehicle in owned.get(object_id, [('CUSTOMER', None)]):
+                emit(rank, vehicle_source, vehicle, customer, 'phone')
+        if len(results) >= limit:
+            break
+    return results[:limit]
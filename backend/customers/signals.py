@@ -1,27 +1,19 @@
 from django.db.models.signals import post_save
+from django.db.models import F
 from django.dispatch import receiver
-from bookings.models import Booking
+from bookings.events import booking_event_subscriber
 from .models import Customer, Review
 
-@receiver(post_save, sender=Booking)
-def award_points_for_booking(sender, instance, created, **kwargs):
-    if instance.status == 'COMPLETED':
-        # Check if points already awarded? 
-        # For MVP, assume status transition happens once. 
-        # Ideal: have a flag 'points_awarded' on Booking, but let's stick to simple logic.
-        # We can calculate 1 point per $1 or 10% 
-        
-        # Avoid duplicate award: check if this is the first time it became completed?
-        # Difficult with post_save unless we track old instance.
-        # Alternative: Just add points and rely on business process integrity.
-        
-        # Let's assume price is on ServicePackage.
-        if instance.service_package:
-             points = int(float(instance.service_package.price) * 0.1) # 10% points
-             # Update customer
-             customer = instance.customer
-             customer.loyalty_points += points
-             customer.save()
+@booking_event_subscriber
+def award_points_for_booking(booking_events):
+    """Awards 10% of the package price as points once, when a booking becomes COMPLETED."""
+    for event in booking_events:
+        if not event.entered('COMPLETED'):
+            continue
+        booking = event.booking
+        if booking.service_package and booking.customer_id:
+            points = int(float(booking.service_package.price) * 0.1) # 10% points
+            Customer.objects.filter(pk=booking.customer_id).update(loyalty_points=F('loyalty_points') + points)
 
 
 @receiver(post_save, sender=Review)
@@ -30,3 +22,39 @@ def award_points_for_review(sender, instance, created, **kwargs):
         customer = instance.customer
         customer.loyalty_points += 50 # Bonus for review
         customer.save()
+
+
+from django.db.models.signals import post_delete
+from . import search
+from .models import CustomerVehicle
+
+
+@receiver(post_save, sender=CustomerVehicle)
+def index_customer_vehicle(sender, instance, **kwargs):
+    search.index_object('CUSTOMER_VEHICLE', instance.pk, search.plate_key(instance.plate_number))
+
+
+@receiver(post_save, sender='fleet.Vehicle')
+def index_fleet_vehicle(sender, instance, **kwargs):
+    search.index_object('FLEET_VEHICLE', instance.pk, search.plate_key(instance.plate_number))
+
+
+@receiver(post_save, sender=Customer)
+def index_customer_phone(sender, instance, created, **kwargs):
+    if created or instance.has_changed('phone_number'):
+        search.index_object('CUSTOMER', instance.pk, search.phone_digits(instance.phone_number))
+
+
+@receiver(post_delete, sender=CustomerVehicle)
+def unindex_customer_vehicle(sender, instance, **kwargs):
+    search.unindex_object('CUSTOMER_VEHICLE', instance.pk)
+
+
+@receiver(post_delete, sender='fleet.Vehicle')
+def unindex_fleet_vehicle(sender, instance, **kwargs):
+    search.unindex_object('FLEET_VEHICLE', instance.pk)
+
+
+@receiver(post_delete, sender=Customer)
+def unindex_customer_phone(sender, instance, **kwargs):
+    search.unindex_object('CUSTOMER', instance.pk)
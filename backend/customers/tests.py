@@ -1,3 +1,78 @@
 from django.test import TestCase
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+from .models import Customer, CustomerVehicle, VehicleSearchKey
+from .search import search_vehicles, rebuild_index
+from fleet.models import Vehicle
 
-# Create your tests here.
+
+class VehicleSearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='ravi', password='pwd', first_name='Ravi')
+        self.customer = Customer.objects.create(user=self.user, phone_number='+91 98470-12345')
+        self.pos_vehicle = CustomerVehicle.objects.create(customer=self.user, make='Maruti', model='Swift', plate_number='KL-07 AB 1234')
+        self.fleet_vehicle = Vehicle.objects.create(owner=self.customer, model='Innova', plate_number='kl07cd5678')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='staff', password='pwd', is_staff=True))
+
+    def plates(self, query, **kwargs):
+        return [hit['plate_number'] for hit in search_vehicles(query, **kwargs)]
+
+    def test_matches_both_tables_ignoring_case_and_spacing(self):
+        self.assertEqual(self.plates('kl07 ab-1234'), ['KL-07 AB 1234'])
+        self.assertEqual(self.plates('KL07CD'), ['kl07cd5678'])
+        self.assertEqual(set(self.plates('KL07')), {'KL-07 AB 1234', 'kl07cd5678'})
+        # Substring of the plate, not just a prefix
+        self.assertEqual(self.plates('5678'), ['kl07cd5678'])
+        self.assertEqual(self.plates('Z'), [])
+
+    def test_ranks_exact_then_prefix_then_contains(self):
+        CustomerVehicle.objects.create(customer=self.user, make='Honda', model='City', plate_number='AB12')
+        CustomerVehicle.objects.create(customer=self.user, make='Honda', model='Jazz', plate_number='AB1299')
+        CustomerVehicle.objects.create(customer=self.user, make='Honda', model='Amaze', plate_number='XAB12')
+        hits = search_vehicles('ab12')
+        self.assertEqual([(h['plate_number'], h['rank']) for h in hits], [
+            ('AB12', 0), ('AB1299', 1), ('XAB12', 2), ('KL-07 AB 1234', 2),
+        ])
+        self.assertEqual(len(search_vehicles('ab12', limit=1)), 1)
+
+    def test_phone_digits_find_the_owners_vehicles(self):
+        hits = search_vehicles('98470 12345')
+        self.assertEqual({h['plate_number'] for h in hits}, {'KL-07 AB 1234', 'kl07cd5678'})
+        self.assertTrue(all(h['matched_on'] == 'phone' and h['customer_id'] == self.customer.id for h in hits))
+        # Trailing digits, as typed from the last few numbers
+        self.assertEqual(len(search_vehicles('12345')), 2)
+
+    def test_index_follows_edits_and_deletes(self):
+        self.customer.phone_number = '0484 222333'
+        self.customer.save()
+        self.assertEqual(search_vehicles('98470'), [])
+        self.assertEqual(len(search_vehicles('222333')), 2)
+
+        self.fleet_vehicle.plate_number = 'TN01ZZ0001'
+        self.fleet_vehicle.save()
+        self.assertEqual(self.plates('CD5678'), [])
+        self.assertEqual(self.plates('ZZ0001'), ['TN01ZZ0001'])
+
+        self.pos_vehicle.delete()
+        self.assertEqual(self.plates('AB1234'), [])
+        self.assertFalse(VehicleSearchKey.objects.filter(source='CUSTOMER_VEHICLE').exists())
+
+    def test_rebuild_matches_incremental_index(self):
+        before = sorted(VehicleSearchKey.objects.values_list('term', 'is_prefix', 'source', 'object_id'))
+        rebuild_index()
+        self.assertEqual(sorted(VehicleSearchKey.objects.values_list('term', 'is_prefix', 'source', 'object_id')), before)
+
+    def test_endpoints(self):
+        response = self.client.get('/api/vehicle-search/', {'q': '1234'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['plate_number'], 'KL-07 AB 1234')
+        self.assertEqual(self.client.get('/api/vehicle-search/').status_code, 400)
+
+        response = self.client.get('/api/vehicles/lookup/', {'plate': 'kl07cd5678'})
+        self.assertEqual(response.data, {'phone': '+91 98470-12345', 'customer_name': 'Ravi'})
+        self.assertEqual(self.client.get('/api/vehicles/lookup/', {'plate': 'kl07cd'}).status_code, 404)
+
+        response = self.client.get('/api/bookings/vehicle-history/', {'q': 'AB 1234'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['vehicle_profile']['owner_name'], 'Ravi')
@@ -8,8 +8,9 @@ from rest_framework.authtoken.models import Token
 from .models import Customer, SubscriptionPlan, MemberSubscription
 from .serializers import CustomerSerializer, SubscriptionPlanSerializer
 from django.utils import timezone
+from core.query_planner import QueryPlannerMixin
 
-class CustomerViewSet(viewsets.ModelViewSet):
+class CustomerViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = Customer.objects.all()
     serializer_class = CustomerSerializer
 
@@ -160,7 +161,7 @@ class IsAdminUserOrReadOnly(BasePermission):
             return True
         return request.user and request.user.is_staff
 
-class SubscriptionPlanViewSet(viewsets.ModelViewSet):
+class SubscriptionPlanViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = SubscriptionPlan.objects.all()
     serializer_class = SubscriptionPlanSerializer
     permission_classes = [IsAdminUserOrReadOnly]
@@ -214,7 +215,7 @@ class SubscriptionPlanViewSet(viewsets.ModelViewSet):
 from .models import Review, Coupon
 from .serializers import ReviewSerializer, CouponSerializer
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     
@@ -230,7 +231,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
         else:
             serializer.save()
 
-class CouponViewSet(viewsets.ModelViewSet):
+class CouponViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = Coupon.objects.all()
     serializer_class = CouponSerializer
     permission_classes = [IsAdminUserOrReadOnly]
@@ -238,7 +239,7 @@ class CouponViewSet(viewsets.ModelViewSet):
 from .models import CustomerVehicle
 from .serializers import CustomerVehicleSerializer
 
-class CustomerVehicleViewSet(viewsets.ModelViewSet):
+class CustomerVehicleViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     serializer_class = CustomerVehicleSerializer
     permission_classes = [IsAuthenticated]
 
@@ -254,3 +255,18 @@ class CustomerVehicleViewSet(viewsets.ModelViewSet):
             serializer.save()
         else:
             serializer.save(customer=self.request.user)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def vehicle_typeahead(request):
+    """POS typeahead: vehicles whose plate (or owner's phone) matches ?q=, best match first."""
+    from .search import search_vehicles, DEFAULT_LIMIT
+    q = request.query_params.get('q', '').strip()
+    if not q:
+        return Response({'error': 'Missing query parameter q'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'query': q, 'results': search_vehicles(q, limit=limit)})
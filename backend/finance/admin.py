@@ -2,7 +2,7 @@ from django.contrib import admin
 from .models import (
     RevenueCategory, ExpenseCategory, GeneralExpense, 
     ChemicalInventory, ChemicalUsageLog, CommissionRule, 
-    PayrollEntry, DeferredRevenue, Invoice
+    PayrollEntry, PayrollRun, DeferredRevenue, Invoice, RecipeLine
 )
 
 admin.site.register(RevenueCategory)
@@ -10,7 +10,9 @@ admin.site.register(ExpenseCategory)
 admin.site.register(GeneralExpense)
 admin.site.register(ChemicalInventory)
 admin.site.register(ChemicalUsageLog)
+admin.site.register(RecipeLine)
 admin.site.register(CommissionRule)
 admin.site.register(PayrollEntry)
+admin.site.register(PayrollRun)
 admin.site.register(DeferredRevenue)
 admin.site.register(Invoice)
@@ -0,0 +1,160 @@
+"""
+Khata (customer credit) ledger and balances.
+
+A customer's balance is the sum of their ledger: charges add, settlements
+subtract. Statements show the balance after every entry, computed in the
+database with a window function, SUM(signed amount) OVER (ORDER BY
+created_at, id), over the (customer, created_at, id) index.
+
+Statements are paginated newest first on (created_at, id). Every page keeps
+all older entries in its WHERE clause and LIMIT applies after the window, so
+each row's running balance is exact without reading newer pages.
+
+Customer.outstanding_balance is a cached copy of that sum. charge() and
+settle() change it with an F() UPDATE in the same transaction as the ledger
+entry, and lock the customer row (SELECT ... FOR UPDATE) when the credit
+limit or the balance must be read first, so concurrent terminals cannot lose
+updates. reconcile() compares every cached balance with the ledger in one
+GROUP BY (manage.py reconcile_khata_balances).
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When, Window
+from django.db.models.expressions import RowRange
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+class CreditLimitExceeded(ValueError):
+    def __init__(self, balance, credit_limit):
+        super().__init__(f'Credit limit exceeded. Current balance: ₹{balance}, Limit: ₹{credit_limit}')
+        self.balance, self.credit_limit = balance, credit_limit
+
+
+SIGNED_AMOUNT = Case(
+    When(transaction_type='SETTLEMENT', then=-F('amount')),
+    default=F('amount'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+def _until(as_of):
+    """Exclusive upper bound for entries made on or before the date `as_of`."""
+    return timezone.make_aware(datetime.combine(as_of + timedelta(days=1), time.min), timezone.get_current_timezone())
+
+
+def statement(customer_id, as_of=None):
+    """The customer's ledger entries annotated with `running_balance`, optionally up to `as_of` (a date)."""
+    from .models import KhataLedger
+    entries = KhataLedger.objects.filter(customer_id=customer_id)
+    if as_of:
+        entries = entries.filter(created_at__lt=_until(as_of))
+    return entries.annotate(
+        running_balance=Window(
+            Sum(SIGNED_AMOUNT),
+            order_by=[F('created_at').asc(), F('id').asc()],
+            frame=RowRange(start=None, end=0),
+        )
+    )
+
+
+def balance_as_of(customer_id, as_of=None):
+    """Ledger balance after every entry up to the end of `as_of` (all entries if None), in one query."""
+    from .models import KhataLedger
+    entries = KhataLedger.objects.filter(customer_id=customer_id)
+    if as_of:
+        entries = entries.filter(created_at__lt=_until(as_of))
+    return entries.aggregate(balance=Coalesce(Sum(SIGNED_AMOUNT), Value(Decimal('0'))))['balance']
+
+
+def entry_row(entry):
+    desc = entry.description
+    if entry.related_booking_id:
+        desc += f" (Booking #{entry.related_booking_id})"
+    return {
+        'id': entry.id,
+        'amount': float(entry.amount),
+        'transaction_type': entry.transaction_type,
+        'description': desc,
+        'date': entry.created_at.strftime("%Y-%m-%d %H:%M"),
+        'running_balance': float(entry.running_balance),
+    }
+
+
+# --- Balance changes ---------------------------------------------------------
+
+def _balance(customer_id):
+    from customers.models import Customer
+    return Customer.objects.values_list('outstanding_balance', flat=True).get(pk=customer_id)
+
+
+def charge(customer_id, amount, description, booking=None, check_limit=True):
+    """
+    Add a CHARGE entry and raise the balance by `amount`; returns the new
+    balance. Raises CreditLimitExceeded (nothing written) if `check_limit` and
+    the charge would take the balance over the customer's credit limit.
+    """
+    from customers.models import Customer
+    from .models import KhataLedger
+    with transaction.atomic():
+        if check_limit:
+            balance, credit_limit = (
+                Customer.objects.select_for_update().values_list('outstanding_balance', 'credit_limit').get(pk=customer_id)
+            )
+            if balance + amount > credit_limit:
+                raise CreditLimitExceeded(balance, credit_limit)
+        Customer.objects.filter(pk=customer_id).update(outstanding_balance=F('outstanding_balance') + amount)
+        KhataLedger.objects.create(
+            customer_id=customer_id, amount=amount, transaction_type='CHARGE',
+            description=description, related_booking=booking,
+        )
+        return _balance(customer_id)
+
+
+def settle(customer_id, amount, description):
+    """
+    Add a SETTLEMENT entry and lower the balance; returns (amount applied, new
+    balance). Overpayment is not kept as credit, so at most the outstanding
+    balance is applied and recorded, keeping the ledger equal to the balance.
+    """
+    from customers.models import Customer
+    from .models import KhataLedger
+    with transaction.atomic():
+        balance = Customer.objects.select_for_update().values_list('outstanding_balance', flat=True).get(pk=customer_id)
+        applied = min(amount, max(balance, Decimal('0')))
+        if applied < amount:
+            description = f'{description} (₹{amount} received, ₹{applied} due)'
+        Customer.objects.filter(pk=customer_id).update(outstanding_balance=F('outstanding_balance') - applied)
+        KhataLedger.objects.create(customer_id=customer_id, amount=applied, transaction_type='SETTLEMENT', description=description)
+        return applied, _balance(customer_id)
+
+
+# --- Reconciliation ----------------------------------------------------------
+
+def reconcile(fix=False):
+    """
+    [{'customer_id', 'stored', 'ledger', 'drift'}] for every customer whose
+    outstanding_balance differs from their ledger sum (drift = stored - ledger).
+    With `fix`, each drifting balance is set to the ledger sum, unless it
+    changed since it was read.
+    """
+    from customers.models import Customer
+    from .models import KhataLedger
+    ledger = dict(
+        KhataLedger.objects.values('customer_id').annotate(balance=Sum(SIGNED_AMOUNT))
+        .order_by().values_list('customer_id', 'balance')
+    )
+    drifted = []
+    for customer_id, stored in Customer.objects.values_list('id', 'outstanding_balance').order_by('id').iterator(chunk_size=5000):
+        expected = ledger.get(customer_id) or Decimal('0')
+        if stored != expected:
+            drifted.append({'customer_id': customer_id, 'stored': stored, 'ledger': expected, 'drift': stored - expected})
+
+    if fix:
+        for row in drifted:
+            row['fixed'] = bool(
+                Customer.objects.filter(pk=row['customer_id'], outstanding_balance=row['stored'])
+                .update(outstanding_balance=row['ledger'])
+            )
+    return drifted
@@ -1,40 +1,47 @@
 from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
 from django.utils import timezone
-from .models import ChemicalInventory, ChemicalUsageLog, PayrollEntry, DeferredRevenue
+from .models import ChemicalInventory, ChemicalUsageLog, PayrollEntry, DeferredRevenue, RecipeLine
+from . import rollups
 
 def calculate_wash_cost(booking):
     """
     Calculates the theoretical chemical cost for a booking based on its service package recipe.
-    Deducts from inventory and logs usage.
+    Deducts from inventory and logs usage: one UPDATE for all the recipe's
+    chemicals (F() expressions, so concurrent completions can't lose a
+    deduction) and one bulk INSERT of usage logs, however long the recipe.
     """
-    package = booking.service_package
-    if not package or not hasattr(package, 'chemical_recipe'):
+    if not booking.service_package_id:
         return
 
-    recipe = package.chemical_recipe # Assumes JSON field: {"soap_a": 0.5, "wax_b": 0.1}
-    if not recipe:
+    lines = list(RecipeLine.objects.filter(package_id=booking.service_package_id).select_related('chemical'))
+    if not lines:
         return
 
-    # This is a simplified implementation. In reality, we'd match chemical names to IDs or Slugs.
-    for chemical_name, amount_needed in recipe.items():
-        try:
-            inventory_item = ChemicalInventory.objects.get(name__iexact=chemical_name)
-            
-            # Deduct from inventory
-            # Ensure we are working with Decimals
-            amount_decimal = Decimal(str(amount_needed))
-            inventory_item.current_volume -= amount_decimal
-            inventory_item.save()
-
-            # Log usage
-            ChemicalUsageLog.objects.create(
-                inventory_item=inventory_item,
-                booking=booking,
-                amount_used=amount_decimal,
-                timestamp=timezone.now()
+    with transaction.atomic():
+        ChemicalInventory.objects.filter(pk__in=[line.chemical_id for line in lines]).update(
+            current_volume=F('current_volume') - Case(
+                *[When(pk=line.chemical_id, then=Value(line.amount)) for line in lines],
+                output_field=DecimalField(max_digits=10, decimal_places=2),
             )
-        except ChemicalInventory.DoesNotExist:
-            print(f"Warning: Chemical {chemical_name} not found in inventory.")
+        )
+        logs = ChemicalUsageLog.objects.bulk_create([
+            ChemicalUsageLog(inventory_item=line.chemical, booking=booking, amount_used=line.amount,
+                             cost_per_unit=line.chemical.cost_per_unit)
+            for line in lines
+        ])
+        # bulk_create sends no signals; keep the daily rollup in step here.
+        rollups.bulk_written(logs, created=True)
+
+def set_recipe(package, amounts):
+    """Replace the package's recipe with {ChemicalInventory: amount per wash}."""
+    with transaction.atomic():
+        RecipeLine.objects.filter(package=package).delete()
+        RecipeLine.objects.bulk_create([
+            RecipeLine(package=package, chemical=chemical, amount=amount)
+            for chemical, amount in amounts.items() if amount
+        ])
 
 def process_payroll_event(booking):
     """
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:47
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+
+# Frozen copy of finance.rollups.rebuild_rollups as of this migration, so later changes to it can't alter what this step did.
+METHOD_FIELDS = {
+    'CASH': 'cash_revenue',
+    'CARD': 'card_revenue',
+    'ONLINE': 'online_revenue',
+    'SPLIT': 'split_revenue',
+}
+
+
+def backfill_rollups(apps, schema_editor):
+    Rollup = apps.get_model('finance', 'DailyFinanceRollup')
+    Invoice = apps.get_model('finance', 'Invoice')
+    ChemicalUsageLog = apps.get_model('finance', 'ChemicalUsageLog')
+    PayrollEntry = apps.get_model('finance', 'PayrollEntry')
+    GeneralExpense = apps.get_model('finance', 'GeneralExpense')
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    paid = Q(is_paid=True)
+    sources = [
+        Invoice.objects.annotate(day=TruncDate('created_at')).values('day').annotate(
+            revenue=Sum('amount'),
+            paid_revenue=Sum('amount', filter=paid),
+            khata_charged=Sum('split_khata'),
+            invoice_count=Count('id'),
+            booking_count=Count('booking'),
+            **{field: Sum('amount', filter=paid & Q(payment_method=method)) for method, field in METHOD_FIELDS.items()},
+        ),
+        ChemicalUsageLog.objects.annotate(day=TruncDate('timestamp')).values('day').annotate(
+            chemical_cost=Sum(ExpressionWrapper(F('amount_used') * F('inventory_item__cost_per_unit'), output_field=money)),
+        ),
+        PayrollEntry.objects.annotate(day=F('date')).values('day').annotate(
+            labor_cost=Sum(F('base_wage') + F('commission_earned') + F('tips_earned'), output_field=money),
+        ),
+        GeneralExpense.objects.annotate(day=F('date')).values('day').annotate(
+            expenses=Sum('amount'),
+        ),
+    ]
+
+    days = defaultdict(dict)
+    for queryset in sources:
+        for row in queryset.order_by():
+            day = row.pop('day')
+            days[day].update({field: value for field, value in row.items() if value})
+    Rollup.objects.bulk_create([Rollup(date=day, **totals) for day, totals in sorted(days.items())], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0009_payrollentry_is_settled_payrollentry_settled_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyFinanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('paid_revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('cash_revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('card_revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('online_revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('split_revenue', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('khata_charged', models.DecimalField(decimal_places=2, default=0.0, help_text='Invoice amounts put on khata (credit)', max_digits=12)),
+                ('chemical_cost', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('labor_cost', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('expenses', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('booking_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:52
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+# Frozen copy of finance.snapshots.freeze_day as of this migration, so later changes to it can't alter what this step did.
+GST_INCLUSIVE_PORTION = Decimal('18') / Decimal('118')
+PAYMENT_METHODS = ('CASH', 'CARD', 'ONLINE', 'SPLIT')
+LEDGER_VALUES = (
+    'id', 'created_at', 'amount', 'is_paid', 'revenue_category__name',
+    'booking_id', 'booking__customer__user__username', 'subscription__customer__user__username',
+)
+
+
+def ledger_rows(invoices):
+    for inv in invoices.values(*LEDGER_VALUES).order_by('created_at', 'id').iterator(chunk_size=2000):
+        if inv['booking_id']:
+            customer = inv['booking__customer__user__username'] or "Unknown"
+        else:
+            customer = inv['subscription__customer__user__username'] or "Unknown"
+        yield [
+            inv['id'],
+            timezone.localtime(inv['created_at']).strftime('%Y-%m-%d'),
+            customer,
+            str(inv['amount']),
+            "Paid" if inv['is_paid'] else "Unpaid",
+            inv['revenue_category__name'] or "General",
+        ]
+
+
+def freeze_day(apps, audit):
+    Snapshot = apps.get_model('finance', 'DailyRegisterSnapshot')
+    Invoice = apps.get_model('finance', 'Invoice')
+    Booking = apps.get_model('bookings', 'Booking')
+    GeneralExpense = apps.get_model('finance', 'GeneralExpense')
+    PayrollEntry = apps.get_model('finance', 'PayrollEntry')
+    ChemicalUsageLog = apps.get_model('finance', 'ChemicalUsageLog')
+    day = audit.date
+    money_field = DecimalField(max_digits=12, decimal_places=2)
+
+    paid = Q(is_paid=True)
+    invoices = Invoice.objects.filter(created_at__date=day)
+    money = invoices.aggregate(
+        revenue=Sum('amount'),
+        paid_revenue=Sum('amount', filter=paid),
+        khata=Sum('split_khata'),
+        **{method.lower(): Sum('amount', filter=paid & Q(payment_method=method)) for method in PAYMENT_METHODS},
+    )
+    money['expenses'] = GeneralExpense.objects.filter(date=day).aggregate(total=Sum('amount'))['total']
+    money['labor'] = PayrollEntry.objects.filter(date=day).aggregate(
+        total=Sum(F('base_wage') + F('commission_earned') + F('tips_earned'), output_field=money_field)
+    )['total']
+    money['chemical_cost'] = ChemicalUsageLog.objects.filter(timestamp__date=day).aggregate(
+        total=Sum(ExpressionWrapper(F('amount_used') * F('inventory_item__cost_per_unit'), output_field=money_field))
+    )['total']
+    money = {key: value or Decimal('0') for key, value in money.items()}
+    money['tax_collected'] = (money['paid_revenue'] * GST_INCLUSIVE_PORTION).quantize(Decimal('0.01'))
+
+    bookings = Booking.objects.filter(created_at__date=day, status='COMPLETED')
+    packages = (
+        bookings.filter(service_package__isnull=False).values('service_package__name')
+        .annotate(count=Count('id'), revenue=Sum('service_package__price')).order_by('service_package__name')
+    )
+    technicians = (
+        bookings.filter(technician__isnull=False).values('technician__username', 'technician__first_name')
+        .annotate(count=Count('id')).order_by('technician__username')
+    )
+    hours = bookings.annotate(hour=ExtractHour('created_at')).values('hour').annotate(count=Count('id')).order_by('hour')
+
+    totals = {key: str(value) for key, value in money.items()}
+    totals['invoice_count'] = invoices.count()
+    totals['booking_count'] = bookings.count()
+    Snapshot.objects.create(
+        audit_id=audit.pk,
+        date=day,
+        totals=totals,
+        packages=[
+            {'name': p['service_package__name'], 'count': p['count'], 'revenue': str(p['revenue'] or 0)}
+            for p in packages
+        ],
+        technicians=[
+            {'username': t['technician__username'], 'name': t['technician__first_name'] or t['technician__username'], 'count': t['count']}
+            for t in technicians
+        ],
+        hours={str(h['hour']): h['count'] for h in hours},
+        ledger=list(ledger_rows(invoices)),
+    )
+
+
+def freeze_locked_days(apps, schema_editor):
+    for audit in apps.get_model('finance', 'DailyRegisterAudit').objects.filter(is_locked=True):
+        freeze_day(apps, audit)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0010_daily_finance_rollup'),
+        ('bookings', '0014_normalize_booking_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRegisterSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('totals', models.JSONField(default=dict, help_text='Revenue, payment method splits, costs, counts and tax portion')),
+                ('packages', models.JSONField(default=list, help_text='[{name, count, revenue}] for completed bookings')),
+                ('technicians', models.JSONField(default=list, help_text='[{username, name, count}] for completed bookings')),
+                ('hours', models.JSONField(default=dict, help_text='Completed bookings per hour of the day')),
+                ('ledger', models.JSONField(default=list, help_text='Invoice ledger rows, as exported')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('audit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='finance.dailyregisteraudit')),
+            ],
+        ),
+        migrations.RunPython(freeze_locked_days, migrations.RunPython.noop),
+    ]
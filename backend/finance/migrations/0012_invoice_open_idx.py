@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0014_normalize_booking_status'),
+        ('customers', '0006_vehicle_search_key'),
+        ('finance', '0011_daily_register_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(condition=models.Q(('is_paid', False)), fields=['-created_at', '-id'], name='invoice_open_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0012_invoice_open_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='khataledger',
+            index=models.Index(fields=['customer', 'created_at', 'id'], name='khata_customer_created_idx'),
+        ),
+    ]
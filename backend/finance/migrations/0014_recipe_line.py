@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:18
+
+import logging
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def copy_recipes(apps, schema_editor):
+    """One RecipeLine per ServicePackage.chemical_recipe entry whose name matches an inventory item."""
+    ServicePackage = apps.get_model('bookings', 'ServicePackage')
+    ChemicalInventory = apps.get_model('finance', 'ChemicalInventory')
+    RecipeLine = apps.get_model('finance', 'RecipeLine')
+    chemicals = {}
+    for chemical in ChemicalInventory.objects.order_by('id'):
+        chemicals.setdefault(chemical.name.strip().lower(), chemical)
+
+    lines = []
+    for package in ServicePackage.objects.exclude(chemical_recipe={}).order_by('id'):
+        amounts = {}
+        for name, amount in (package.chemical_recipe or {}).items():
+            chemical = chemicals.get(str(name).strip().lower())
+            if chemical is None:
+                # Never deducted before either (the lookup by name failed), but
+                # chemical_recipe is dropped next, so leave a record of the entry.
+                logger.warning(
+                    "Recipe entry %r: %s in package %r (id %s) dropped: no such chemical in inventory.",
+                    name, amount, package.name, package.id,
+                )
+                continue
+            amounts[chemical.id] = amounts.get(chemical.id, Decimal('0')) + Decimal(str(amount))
+        lines += [RecipeLine(package_id=package.id, chemical_id=chemical_id, amount=amount) for chemical_id, amount in amounts.items()]
+    RecipeLine.objects.bulk_create(lines)
+
+
+def restore_recipes(apps, schema_editor):
+    ServicePackage = apps.get_model('bookings', 'ServicePackage')
+    RecipeLine = apps.get_model('finance', 'RecipeLine')
+    recipes = {}
+    for package_id, name, amount in RecipeLine.objects.values_list('package_id', 'chemical__name', 'amount'):
+        recipes.setdefault(package_id, {})[name] = float(amount)
+    for package_id, recipe in recipes.items():
+        ServicePackage.objects.filter(pk=package_id).update(chemical_recipe=recipe)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0014_normalize_booking_status'),
+        ('finance', '0013_khata_customer_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, help_text="Amount used per wash, in the chemical's UOM", max_digits=10)),
+                ('chemical', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_lines', to='finance.chemicalinventory')),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_lines', to='bookings.servicepackage')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('package', 'chemical'), name='recipe_line_unique_chemical')],
+            },
+        ),
+        migrations.RunPython(copy_recipes, restore_recipes),
+    ]
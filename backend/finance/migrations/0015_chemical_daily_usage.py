@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_usage(apps, schema_editor):
+    """One ChemicalDailyUsage row per chemical and day of the usage log (a frozen copy of rebuild_chemical_usage)."""
+    Usage = apps.get_model('finance', 'ChemicalDailyUsage')
+    ChemicalUsageLog = apps.get_model('finance', 'ChemicalUsageLog')
+    totals = (
+        ChemicalUsageLog.objects.annotate(day=TruncDate('timestamp'))
+        .values('inventory_item_id', 'day').annotate(amount=Sum('amount_used')).order_by()
+    )
+    Usage.objects.bulk_create([
+        Usage(chemical_id=row['inventory_item_id'], date=row['day'], amount_used=row['amount'])
+        for row in totals if row['amount']
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0014_recipe_line'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChemicalDailyUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('amount_used', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('chemical', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_usage', to='finance.chemicalinventory')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('chemical', 'date'), name='chemical_daily_usage_unique_day')],
+            },
+        ),
+        migrations.RunPython(backfill_usage, migrations.RunPython.noop),
+    ]
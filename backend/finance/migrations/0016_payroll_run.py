@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0015_chemical_daily_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payrollentry',
+            name='advances',
+            field=models.DecimalField(decimal_places=2, default=0.0, help_text="Cash advances deducted from this day's pay", max_digits=8),
+        ),
+        migrations.CreateModel(
+            name='PayrollRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('DAY', 'Day'), ('WEEK', 'Week'), ('MONTH', 'Month')], max_length=10)),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('entry_count', models.PositiveIntegerField(default=0)),
+                ('total_wages', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('total_commission', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('total_advances', models.DecimalField(decimal_places=2, default=0.0, max_digits=12)),
+                ('ran_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('start', 'end'), name='payroll_run_unique_period')],
+            },
+        ),
+    ]
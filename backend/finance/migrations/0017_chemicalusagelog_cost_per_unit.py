@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:02
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def value_at_current_cost(apps, schema_editor):
+    """Existing logs were valued at the item's current cost; keep that as their stored cost."""
+    ChemicalInventory = apps.get_model('finance', 'ChemicalInventory')
+    ChemicalUsageLog = apps.get_model('finance', 'ChemicalUsageLog')
+    ChemicalUsageLog.objects.update(cost_per_unit=Subquery(
+        ChemicalInventory.objects.filter(pk=OuterRef('inventory_item_id')).values('cost_per_unit')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0016_payroll_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chemicalusagelog',
+            name='cost_per_unit',
+            field=models.DecimalField(decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.RunPython(value_at_current_cost, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='chemicalusagelog',
+            name='cost_per_unit',
+            field=models.DecimalField(decimal_places=2, help_text="The item's unit cost when the usage was logged", max_digits=10),
+        ),
+    ]
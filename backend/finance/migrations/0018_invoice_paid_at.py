@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:32
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def paid_when_billed(apps, schema_editor):
+    """Payments so far counted on the invoice's own day; keep them there."""
+    Invoice = apps.get_model('finance', 'Invoice')
+    Invoice.objects.filter(is_paid=True).update(paid_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0017_chemicalusagelog_cost_per_unit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, help_text='When it was marked paid; the payment counts on this day', null=True),
+        ),
+        migrations.RunPython(paid_when_billed, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from bookings.models import Booking, ServicePackage
+from core.models import ChangeTrackingMixin
 
 class RevenueCategory(models.Model):
     name = models.CharField(max_length=50) # e.g., "Wash", "Detail", "Retail", "Subscription"
@@ -17,7 +18,7 @@ class ExpenseCategory(models.Model):
     def __str__(self):
         return self.name
 
-class GeneralExpense(models.Model):
+class GeneralExpense(ChangeTrackingMixin, models.Model):
     """
     Tracks operational overhead like Rent, Utilities, Maintenance, etc.
     """
@@ -38,6 +39,8 @@ class GeneralExpense(models.Model):
     approved_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    tracked_fields = ('amount', 'date')
+
     def __str__(self):
         return f"{self.category} - {self.amount} ({self.date}) [{self.status}]"
 
@@ -51,15 +54,55 @@ class ChemicalInventory(models.Model):
     def __str__(self):
         return f"{self.name} ({self.current_volume} {self.uom})"
 
-class ChemicalUsageLog(models.Model):
+class RecipeLine(models.Model):
+    """Amount of one chemical a service package uses per wash."""
+    package = models.ForeignKey(ServicePackage, on_delete=models.CASCADE, related_name='recipe_lines')
+    chemical = models.ForeignKey(ChemicalInventory, on_delete=models.CASCADE, related_name='recipe_lines')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, help_text="Amount used per wash, in the chemical's UOM")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['package', 'chemical'], name='recipe_line_unique_chemical'),
+        ]
+
+    def __str__(self):
+        return f"{self.package.name}: {self.amount} {self.chemical.uom} of {self.chemical.name}"
+
+class ChemicalUsageLog(ChangeTrackingMixin, models.Model):
     inventory_item = models.ForeignKey(ChemicalInventory, on_delete=models.CASCADE)
     booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True)
     amount_used = models.DecimalField(max_digits=10, decimal_places=2)
+    cost_per_unit = models.DecimalField(max_digits=10, decimal_places=2, help_text="The item's unit cost when the usage was logged")
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    tracked_fields = ('inventory_item_id', 'amount_used', 'cost_per_unit', 'timestamp')
+
+    def save(self, *args, **kwargs):
+        # Usage stays valued at the price it was logged at; a later price change doesn't restate it.
+        if self.cost_per_unit is None or (not self._state.adding and self.has_changed('inventory_item_id')):
+            self.cost_per_unit = self.inventory_item.cost_per_unit
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"Used {self.amount_used} of {self.inventory_item.name}"
 
+class ChemicalDailyUsage(models.Model):
+    """
+    Total amount of one chemical used on one day. Maintained from
+    ChemicalUsageLog by finance.rollups; read by finance.forecast.
+    """
+    chemical = models.ForeignKey(ChemicalInventory, on_delete=models.CASCADE, related_name='daily_usage')
+    date = models.DateField()
+    amount_used = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['chemical', 'date'], name='chemical_daily_usage_unique_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.date}: {self.amount_used} of chemical {self.chemical_id}"
+
 class CommissionRule(models.Model):
     """
     Defines how much a staff member earns for a specific service or upsell.
@@ -71,7 +114,7 @@ class CommissionRule(models.Model):
     def __str__(self):
         return self.name
 
-class PayrollEntry(models.Model):
+class PayrollEntry(ChangeTrackingMixin, models.Model):
     """
     Daily aggregation of earnings for a staff member.
     """
@@ -80,9 +123,12 @@ class PayrollEntry(models.Model):
     base_wage = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
     commission_earned = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
     tips_earned = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
+    advances = models.DecimalField(max_digits=8, decimal_places=2, default=0.00, help_text="Cash advances deducted from this day's pay")
     is_settled = models.BooleanField(default=False)
     settled_at = models.DateTimeField(null=True, blank=True)
     
+    tracked_fields = ('date', 'base_wage', 'commission_earned', 'tips_earned')
+
     class Meta:
         unique_together = ('staff_user', 'date')
 
@@ -93,6 +139,33 @@ class PayrollEntry(models.Model):
     def __str__(self):
         return f"{self.staff_user.username} - {self.date}"
 
+class PayrollRun(models.Model):
+    """
+    Totals of the last payroll run over a period (see finance.payroll). Re-running
+    the period updates this row and its PayrollEntry rows in place.
+    """
+    PERIOD_CHOICES = [
+        ('DAY', 'Day'),
+        ('WEEK', 'Week'),
+        ('MONTH', 'Month'),
+    ]
+    period = models.CharField(max_length=10, choices=PERIOD_CHOICES)
+    start = models.DateField()
+    end = models.DateField()
+    entry_count = models.PositiveIntegerField(default=0)
+    total_wages = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    total_commission = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    total_advances = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    ran_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['start', 'end'], name='payroll_run_unique_period'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_period_display()} payroll {self.start} - {self.end}"
+
 class DeferredRevenue(models.Model):
     """
     Tracks subscription income that is received but not yet 'earned'.
@@ -107,7 +180,7 @@ class DeferredRevenue(models.Model):
     def __str__(self):
         return f"Deferred: {self.customer} ({self.remaining_balance} remaining)"
 
-class Invoice(models.Model):
+class Invoice(ChangeTrackingMixin, models.Model):
     PAYMENT_METHODS = [
         ('CASH', 'Cash'),
         ('CARD', 'Card'),
@@ -126,6 +199,26 @@ class Invoice(models.Model):
     split_online = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     split_khata = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
+    paid_at = models.DateTimeField(null=True, blank=True, help_text="When it was marked paid; the payment counts on this day")
+
+    # What the invoice bills (and its khata charge): counted on the day it was created and
+    # fixed once that day's register is closed. The payment counts on the day it is made.
+    BILLED_FIELDS = ('amount', 'split_khata', 'booking_id', 'subscription_id', 'revenue_category_id', 'is_deferred', 'created_at')
+    PAYMENT_FIELDS = ('is_paid', 'payment_method', 'paid_at')
+    tracked_fields = PAYMENT_FIELDS + BILLED_FIELDS
+
+    class Meta:
+        indexes = [
+            # Receivables (unpaid invoices), newest first: finance.receivables
+            models.Index(fields=['-created_at', '-id'], condition=models.Q(is_paid=False), name='invoice_open_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.is_paid:
+            self.paid_at = None
+        elif self.paid_at is None:
+            self.paid_at = timezone.now()
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Invoice #{self.id} - {self.booking}"
@@ -146,6 +239,12 @@ class KhataLedger(models.Model):
     related_booking = models.ForeignKey(Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name='khata_charges')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Per-customer statements and running balances: finance.khata
+            models.Index(fields=['customer', 'created_at', 'id'], name='khata_customer_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} of ₹{self.amount} for {self.customer}"
 
@@ -164,3 +263,44 @@ class DailyRegisterAudit(models.Model):
 
     def __str__(self):
         return f"Audit for {self.date} - Locked: {self.is_locked}"
+
+class DailyFinanceRollup(models.Model):
+    """
+    One row of financial totals per day, kept current as invoices, chemical
+    usage, payroll and expenses are written (see finance.rollups), so the
+    dashboards read one row per day instead of every transaction.
+    """
+    date = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    paid_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    cash_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    card_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    online_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    split_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    khata_charged = models.DecimalField(max_digits=12, decimal_places=2, default=0.00, help_text="Invoice amounts put on khata (credit)")
+    chemical_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    labor_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    expenses = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    invoice_count = models.PositiveIntegerField(default=0)
+    booking_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Rollup {self.date}: revenue {self.revenue}"
+
+class DailyRegisterSnapshot(models.Model):
+    """
+    Frozen figures for a day whose register is closed (see finance.snapshots).
+    Locked days can no longer change, so reports read this row instead of
+    recomputing the day from raw invoices, bookings and expenses.
+    """
+    audit = models.OneToOneField(DailyRegisterAudit, on_delete=models.CASCADE, related_name='snapshot')
+    date = models.DateField(unique=True)
+    totals = models.JSONField(default=dict, help_text="Revenue, payment method splits, costs, counts and tax portion")
+    packages = models.JSONField(default=list, help_text="[{name, count, revenue}] for completed bookings")
+    technicians = models.JSONField(default=list, help_text="[{username, name, count}] for completed bookings")
+    hours = models.JSONField(default=dict, help_text="Completed bookings per hour of the day")
+    ledger = models.JSONField(default=list, help_text="Invoice ledger rows, as exported")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Snapshot for {self.date}"
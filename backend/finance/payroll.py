@@ -0,0 +1,174 @@
+"""
+Batch payroll runs.
+
+run_payroll() computes every staff member's PayrollEntry for each day of a
+period (a day, an ISO week or a month) from three GROUP BY queries:
+
+- commission on bookings completed that day (see completion_date): the package's CommissionRule if
+  it has a flat amount or percentage, else the technician's
+  StaffProfile.commission_rate (the same rule as logic.process_payroll_event);
+- wages for closed TimeEntry shifts clocked in that day, at the profile's
+  hourly_rate;
+- cash advances (GeneralExpense in the Advances category recorded for them).
+
+Entries are then written with one bulk_create and one bulk_update, and the
+period's totals stored in a PayrollRun. A run is idempotent: re-running a
+period overwrites unsettled entries with the recomputed figures and writes
+nothing if they are unchanged. Settled entries have been paid out and are
+never touched, and tips are left as they are.
+"""
+import calendar
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, DurationField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+
+from . import rollups
+
+PERIODS = ('DAY', 'WEEK', 'MONTH')
+FIELDS = ('base_wage', 'commission_earned', 'advances')
+CENTS = Decimal('0.01')
+
+
+class PayrollError(ValueError):
+    """Invalid period; the message is safe to show to the user."""
+
+
+def period_bounds(period, day):
+    """(first, last) day of the DAY, WEEK (Monday to Sunday) or MONTH containing `day`."""
+    if period == 'DAY':
+        return day, day
+    if period == 'WEEK':
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if period == 'MONTH':
+        return day.replace(day=1), day.replace(day=calendar.monthrange(day.year, day.month)[1])
+    raise PayrollError(f'Invalid period. Valid options: {list(PERIODS)}')
+
+
+def completion_date():
+    """
+    The day a completed booking counts towards, here and in the settlement
+    ledger: when it was finished, else (bookings completed before finished_at
+    was recorded) its slot.
+    """
+    return TruncDate(Coalesce('finished_at', 'time_slot'))
+
+
+def _money(value):
+    return Decimal(value or 0).quantize(CENTS)
+
+
+def _commissions(start, end, users):
+    from bookings.models import Booking
+    rule = 'service_package__commission_rule__'
+    has_rule = Q(**{f'{rule}flat_amount__gt': 0}) | Q(**{f'{rule}percentage__gt': 0})
+    bookings = (
+        Booking.objects.filter(status='COMPLETED', technician__isnull=False, service_package__isnull=False)
+        .annotate(day=completion_date())
+        .filter(day__gte=start, day__lte=end)
+    )
+    if users is not None:
+        bookings = bookings.filter(technician__in=users)
+    # / 100.0 keeps SQLite from dividing integer-valued prices as integers.
+    return bookings.values('technician_id', 'day').annotate(amount=Sum(Case(
+        When(has_rule, then=F(f'{rule}flat_amount') + F('service_package__price') * F(f'{rule}percentage') / Value(100.0)),
+        default=F('service_package__price') * F('technician__staff_profile__commission_rate') / Value(100.0),
+        output_field=DecimalField(max_digits=12, decimal_places=4),
+    ))).order_by()
+
+
+def _wages(start, end, users):
+    from staff.models import TimeEntry
+    shifts = (
+        TimeEntry.objects.filter(clock_out_time__isnull=False)
+        .annotate(day=TruncDate('clock_in_time'))
+        .filter(day__gte=start, day__lte=end)
+    )
+    if users is not None:
+        shifts = shifts.filter(staff__user__in=users)
+    return shifts.values('staff__user_id', 'staff__hourly_rate', 'day').annotate(
+        worked=Sum(ExpressionWrapper(F('clock_out_time') - F('clock_in_time'), output_field=DurationField())),
+    ).order_by()
+
+
+def _advances(start, end, users):
+    from staff.settlement import ADVANCES_CATEGORY
+    from .models import GeneralExpense
+    advances = GeneralExpense.objects.filter(
+        category__name=ADVANCES_CATEGORY, recorded_by__isnull=False, date__gte=start, date__lte=end,
+    )
+    if users is not None:
+        advances = advances.filter(recorded_by__in=users)
+    return advances.values('recorded_by_id', 'date').annotate(amount=Sum('amount')).order_by()
+
+
+def compute(start, end, users=None):
+    """{(user id, date): {field: amount} for FIELDS} for [start, end]."""
+    figures = {}
+
+    def add(key, field, amount):
+        row = figures.setdefault(key, dict.fromkeys(FIELDS, Decimal('0')))
+        row[field] += _money(amount)
+
+    for row in _commissions(start, end, users):
+        add((row['technician_id'], row['day']), 'commission_earned', row['amount'])
+    for row in _wages(start, end, users):
+        hours = Decimal(row['worked'].total_seconds()) / 3600 if row['worked'] else 0
+        add((row['staff__user_id'], row['day']), 'base_wage', hours * row['staff__hourly_rate'])
+    for row in _advances(start, end, users):
+        add((row['recorded_by_id'], row['date']), 'advances', row['amount'])
+    return figures
+
+
+def write_entries(start, end, users=None):
+    """Store the computed figures for [start, end] (optionally only for `users`). Returns (created, updated) entries."""
+    from .models import PayrollEntry
+    figures = compute(start, end, users)
+    empty = dict.fromkeys(FIELDS, Decimal('0'))
+
+    with transaction.atomic():
+        existing = PayrollEntry.objects.filter(date__gte=start, date__lte=end).select_for_update()
+        if users is not None:
+            existing = existing.filter(staff_user__in=users)
+
+        created, updated = [], []
+        for entry in existing:
+            row = figures.pop((entry.staff_user_id, entry.date), empty)
+            if entry.is_settled:
+                continue
+            if any(getattr(entry, field) != value for field, value in row.items()):
+                for field, value in row.items():
+                    setattr(entry, field, value)
+                updated.append(entry)
+        created = [
+            PayrollEntry(staff_user_id=user_id, date=date, **row)
+            for (user_id, date), row in figures.items() if any(row.values())
+        ]
+
+        # bulk_create/bulk_update send no signals; keep the daily rollup in step here.
+        PayrollEntry.objects.bulk_create(created, batch_size=500)
+        rollups.bulk_written(created, created=True)
+        if updated:
+            PayrollEntry.objects.bulk_update(updated, list(FIELDS), batch_size=500)
+            rollups.bulk_written(updated)
+    return created, updated
+
+
+def run_payroll(period, day):
+    """Run the payroll of the `period` containing `day` for all staff. Returns the PayrollRun with the period's totals."""
+    from .models import PayrollEntry, PayrollRun
+    start, end = period_bounds(period, day)
+    with transaction.atomic():
+        write_entries(start, end)
+        totals = PayrollEntry.objects.filter(date__gte=start, date__lte=end).aggregate(
+            entry_count=Count('id'),
+            total_wages=Sum('base_wage'),
+            total_commission=Sum('commission_earned'),
+            total_advances=Sum('advances'),
+        )
+        totals = {field: value or 0 for field, value in totals.items()}
+        run, _ = PayrollRun.objects.update_or_create(start=start, end=end, defaults={'period': period, **totals})
+    return run
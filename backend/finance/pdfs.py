@@ -0,0 +1,215 @@
+"""
+Invoice PDFs, cached on disk by content.
+
+A PDF is determined by its rendered HTML (invoice, booking and template), so
+the cache key is the SHA-256 of that HTML and the rendering engine. Serving an
+invoice renders the template (cheap) and only converts it to PDF (hundreds of
+ms of CPU) when no cached file has that key. Editing the invoice, booking or
+template changes the key, so a stale PDF is never served.
+
+Completed bookings have their invoice pre-rendered in a process pool once the
+transaction commits (finance.signals), so the receipt link is usually served
+straight from the cache. Pool workers receive HTML only and never touch the
+database.
+
+Bulk exports (rendered_pdfs) reuse cached files and render the rest across a
+pool with one process per CPU.
+
+Rendering refuses every URL (the template uses the engine's built-in faces),
+so a render never waits on the network.
+"""
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+TEMPLATE = 'finance/invoice_pdf.html'
+
+
+class PdfUnavailable(RuntimeError):
+    """Neither WeasyPrint nor xhtml2pdf is installed."""
+
+
+class PdfError(RuntimeError):
+    """The engine failed to convert the HTML."""
+
+
+def engine():
+    """'weasyprint' (better CSS support) if installed, else 'xhtml2pdf' (pure Python), else None."""
+    for name in ('weasyprint', 'xhtml2pdf'):
+        try:
+            __import__(name)
+            return name
+        except (ImportError, OSError):  # WeasyPrint raises OSError without its GTK libraries
+            continue
+    return None
+
+
+def render_html(booking, invoice):
+    from django.template.loader import render_to_string
+    return render_to_string(TEMPLATE, {
+        'booking': booking,
+        'invoice': invoice,
+        'customer_phone': booking.customer.phone_number if booking and booking.customer else '',
+    })
+
+
+def cache_path(html, engine_name):
+    from django.conf import settings
+    digest = hashlib.sha256(f'{engine_name}\n{html}'.encode('utf-8')).hexdigest()
+    return Path(settings.INVOICE_PDF_CACHE_DIR) / digest[:2] / f'{digest}.pdf'
+
+
+# --- Rendering (also runs in pool workers) -------------------------------------
+
+def _refuse_fetch(url, *args, **kwargs):
+    raise ValueError(f'Refusing to fetch {url} while rendering an invoice')
+
+
+def _convert(html, engine_name):
+    if engine_name == 'weasyprint':
+        from weasyprint import HTML
+
+        try:
+            return HTML(string=html, url_fetcher=_refuse_fetch).write_pdf()
+        except Exception as e:
+            raise PdfError(str(e))
+
+    from io import BytesIO
+    from xhtml2pdf import pisa
+
+    result = BytesIO()
+    pdf = pisa.CreatePDF(BytesIO(html.encode('utf-8')), dest=result, link_callback=lambda uri, rel: '')
+    if pdf.err:
+        raise PdfError('Error generating PDF.')
+    return result.getvalue()
+
+
+def render_to_cache(html, path, engine_name):
+    """Convert `html` into the cache file `path` unless it already exists. Returns the path."""
+    path = Path(path)
+    if path.exists():
+        return str(path)
+    data = _convert(html, engine_name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write then rename, so readers never see a partial file.
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return str(path)
+
+
+# --- Serving -----------------------------------------------------------------
+
+def cached_pdf(booking, invoice):
+    """Path of the invoice PDF, rendering it first if it is not cached."""
+    engine_name = engine()
+    if engine_name is None:
+        raise PdfUnavailable()
+    html = render_html(booking, invoice)
+    path = cache_path(html, engine_name)
+    if not path.exists():
+        render_to_cache(html, path, engine_name)
+    return path
+
+
+def pdf_response(booking, invoice, filename):
+    from django.http import FileResponse, HttpResponse
+    try:
+        path = cached_pdf(booking, invoice)
+    except PdfUnavailable:
+        return HttpResponse("PDF generation not available (install WeasyPrint or xhtml2pdf).", status=503)
+    except PdfError as e:
+        return HttpResponse(f"Error generating PDF: {e}", status=500)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type='application/pdf')
+
+
+# --- Pre-rendering -----------------------------------------------------------
+
+_pools = {}
+
+
+def _executor(workers):
+    """Shared process pool with `workers` processes."""
+    if workers not in _pools:
+        import atexit
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn: workers start clean instead of inheriting the server's DB connections and threads
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        atexit.register(pool.shutdown)
+        _pools[workers] = pool
+    return _pools[workers]
+
+
+def _report(future):
+    if future.exception():
+        print(f"Invoice PDF pre-render failed: {future.exception()}")
+
+
+def prerender(booking_ids):
+    """Queue background renders of the invoice PDFs of `booking_ids` that are not cached yet. Returns the futures."""
+    from django.conf import settings
+    from bookings.models import Booking
+    engine_name = engine()
+    if not settings.INVOICE_PDF_PRERENDER or engine_name is None:
+        return []
+
+    futures = []
+    bookings = Booking.objects.filter(pk__in=booking_ids).select_related(
+        'customer__user', 'vehicle', 'service_package', 'invoice'
+    )
+    for booking in bookings:
+        html = render_html(booking, getattr(booking, 'invoice', None))
+        path = cache_path(html, engine_name)
+        if not path.exists():
+            future = _executor(settings.INVOICE_PDF_WORKERS).submit(render_to_cache, html, str(path), engine_name)
+            future.add_done_callback(_report)
+            futures.append(future)
+    return futures
+
+
+
+# --- Bulk export -------------------------------------------------------------
+
+def rendered_pdfs(invoices, workers=None):
+    """
+    Yield (invoice, path) for every invoice in the queryset: cached PDFs at
+    once, the rest as the pool finishes them (not in queryset order). path is
+    None if rendering failed. At most a few renders per worker are queued at a
+    time, so memory stays bounded whatever the number of invoices.
+    """
+    from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+    engine_name = engine()
+    if engine_name is None:
+        raise PdfUnavailable()
+    workers = workers or os.cpu_count() or 1
+    pool = _executor(workers)
+
+    def finished(future):
+        invoice = pending.pop(future)
+        try:
+            return invoice, Path(future.result())
+        except Exception as e:
+            print(f"Invoice #{invoice.id} PDF failed: {e}")
+            return invoice, None
+
+    pending = {}
+    invoices = invoices.select_related(
+        'booking__customer__user', 'booking__vehicle', 'booking__service_package'
+    ).order_by('created_at', 'id')
+    for invoice in invoices.iterator(chunk_size=500):
+        html = render_html(invoice.booking, invoice)
+        path = cache_path(html, engine_name)
+        if path.exists():
+            yield invoice, path
+            continue
+        pending[pool.submit(render_to_cache, html, str(path), engine_name)] = invoice
+        if len(pending) >= workers * 4:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield finished(future)
+
+    for future in as_completed(list(pending)):
+        yield finished(future)
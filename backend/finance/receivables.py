@@ -0,0 +1,115 @@
+"""
+Accounts-receivable aging over unpaid invoices.
+
+Everything is computed in the database: invoices are bucketed by age with
+CASE/WHEN against fixed cut-off timestamps, and per-customer totals are one
+GROUP BY with conditional sums, so the cost does not grow with Python-side
+work per open invoice. An invoice's customer is its booking's customer, or
+its subscription's for membership invoices.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, CharField, Count, DurationField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+# (key, oldest age in days) from newest to oldest; a bucket ends where the next begins.
+AGING_BUCKETS = [
+    ('current', 0),       # 0-30 days
+    ('days_31_60', 31),
+    ('days_61_90', 61),
+    ('over_90', 91),
+]
+
+
+def open_invoices():
+    from .models import Invoice
+    return Invoice.objects.filter(is_paid=False).annotate(
+        customer_ref=Coalesce('booking__customer_id', 'subscription__customer_id')
+    )
+
+
+def _bucket_filters(now):
+    """{bucket: Q} selecting invoices of that age as of `now`."""
+    filters = {}
+    for i, (key, min_days) in enumerate(AGING_BUCKETS):
+        # Age in whole days >= min_days  <=>  created_at <= now - min_days.
+        q = Q(created_at__lte=now - timedelta(days=min_days)) if min_days else Q()
+        if i + 1 < len(AGING_BUCKETS):
+            q &= Q(created_at__gt=now - timedelta(days=AGING_BUCKETS[i + 1][1]))
+        filters[key] = q
+    return filters
+
+
+def aging_summary(now, invoices=None):
+    """(totals, per-customer rows), each with an amount per bucket plus total and invoice_count."""
+    from customers.models import Customer
+
+    invoices = invoices if invoices is not None else open_invoices()
+    sums = {key: Coalesce(Sum('amount', filter=q), Value(Decimal('0'))) for key, q in _bucket_filters(now).items()}
+    sums.update(total=Coalesce(Sum('amount'), Value(Decimal('0'))), invoice_count=Count('id'))
+
+    rows = list(invoices.values('customer_ref').annotate(**sums).order_by('-total', 'customer_ref'))
+    customers = Customer.objects.filter(pk__in=[r['customer_ref'] for r in rows if r['customer_ref']]).values(
+        'id', 'phone_number', 'user__first_name', 'user__last_name', 'user__username'
+    )
+    customers = {c['id']: c for c in customers}
+
+    totals = dict.fromkeys([key for key, _ in AGING_BUCKETS] + ['total'], Decimal('0'))
+    totals['invoice_count'] = 0
+    per_customer = []
+    for row in rows:
+        customer = customers.get(row.pop('customer_ref'))
+        for key in totals:
+            totals[key] += row[key]
+        per_customer.append({
+            'customer_id': customer['id'] if customer else None,
+            'customer': _name(customer) if customer else "Walk-In / Unknown",
+            'customer_phone': customer['phone_number'] if customer else "",
+            **row,
+        })
+    return totals, per_customer
+
+
+def aging_detail(now, invoices=None):
+    """Open invoices as dicts with their age and bucket, ready to paginate on (created_at, id)."""
+    invoices = invoices if invoices is not None else open_invoices()
+    bucket = Case(
+        *[When(q, then=Value(key)) for key, q in _bucket_filters(now).items() if q],
+        default=Value('current'),
+        output_field=CharField(),
+    )
+    return invoices.annotate(
+        age=ExpressionWrapper(Value(now) - F('created_at'), output_field=DurationField()),
+        bucket=bucket,
+        customer_first_name=Coalesce('booking__customer__user__first_name', 'subscription__customer__user__first_name'),
+        customer_last_name=Coalesce('booking__customer__user__last_name', 'subscription__customer__user__last_name'),
+        customer_username=Coalesce('booking__customer__user__username', 'subscription__customer__user__username'),
+        customer_phone=Coalesce('booking__customer__phone_number', 'subscription__customer__phone_number'),
+        vehicle_model=F('booking__vehicle__model'),
+        vehicle_plate=F('booking__vehicle__plate_number'),
+    ).values(
+        'id', 'created_at', 'amount', 'age', 'bucket', 'customer_ref',
+        'customer_first_name', 'customer_last_name', 'customer_username', 'customer_phone',
+        'vehicle_model', 'vehicle_plate',
+    )
+
+
+def detail_row(row):
+    """JSON shape of one aging_detail() row."""
+    name = f"{row['customer_first_name'] or ''} {row['customer_last_name'] or ''}".strip() or row['customer_username']
+    return {
+        'id': row['id'],
+        'customer_id': row['customer_ref'],
+        'customer': name or "Unknown",
+        'customer_phone': row['customer_phone'] or "No Phone",
+        'vehicle': f"{row['vehicle_model']} ({row['vehicle_plate']})" if row['vehicle_plate'] else "N/A",
+        'amount': float(row['amount']),
+        'date': row['created_at'].strftime("%Y-%m-%d"),
+        'days_outstanding': row['age'].days,
+        'bucket': row['bucket'],
+    }
+
+
+def _name(customer):
+    return f"{customer['user__first_name']} {customer['user__last_name']}".strip() or customer['user__username']
@@ -0,0 +1,105 @@
+"""
+Register-lock lookups shared by every model that is frozen once a day is closed.
+
+The set of locked dates is tiny and changes once a day, so each process keeps
+it in memory instead of querying it on every save. It is tagged with the
+version of a marker file (REGISTER_LOCK_VERSION_FILE) that every process can
+see: a lookup costs one stat() and reloads the dates when the marker has
+changed. Writes to DailyRegisterAudit replace the marker once their
+transaction commits (see finance.signals), so a day closed in one worker is
+locked in all of them from the next save on. Because the version is read
+before the dates are loaded, a load that races with a commit is simply
+reloaded on the next lookup.
+
+Until the writing transaction commits, lookups on that connection go to the
+database and leave the cached set alone, so neither an uncommitted nor a
+rolled-back lock can be cached.
+"""
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+LOCKED_MESSAGE = (
+    "Security Alert: The financial register for this date is closed. "
+    "This record is permanently locked and cannot be modified or deleted."
+)
+
+
+_local = threading.local()
+_cached = None  # (marker version, frozenset of locked dates)
+
+
+def _marker():
+    return Path(settings.REGISTER_LOCK_VERSION_FILE)
+
+
+def _version():
+    try:
+        stat = os.stat(_marker())
+    except FileNotFoundError:
+        return None
+    # Every bump replaces the file, so the inode changes even within one mtime tick.
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _bump_version():
+    marker = _marker()
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=marker.parent, prefix=marker.name, suffix='.tmp')
+    os.close(fd)
+    os.replace(tmp, marker)
+
+
+def _load_locked_dates():
+    from .models import DailyRegisterAudit
+    return frozenset(DailyRegisterAudit.objects.filter(is_locked=True).values_list('date', flat=True))
+
+
+def locked_register_dates():
+    global _cached
+    if _pending_invalidation():
+        return _load_locked_dates()
+    version, cached = _version(), _cached
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    dates = _load_locked_dates()
+    _cached = (version, dates)
+    return dates
+
+
+def invalidate_locked_register_dates():
+    global _cached
+    _cached = None
+    if not _pending_invalidation():
+        _local.pending = _Invalidation()
+        transaction.on_commit(_local.pending)
+
+
+def _pending_invalidation():
+    pending = getattr(_local, 'pending', None)
+    return pending is not None and pending.is_scheduled()
+
+
+class _Invalidation:
+    def is_scheduled(self):
+        # Rolled-back callbacks are dropped from run_on_commit, which ends the bypass.
+        connection = transaction.get_connection()
+        return connection.in_atomic_block and any(entry[1] is self for entry in connection.run_on_commit)
+
+    def __call__(self):
+        global _cached
+        if getattr(_local, 'pending', None) is self:
+            _local.pending = None
+        _cached = None
+        _bump_version()
+
+
+def check_register_lock(target_date):
+    """Raises ValidationError if the register for `target_date` is closed."""
+    if target_date in locked_register_dates():
+        raise ValidationError(LOCKED_MESSAGE)
@@ -1,27 +1,29 @@
-import csv
-import io
+import heapq
 from django.db.models import Sum
 from .models import Invoice, GeneralExpense, ExpenseCategory
+from .rollups import paid_date
+from .snapshots import LEDGER_HEADER, gst_portion, ledger_rows, live, snapshots_between, sum_totals
 
 def calculate_tax_summary(start_date, end_date):
     """
     Calculates estimated tax liability based on 18% GST.
+    Days with a closed register are read from their snapshots.
     """
-    revenue = Invoice.objects.filter(
-        created_at__date__range=[start_date, end_date], 
-        is_paid=True
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    locked = list(snapshots_between(start_date, end_date).values_list('totals', flat=True))
+    frozen = sum_totals(locked, 'paid_revenue', 'expenses')
+
+    revenue = live(Invoice.objects.filter(is_paid=True).annotate(paid_on=paid_date()).filter(
+        paid_on__range=[start_date, end_date]
+    ), 'paid_on').aggregate(total=Sum('amount'))['total'] or 0
+    revenue += frozen['paid_revenue']
     
-    expenses = GeneralExpense.objects.filter(
+    expenses = live(GeneralExpense.objects.filter(
         date__range=[start_date, end_date]
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    ), 'date').aggregate(total=Sum('amount'))['total'] or 0
+    expenses += frozen['expenses']
     
-    # Simple GST Calculation (assuming all revenue is taxable at 18%)
-    gst_collected = float(revenue) * 0.18  # This is usually inclusive or exclusive. Let's assume Price is inclusive.
-    # Actually, usually Price = Base + Tax. If inclusive: Tax = Price - (Price / 1.18).
-    # Let's assume EXCLUSIVE for simplicity or Inclusive: Tax = Price * (18/118).
-    # Let's go with Inclusive (Standard for B2C):
-    tax_portion = float(revenue) * (18 / 118) 
+    # Prices are GST-inclusive (standard for B2C): Tax = Price * (18/118).
+    tax_portion = float(gst_portion(revenue))
     
     return {
         'total_revenue': float(revenue),
@@ -30,48 +32,60 @@ def calculate_tax_summary(start_date, end_date):
         'net_payable': round(tax_portion, 2) # Ignoring input tax credit for MVP
     }
 
-def export_ledger_csv(start_date, end_date):
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow(['Invoice ID', 'Date', 'Customer', 'Amount', 'Status', 'Category'])
-    
+LEDGER_FIELDS = ['invoice_id', 'date', 'customer', 'amount', 'status', 'category']
+
+EXPENSE_HEADER = ['ID', 'Date', 'Category', 'Description', 'Amount', 'Approved By']
+EXPENSE_FIELDS = ['id', 'date', 'category', 'description', 'amount', 'approved_by']
+
+def ledger_export_rows(start_date, end_date):
+    """
+    Ledger rows in date order, read lazily. Closed days come from their
+    snapshots and the rest from live invoices; no day is in both, so the two
+    date-ordered streams are simply merged.
+    """
+    frozen = (
+        row
+        for ledger in snapshots_between(start_date, end_date).values_list('ledger', flat=True).iterator(chunk_size=100)
+        for row in ledger
+    )
+    current = ledger_rows(live(Invoice.objects.filter(created_at__date__range=[start_date, end_date]), 'created_at__date'))
+    return heapq.merge(frozen, current, key=lambda row: row[1])
+
+def expense_export_rows(start_date, end_date):
+    expenses = (
+        GeneralExpense.objects.filter(date__range=[start_date, end_date])
+        .values('id', 'date', 'category__name', 'description', 'amount', 'approved_by__username')
+        .order_by('date', 'id')
+    )
+    for exp in expenses.iterator(chunk_size=2000):
+        yield [
+            exp['id'],
+            exp['date'].strftime('%Y-%m-%d'),
+            exp['category__name'] or "Uncategorized",
+            exp['description'],
+            str(exp['amount']),
+            exp['approved_by__username'] or "Auto/Pending"
+        ]
+
+def invoice_pdf_entries(start_date, end_date, customer_id=None, workers=None):
+    """
+    ZIP entries (name, path) for the PDF of every invoice in the date range,
+    optionally of one customer, in the order they are ready (see
+    finance.pdfs.rendered_pdfs). Invoices that failed to render are listed in
+    a final FAILED.txt entry.
+    """
+    from django.db.models import Q
+    from .pdfs import rendered_pdfs
+
     invoices = Invoice.objects.filter(created_at__date__range=[start_date, end_date])
-    
-    for inv in invoices:
-        customer = "Unknown"
-        if inv.booking:
-             customer = str(inv.booking.customer)
-        elif inv.subscription:
-             customer = str(inv.subscription.customer)
-             
-        writer.writerow([
-            inv.id,
-            inv.created_at.strftime('%Y-%m-%d'),
-            customer,
-            inv.amount,
-            "Paid" if inv.is_paid else "Unpaid",
-            inv.revenue_category.name if inv.revenue_category else "General"
-        ])
-        
-    return output.getvalue()
+    if customer_id:
+        invoices = invoices.filter(Q(booking__customer_id=customer_id) | Q(subscription__customer_id=customer_id))
 
-def export_expenses_csv(start_date, end_date):
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    writer.writerow(['ID', 'Date', 'Category', 'Description', 'Amount', 'Approved By'])
-    
-    expenses = GeneralExpense.objects.filter(date__range=[start_date, end_date])
-    
-    for exp in expenses:
-        writer.writerow([
-            exp.id,
-            exp.date.strftime('%Y-%m-%d'),
-            exp.category.name if exp.category else "Uncategorized",
-            exp.description,
-            exp.amount,
-            exp.approved_by.username if exp.approved_by else "Auto/Pending"
-        ])
-        
-    return output.getvalue()
+    failed = []
+    for invoice, path in rendered_pdfs(invoices, workers=workers):
+        if path is None:
+            failed.append(str(invoice.id))
+            continue
+        yield f"{invoice.created_at:%Y-%m-%d}_invoice_{invoice.id}.pdf", path
+    if failed:
+        yield 'FAILED.txt', ('Invoices that could not be rendered: ' + ', '.join(failed) + '\n').encode('utf-8')
@@ -0,0 +1,301 @@
+"""
+Incrementally maintained daily finance totals (DailyFinanceRollup) and
+per-chemical daily usage (ChemicalDailyUsage).
+
+Every Invoice, ChemicalUsageLog, PayrollEntry and GeneralExpense contributes
+amounts to the rollup row of one day; an invoice's payment counts on the day
+it was paid (paid_date), which can be later than the day it was billed.
+When a row is saved or deleted, the difference between its old and new
+contribution is added to the affected day(s) with a single F() UPDATE (see
+finance.signals), inside the writer's transaction, so a rollback undoes the
+rollup change too. The old contribution
+comes from the values tracked when the row was loaded (ChangeTrackingMixin).
+
+Chemical usage is also summed per chemical and day into ChemicalDailyUsage
+the same way, so consumption trends (finance.forecast) never read the log.
+
+rebuild_rollups() recomputes days from the raw tables with one GROUP BY per
+source, and rebuild_chemical_usage() the per-chemical days (manage.py
+rebuild_finance_rollups runs both). Chemical usage is valued at the unit cost
+stored on each log row (the inventory item's cost when it was logged), both
+incrementally and on rebuild, so a price change never restates past days.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+# Paid invoice amount by Invoice.payment_method.
+METHOD_FIELDS = {
+    'CASH': 'cash_revenue',
+    'CARD': 'card_revenue',
+    'ONLINE': 'online_revenue',
+    'SPLIT': 'split_revenue',
+}
+
+
+def _decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value or 0))
+
+
+def _local_date(value):
+    return timezone.localtime(value).date() if timezone.is_aware(value) else value.date()
+
+
+def paid_date():
+    """The day a paid invoice's payment counts on (invoices paid before paid_at was recorded: their billing day)."""
+    return TruncDate(Coalesce('paid_at', 'created_at'))
+
+
+# --- Contributions -----------------------------------------------------------
+# Each takes a mapping of the model's tracked field values and returns
+# (date, {rollup field: amount}), a list of them, or None if the row
+# contributes nothing yet.
+
+def _invoice(values, instance):
+    if not values['created_at']:
+        return None
+    amount = _decimal(values['amount'])
+    billed = {'revenue': amount, 'invoice_count': 1, 'khata_charged': _decimal(values['split_khata'])}
+    if values['booking_id']:
+        billed['booking_count'] = 1
+    parts = [(_local_date(values['created_at']), billed)]
+    if values['is_paid']:
+        paid = {'paid_revenue': amount}
+        if values['payment_method'] in METHOD_FIELDS:
+            paid[METHOD_FIELDS[values['payment_method']]] = amount
+        parts.append((_local_date(values['paid_at'] or values['created_at']), paid))
+    return parts
+
+
+def _chemical_usage(values, instance):
+    if not values['timestamp'] or not values['inventory_item_id']:
+        return None
+    cost = _decimal(values['amount_used']) * _decimal(values['cost_per_unit'])
+    return _local_date(values['timestamp']), {'chemical_cost': cost}
+
+
+def _payroll(values, instance):
+    labor = _decimal(values['base_wage']) + _decimal(values['commission_earned']) + _decimal(values['tips_earned'])
+    return values['date'], {'labor_cost': labor}
+
+
+def _expense(values, instance):
+    return values['date'], {'expenses': _decimal(values['amount'])}
+
+
+CONTRIBUTIONS = {
+    'Invoice': _invoice,
+    'ChemicalUsageLog': _chemical_usage,
+    'PayrollEntry': _payroll,
+    'GeneralExpense': _expense,
+}
+
+
+def _contribution(instance, values):
+    return CONTRIBUTIONS[type(instance).__name__](values, instance)
+
+
+def _loaded(instance):
+    if all(instance.is_tracked(name) for name in instance.tracked_fields):
+        return {name: instance.loaded_value(name) for name in instance.tracked_fields}
+    return None
+
+
+def _stored_values(instance):
+    """The tracked values of the row as it is in the database, before this save."""
+    if instance._state.adding or instance.pk is None:
+        return None
+    values = _loaded(instance)
+    if values is None:
+        # Loaded with only()/defer(): read what we don't know.
+        values = type(instance)._default_manager.filter(pk=instance.pk).values(*instance.tracked_fields).first()
+    return values
+
+
+def _current_values(instance):
+    return {name: getattr(instance, name) for name in instance.tracked_fields}
+
+
+# --- Maintenance ---------------------------------------------------------------
+
+def before_save(instance):
+    instance._rollup_before = _stored_values(instance)
+
+
+def after_save(instance):
+    _write([(instance, getattr(instance, '_rollup_before', None), _current_values(instance))])
+    instance._rollup_before = None
+
+
+def after_delete(instance):
+    _write([(instance, _loaded(instance) or _current_values(instance), None)])
+
+
+def bulk_written(instances, created=False):
+    """
+    Apply the changes of rows written with bulk_create/bulk_update, which send
+    no signals. Call after the write and before anything re-snapshots them.
+    """
+    _write([(instance, None if created else _stored_values(instance), _current_values(instance)) for instance in instances])
+    for instance in instances:
+        instance._snapshot_tracked_fields()
+
+
+def _write(changes):
+    """Apply [(instance, values before, values after)]; None values mean the row didn't/doesn't exist."""
+    _apply([
+        (_contribution(instance, before) if before else None, _contribution(instance, after) if after else None)
+        for instance, before, after in changes
+    ])
+    usage = [(before, after) for instance, before, after in changes if type(instance).__name__ == 'ChemicalUsageLog']
+    if usage:
+        _apply_chemical_usage(usage)
+
+
+def _apply(changes):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for before, after in changes:
+        for sign, contribution in ((-1, before), (1, after)):
+            for day, totals in contribution if isinstance(contribution, list) else filter(None, [contribution]):
+                for field, amount in totals.items():
+                    deltas[day][field] += sign * amount
+    for day, totals in sorted(deltas.items()):
+        totals = {field: amount for field, amount in totals.items() if amount}
+        if totals:
+            _add(day, totals)
+
+
+def _add(day, totals):
+    from .models import DailyFinanceRollup
+    updates = {field: F(field) + amount for field, amount in totals.items()}
+    if DailyFinanceRollup.objects.filter(date=day).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            DailyFinanceRollup.objects.create(date=day, **totals)
+    except IntegrityError:
+        # Another writer created the day first.
+        DailyFinanceRollup.objects.filter(date=day).update(**updates)
+
+
+# --- Per-chemical usage ------------------------------------------------------
+
+def _usage(values):
+    if not values or not values['timestamp'] or not values['inventory_item_id']:
+        return None
+    return (values['inventory_item_id'], _local_date(values['timestamp'])), _decimal(values['amount_used'])
+
+
+def _apply_chemical_usage(changes):
+    deltas = defaultdict(lambda: defaultdict(int))
+    for before, after in changes:
+        for sign, usage in ((-1, _usage(before)), (1, _usage(after))):
+            if usage:
+                (chemical_id, day), amount = usage
+                deltas[day][chemical_id] += sign * amount
+    for day, amounts in sorted(deltas.items()):
+        amounts = {chemical_id: amount for chemical_id, amount in amounts.items() if amount}
+        if amounts:
+            _add_usage(day, amounts)
+
+
+def _add_usage(day, amounts):
+    """Add {chemical id: amount} to the day's usage rows: one UPDATE for the existing rows, one INSERT for the rest."""
+    from .models import ChemicalDailyUsage
+    rows = ChemicalDailyUsage.objects.filter(date=day)
+    existing = set(rows.filter(chemical_id__in=amounts).values_list('chemical_id', flat=True))
+    if existing:
+        rows.filter(chemical_id__in=existing).update(amount_used=F('amount_used') + Case(
+            *[When(chemical_id=chemical_id, then=Value(amounts[chemical_id])) for chemical_id in existing],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+    missing = {chemical_id: amount for chemical_id, amount in amounts.items() if chemical_id not in existing}
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            ChemicalDailyUsage.objects.bulk_create([
+                ChemicalDailyUsage(chemical_id=chemical_id, date=day, amount_used=amount)
+                for chemical_id, amount in missing.items()
+            ])
+    except IntegrityError:
+        # Another writer created some of the rows first.
+        _add_usage(day, missing)
+
+
+# --- Rebuild -----------------------------------------------------------------
+
+def rebuild_rollups(start=None, end=None, apps=global_apps):
+    """Recompute the rollup rows for [start, end] (inclusive; open-ended if None). Returns the number of days written."""
+    Rollup = apps.get_model('finance', 'DailyFinanceRollup')
+    Invoice = apps.get_model('finance', 'Invoice')
+    ChemicalUsageLog = apps.get_model('finance', 'ChemicalUsageLog')
+    PayrollEntry = apps.get_model('finance', 'PayrollEntry')
+    GeneralExpense = apps.get_model('finance', 'GeneralExpense')
+
+    def in_range(queryset, field):
+        if start:
+            queryset = queryset.filter(**{f'{field}__gte': start})
+        if end:
+            queryset = queryset.filter(**{f'{field}__lte': end})
+        return queryset
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    sources = [
+        in_range(Invoice.objects.annotate(day=TruncDate('created_at')), 'day').values('day').annotate(
+            revenue=Sum('amount'),
+            khata_charged=Sum('split_khata'),
+            invoice_count=Count('id'),
+            booking_count=Count('booking'),
+        ),
+        in_range(Invoice.objects.filter(is_paid=True).annotate(day=paid_date()), 'day').values('day').annotate(
+            paid_revenue=Sum('amount'),
+            **{field: Sum('amount', filter=Q(payment_method=method)) for method, field in METHOD_FIELDS.items()},
+        ),
+        in_range(ChemicalUsageLog.objects.annotate(day=TruncDate('timestamp')), 'day').values('day').annotate(
+            chemical_cost=Sum(ExpressionWrapper(F('amount_used') * F('cost_per_unit'), output_field=money)),
+        ),
+        in_range(PayrollEntry.objects.annotate(day=F('date')), 'date').values('day').annotate(
+            labor_cost=Sum(F('base_wage') + F('commission_earned') + F('tips_earned'), output_field=money),
+        ),
+        in_range(GeneralExpense.objects.annotate(day=F('date')), 'date').values('day').annotate(
+            expenses=Sum('amount'),
+        ),
+    ]
+
+    days = defaultdict(dict)
+    for queryset in sources:
+        for row in queryset.order_by():
+            day = row.pop('day')
+            days[day].update({field: value for field, value in row.items() if value})
+
+    with transaction.atomic():
+        in_range(Rollup.objects.all(), 'date').delete()
+        Rollup.objects.bulk_create([Rollup(date=day, **totals) for day, totals in sorted(days.items())], batch_size=500)
+    return len(days)
+
+
+def rebuild_chemical_usage(start=None, end=None, apps=global_apps):
+    """Recompute ChemicalDailyUsage for [start, end] with one GROUP BY over the usage log."""
+    Usage = apps.get_model('finance', 'ChemicalDailyUsage')
+    ChemicalUsageLog = apps.get_model('finance', 'ChemicalUsageLog')
+    logs = ChemicalUsageLog.objects.annotate(day=TruncDate('timestamp'))
+    rows = Usage.objects.all()
+    if start:
+        logs, rows = logs.filter(day__gte=start), rows.filter(date__gte=start)
+    if end:
+        logs, rows = logs.filter(day__lte=end), rows.filter(date__lte=end)
+    totals = logs.values('inventory_item_id', 'day').annotate(amount=Sum('amount_used')).order_by()
+
+    with transaction.atomic():
+        rows.delete()
+        Usage.objects.bulk_create([
+            Usage(chemical_id=row['inventory_item_id'], date=row['day'], amount_used=row['amount'])
+            for row in totals if row['amount']
+        ], batch_size=500)
+
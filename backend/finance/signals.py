@@ -1,16 +1,12 @@
-from django.db.models.signals import pre_save, pre_delete
+from django.db.models.signals import pre_save, pre_delete, post_save, post_delete
 from django.dispatch import receiver
-from django.core.exceptions import ValidationError
 from django.utils import timezone
-from .models import GeneralExpense, KhataLedger, DailyRegisterAudit
+from .models import GeneralExpense, KhataLedger, DailyRegisterAudit, Invoice, ChemicalUsageLog, PayrollEntry
+from .register_lock import check_register_lock, invalidate_locked_register_dates
+from bookings.events import booking_event_subscriber
+from . import pdfs, rollups, snapshots
 
-def check_register_lock(target_date):
-    """
-    Checks if a DailyRegisterAudit exists and is locked for the given date.
-    Raises ValidationError if locked.
-    """
-    if DailyRegisterAudit.objects.filter(date=target_date, is_locked=True).exists():
-        raise ValidationError("Security Alert: The financial register for this date is closed. This record is permanently locked and cannot be modified or deleted.")
+ROLLUP_SOURCES = [Invoice, ChemicalUsageLog, PayrollEntry, GeneralExpense]
 
 @receiver([pre_save, pre_delete], sender=GeneralExpense)
 def freeze_general_expense(sender, instance, **kwargs):
@@ -22,3 +18,58 @@ def freeze_general_expense(sender, instance, **kwargs):
 def freeze_khata_ledger(sender, instance, **kwargs):
     target_date = (getattr(instance, 'created_at', None) or timezone.now()).date()
     check_register_lock(target_date)
+
+@receiver(pre_save, sender=Invoice)
+def freeze_invoice(sender, instance, **kwargs):
+    # What an invoice bills belongs to the day it was created, its payment to the day it was paid,
+    # so a closed day's credit invoice can still be collected on an open day.
+    if instance.pk is None or any(instance.has_changed(name) for name in Invoice.BILLED_FIELDS):
+        check_register_lock((instance.created_at or timezone.now()).date())
+    if any(instance.has_changed(name) for name in Invoice.PAYMENT_FIELDS):
+        if instance.pk is not None and instance.loaded_value('is_paid'):
+            check_register_lock((instance.loaded_value('paid_at') or instance.created_at).date())
+        if instance.is_paid:
+            check_register_lock((instance.paid_at or timezone.now()).date())
+
+@receiver(pre_delete, sender=Invoice)
+def freeze_invoice_delete(sender, instance, **kwargs):
+    check_register_lock((instance.created_at or timezone.now()).date())
+
+@receiver([post_save, post_delete], sender=DailyRegisterAudit)
+def refresh_register_locks(sender, instance, **kwargs):
+    invalidate_locked_register_dates()
+
+@receiver(post_save, sender=DailyRegisterAudit)
+def freeze_register_snapshot(sender, instance, raw=False, **kwargs):
+    # Locked days can't change any more: store their report figures once.
+    if raw:
+        return
+    if instance.is_locked:
+        snapshots.freeze_day(instance)
+    else:
+        snapshots.snapshots_between(instance.date, instance.date).delete()
+
+def remember_rollup_contribution(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.before_save(instance)
+
+def update_rollup_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        rollups.after_save(instance)
+
+def update_rollup_on_delete(sender, instance, **kwargs):
+    rollups.after_delete(instance)
+
+# Keep DailyFinanceRollup in step with every row that feeds it.
+for model in ROLLUP_SOURCES:
+    pre_save.connect(remember_rollup_contribution, sender=model)
+    post_save.connect(update_rollup_on_save, sender=model)
+    post_delete.connect(update_rollup_on_delete, sender=model)
+
+
+@booking_event_subscriber
+def prerender_invoice_pdfs(booking_events):
+    # Checkout just created or paid these invoices; render their PDFs ahead of the first download.
+    completed = [event.booking_id for event in booking_events if event.entered('COMPLETED')]
+    if completed:
+        pdfs.prerender(completed)
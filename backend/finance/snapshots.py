@@ -0,0 +1,165 @@
+"""
+Frozen report figures for days whose register is closed.
+
+Once close_register locks a day, that day's bookings, expenses and khata
+entries can no longer be written (see finance.register_lock), so its report
+figures are computed once, when the lock is saved, and stored in a
+DailyRegisterSnapshot. Reports then read snapshots for locked days and only
+query raw rows for the remaining days: live() excludes every snapshotted day
+with a subquery.
+
+A snapshot is the day as it stood at close. Unlocking a day deletes its
+snapshot and reports go back to live figures for it. Paid revenue counts on
+the day of payment (rollups.paid_date), so an invoice of a closed day that is
+paid later shows up on the later day, and the closed day's figures stay put.
+"""
+from collections import Counter
+from decimal import Decimal
+
+from django.apps import apps as global_apps
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from .rollups import paid_date
+
+# Prices are GST-inclusive (B2C): tax = price * 18/118.
+GST_INCLUSIVE_PORTION = Decimal('18') / Decimal('118')
+
+LEDGER_HEADER = ['Invoice ID', 'Date', 'Customer', 'Amount', 'Status', 'Category']
+LEDGER_VALUES = (
+    'id', 'created_at', 'amount', 'is_paid', 'revenue_category__name',
+    'booking_id', 'booking__customer__user__username', 'subscription__customer__user__username',
+)
+
+PAYMENT_METHODS = ('CASH', 'CARD', 'ONLINE', 'SPLIT')
+
+
+def gst_portion(amount):
+    return (Decimal(amount) * GST_INCLUSIVE_PORTION).quantize(Decimal('0.01'))
+
+
+def ledger_rows(invoices):
+    """Ledger export rows for an Invoice queryset, streamed from one query."""
+    for inv in invoices.values(*LEDGER_VALUES).order_by('created_at', 'id').iterator(chunk_size=2000):
+        if inv['booking_id']:
+            customer = inv['booking__customer__user__username'] or "Unknown"
+        else:
+            customer = inv['subscription__customer__user__username'] or "Unknown"
+        yield [
+            inv['id'],
+            timezone.localtime(inv['created_at']).strftime('%Y-%m-%d'),
+            customer,
+            str(inv['amount']),
+            "Paid" if inv['is_paid'] else "Unpaid",
+            inv['revenue_category__name'] or "General",
+        ]
+
+
+def freeze_day(audit, apps=global_apps):
+    """Create the snapshot for a locked DailyRegisterAudit (no-op if it already has one)."""
+    Snapshot = apps.get_model('finance', 'DailyRegisterSnapshot')
+    if Snapshot.objects.filter(date=audit.date).exists():
+        return None
+
+    Invoice = apps.get_model('finance', 'Invoice')
+    Booking = apps.get_model('bookings', 'Booking')
+    day = audit.date
+
+    invoices = Invoice.objects.filter(created_at__date=day)
+    money = invoices.aggregate(revenue=Sum('amount'), khata=Sum('split_khata'))
+    money.update(Invoice.objects.filter(is_paid=True).annotate(paid_on=paid_date()).filter(paid_on=day).aggregate(
+        paid_revenue=Sum('amount'),
+        **{method.lower(): Sum('amount', filter=Q(payment_method=method)) for method in PAYMENT_METHODS},
+    ))
+    money.update(_costs(apps, day))
+    money = {key: value or Decimal('0') for key, value in money.items()}
+    money['tax_collected'] = gst_portion(money['paid_revenue'])
+
+    bookings = Booking.objects.filter(created_at__date=day, status='COMPLETED')
+    packages = (
+        bookings.filter(service_package__isnull=False).values('service_package__name')
+        .annotate(count=Count('id'), revenue=Sum('service_package__price')).order_by('service_package__name')
+    )
+    technicians = (
+        bookings.filter(technician__isnull=False).values('technician__username', 'technician__first_name')
+        .annotate(count=Count('id')).order_by('technician__username')
+    )
+    hours = bookings.annotate(hour=ExtractHour('created_at')).values('hour').annotate(count=Count('id')).order_by('hour')
+
+    totals = {key: str(value) for key, value in money.items()}
+    totals['invoice_count'] = invoices.count()
+    totals['booking_count'] = bookings.count()
+    return Snapshot.objects.create(
+        audit_id=audit.pk,
+        date=day,
+        totals=totals,
+        packages=[
+            {'name': p['service_package__name'], 'count': p['count'], 'revenue': str(p['revenue'] or 0)}
+            for p in packages
+        ],
+        technicians=[
+            {'username': t['technician__username'], 'name': t['technician__first_name'] or t['technician__username'], 'count': t['count']}
+            for t in technicians
+        ],
+        hours={str(h['hour']): h['count'] for h in hours},
+        ledger=list(ledger_rows(invoices)),
+    )
+
+
+def _costs(apps, day):
+    GeneralExpense = apps.get_model('finance', 'GeneralExpense')
+    PayrollEntry = apps.get_model('finance', 'PayrollEntry')
+    ChemicalUsageLog = apps.get_model('finance', 'ChemicalUsageLog')
+    money = DecimalField(max_digits=12, decimal_places=2)
+    return {
+        'expenses': GeneralExpense.objects.filter(date=day).aggregate(total=Sum('amount'))['total'],
+        'labor': PayrollEntry.objects.filter(date=day).aggregate(
+            total=Sum(F('base_wage') + F('commission_earned') + F('tips_earned'), output_field=money)
+        )['total'],
+        'chemical_cost': ChemicalUsageLog.objects.filter(timestamp__date=day).aggregate(
+            total=Sum(ExpressionWrapper(F('amount_used') * F('cost_per_unit'), output_field=money))
+        )['total'],
+    }
+
+
+# --- Reading -----------------------------------------------------------------
+
+def snapshots_between(start=None, end=None):
+    from .models import DailyRegisterSnapshot
+    snapshots = DailyRegisterSnapshot.objects.all()
+    if start:
+        snapshots = snapshots.filter(date__gte=start)
+    if end:
+        snapshots = snapshots.filter(date__lte=end)
+    return snapshots.order_by('date')
+
+
+def live(queryset, date_lookup):
+    """`queryset` without the rows of snapshotted days, e.g. live(invoices, 'created_at__date')."""
+    from .models import DailyRegisterSnapshot
+    return queryset.exclude(**{f'{date_lookup}__in': DailyRegisterSnapshot.objects.values('date')})
+
+
+def sum_totals(totals_list, *keys):
+    """Sum money `keys` over snapshot `totals` dicts."""
+    sums = dict.fromkeys(keys, Decimal('0'))
+    for totals in totals_list:
+        for key in keys:
+            sums[key] += Decimal(totals.get(key, '0'))
+    return sums
+
+
+def merge_breakdowns(snapshots):
+    """Combined (hours, packages, technicians) Counters over snapshots loaded with those fields."""
+    hours, packages, revenue, technicians, names = Counter(), Counter(), Counter(), Counter(), {}
+    for snapshot in snapshots:
+        for hour, count in snapshot['hours'].items():
+            hours[int(hour)] += count
+        for package in snapshot['packages']:
+            packages[package['name']] += package['count']
+            revenue[package['name']] += Decimal(package['revenue'])
+        for technician in snapshot['technicians']:
+            technicians[technician['username']] += technician['count']
+            names[technician['username']] = technician['name']
+    return hours, (packages, revenue), (technicians, names)
@@ -1,13 +1,31 @@
-from django.test import TestCase
+import gzip
+import json
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.test import TestCase, override_settings
 from django.utils import timezone
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from bookings.models import Booking, ServicePackage
-from customers.models import Customer
+from customers.models import Customer, CustomerVehicle
 from fleet.models import Vehicle
-from finance.models import Invoice
+from finance import pdfs, register_lock
+from finance.forecast import forecast
+from finance.khata import reconcile
+from finance.logic import calculate_wash_cost
+from finance.models import (
+    ChemicalDailyUsage, ChemicalInventory, ChemicalUsageLog, DailyFinanceRollup, DailyRegisterAudit,
+    DailyRegisterSnapshot, ExpenseCategory, GeneralExpense, Invoice, KhataLedger, PayrollEntry, RecipeLine,
+)
+from finance.rollups import rebuild_chemical_usage, rebuild_rollups
 from django.contrib.auth.models import User
 from rest_framework.test import APIClient
 from rest_framework import status
 
+
 class InvoiceTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='driver', password='password')
@@ -55,3 +73,687 @@ class InvoiceTest(TestCase):
         invoice.refresh_from_db()
         self.assertTrue(invoice.is_paid)
         self.assertEqual(invoice.payment_method, 'CASH')
+
+
+class DailyFinanceRollupTest(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.manager = User.objects.create_user(username='manager', password='password', is_staff=True)
+        self.customer = Customer.objects.create(user=User.objects.create_user(username='cust', password='pwd'))
+        self.vehicle = CustomerVehicle.objects.create(customer=self.customer.user, make='Test', model='Car', plate_number='KL-12')
+        self.package = ServicePackage.objects.create(name='Premium Wash', price=500, duration_minutes=60, description='Premium')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def rollup(self, day=None):
+        return DailyFinanceRollup.objects.get(date=day or self.today)
+
+    def snapshot(self):
+        fields = [f.name for f in DailyFinanceRollup._meta.fields if f.name != 'id']
+        return list(DailyFinanceRollup.objects.order_by('date').values(*fields))
+
+    def test_writes_update_the_day_incrementally(self):
+        booking = Booking.objects.create(customer=self.customer, vehicle=self.vehicle, service_package=self.package,
+                                         time_slot=timezone.now(), status='COMPLETED')
+        invoice = Invoice.objects.create(booking=booking, amount=500)
+        Invoice.objects.create(amount=200, is_paid=True, payment_method='CARD')
+        invoice.is_paid, invoice.payment_method, invoice.split_cash = True, 'CASH', 500
+        invoice.save()
+
+        soap = ChemicalInventory.objects.create(name='Soap', current_volume=100, cost_per_unit=Decimal('2.50'))
+        ChemicalUsageLog.objects.create(inventory_item=soap, booking=booking, amount_used=4)
+        entry = PayrollEntry.objects.create(staff_user=self.manager, date=self.today, commission_earned=100)
+        entry.tips_earned = 20
+        entry.save()
+        expense = GeneralExpense.objects.create(amount=300, date=self.today)
+
+        rollup = self.rollup()
+        self.assertEqual((rollup.revenue, rollup.paid_revenue), (Decimal('700'), Decimal('700')))
+        self.assertEqual((rollup.cash_revenue, rollup.card_revenue), (Decimal('500'), Decimal('200')))
+        self.assertEqual((rollup.invoice_count, rollup.booking_count), (2, 1))
+        self.assertEqual(rollup.chemical_cost, Decimal('10'))
+        self.assertEqual(rollup.labor_cost, Decimal('120'))
+        self.assertEqual(rollup.expenses, Decimal('300'))
+
+        # Moving an expense to another day moves its amount; deletes subtract.
+        yesterday = self.today - timedelta(days=1)
+        expense.date = yesterday
+        expense.save()
+        Invoice.objects.filter(payment_method='CARD').delete()
+        self.assertEqual(self.rollup().expenses, Decimal('0'))
+        self.assertEqual(self.rollup(yesterday).expenses, Decimal('300'))
+        self.assertEqual(self.rollup().revenue, Decimal('500'))
+
+        incremental = self.snapshot()
+        rebuild_rollups()
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_price_changes_do_not_restate_logged_usage(self):
+        soap = ChemicalInventory.objects.create(name='Soap', current_volume=100, cost_per_unit=Decimal('2.50'))
+        kept = ChemicalUsageLog.objects.create(inventory_item=soap, amount_used=4)
+        removed = ChemicalUsageLog.objects.create(inventory_item=soap, amount_used=2)
+        self.assertEqual(self.rollup().chemical_cost, Decimal('15'))
+
+        soap.cost_per_unit = Decimal('10')
+        soap.save()
+        kept = ChemicalUsageLog.objects.get(pk=kept.pk)
+        kept.amount_used = 3
+        kept.save()
+        ChemicalUsageLog.objects.get(pk=removed.pk).delete()
+
+        # Reversed and re-added at the 2.50 each log was valued at, not today's 10.
+        self.assertEqual(self.rollup().chemical_cost, Decimal('7.5'))
+        rebuild_rollups()
+        self.assertEqual(self.rollup().chemical_cost, Decimal('7.5'))
+
+    def test_bulk_close_updates_rollup(self):
+        for _ in range(3):
+            Booking.objects.create(customer=self.customer, vehicle=self.vehicle, service_package=self.package,
+                                   time_slot=timezone.now(), status='READY')
+        response = self.client.post('/api/bookings/bulk-transition/', {
+            'from_status': 'READY', 'new_status': 'COMPLETED', 'payment_method': 'ONLINE',
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        rollup = self.rollup()
+        self.assertEqual(rollup.booking_count, 3)
+        self.assertEqual(rollup.online_revenue, Decimal('1500'))
+
+    def test_dashboard_reads_rollup_rows(self):
+        Invoice.objects.create(amount=400, is_paid=True, payment_method='CASH')
+        GeneralExpense.objects.create(amount=150, date=self.today)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/finance/dashboard/kpi_summary/')
+        self.assertEqual(response.data['revenue_today'], Decimal('400'))
+        self.assertEqual(response.data['net_profit_today'], 250.0)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/finance/dashboard/revenue_chart/')
+        self.assertEqual(len(response.data), 7)
+        self.assertEqual(response.data[-1]['value'], Decimal('400'))
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/finance/dashboard/monthly_trends/')
+        self.assertEqual(response.data[-1], {'month': self.today.strftime('%b'), 'income': 400.0, 'expense': 150.0})
+
+
+class FinanceSeriesTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='manager', password='password', is_staff=True))
+        for day, revenue, expenses in [(date(2025, 1, 6), 100, 10), (date(2025, 1, 12), 50, 0), (date(2025, 3, 31), 25, 5)]:
+            DailyFinanceRollup.objects.create(date=day, revenue=revenue, expenses=expenses, booking_count=1)
+
+    def get(self, **params):
+        return self.client.get('/api/finance/dashboard/series/', params)
+
+    def test_a_year_of_daily_revenue_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.get(metrics='revenue', start='2025-01-01', end='2025-12-31')
+        self.assertEqual(response.status_code, 200, response.data)
+        buckets = response.data['buckets']
+        self.assertEqual(len(buckets), 365)
+        self.assertEqual(buckets[5], {'bucket': '2025-01-06', 'revenue': 100.0})
+        self.assertEqual(buckets[6], {'bucket': '2025-01-07', 'revenue': 0.0})
+
+    def test_week_and_month_buckets(self):
+        # 2025-01-06 is a Monday: both January days fall in one week.
+        weeks = self.get(metrics='revenue,booking_count', start='2025-01-01', end='2025-01-31', granularity='week').data['buckets']
+        self.assertEqual(weeks[0]['bucket'], '2024-12-30')
+        self.assertEqual(weeks[1], {'bucket': '2025-01-06', 'revenue': 150.0, 'booking_count': 2})
+
+        months = self.get(metrics='revenue,expense', start='2025-01-01', end='2025-04-30', granularity='month').data['buckets']
+        self.assertEqual([(m['bucket'], m['revenue'], m['expense']) for m in months], [
+            ('2025-01-01', 150.0, 10.0), ('2025-02-01', 0.0, 0.0), ('2025-03-01', 25.0, 5.0), ('2025-04-01', 0.0, 0.0),
+        ])
+
+    def test_hourly_buckets_come_from_invoices(self):
+        invoice = Invoice.objects.create(amount=80, is_paid=True, payment_method='CASH')
+        Invoice.objects.filter(pk=invoice.pk).update(created_at=timezone.make_aware(datetime(2025, 5, 2, 14, 35)))
+
+        with self.assertNumQueries(1):
+            response = self.get(metrics='revenue,paid_revenue', start='2025-05-02', end='2025-05-02', granularity='hour')
+        buckets = response.data['buckets']
+        self.assertEqual(len(buckets), 24)
+        self.assertEqual((buckets[14]['revenue'], buckets[14]['paid_revenue']), (80.0, 80.0))
+        self.assertEqual(buckets[13]['revenue'], 0.0)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.get(metrics='profit').status_code, 400)
+        self.assertEqual(self.get(granularity='year').status_code, 400)
+        self.assertEqual(self.get(metrics='labor', granularity='hour').status_code, 400)
+        self.assertEqual(self.get(start='2025-02-01', end='2025-01-01').status_code, 400)
+        self.assertEqual(self.get(start='2000-01-01', end='2025-01-01', granularity='hour').status_code, 400)
+        self.assertEqual(self.get(start='2025-02-30').status_code, 400)
+        self.assertEqual(self.get(start='01/02/2025').status_code, 400)
+        self.assertEqual(self.get(end='yesterday').status_code, 400)
+
+
+class RegisterSnapshotTest(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+        self.manager = User.objects.create_user(username='manager', password='password', is_staff=True)
+        self.washer = User.objects.create_user(username='washer', password='password', first_name='Anu')
+        self.customer = Customer.objects.create(user=User.objects.create_user(username='cust', password='pwd'))
+        self.vehicle = CustomerVehicle.objects.create(customer=self.customer.user, make='Test', model='Car', plate_number='KL-13')
+        self.package = ServicePackage.objects.create(name='Premium Wash', price=118, duration_minutes=60, description='Premium')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+        # Yesterday: one paid wash, left open. Today: two paid washes and an expense, then closed.
+        self.open_invoice = self.complete(paid=True)
+        Booking.objects.filter(pk=self.open_invoice.booking_id).update(created_at=timezone.now() - timedelta(days=1))
+        Invoice.objects.filter(pk=self.open_invoice.pk).update(created_at=timezone.now() - timedelta(days=1),
+                                                               paid_at=timezone.now() - timedelta(days=1))
+        self.closed_invoices = [self.complete(paid=True), self.complete(paid=True)]
+        GeneralExpense.objects.create(amount=40, date=self.today)
+        self.assertEqual(self.client.post('/api/finance/close-register/').status_code, 200)
+
+    def complete(self, paid):
+        booking = Booking.objects.create(customer=self.customer, vehicle=self.vehicle, service_package=self.package,
+                                         technician=self.washer, time_slot=timezone.now(), status='COMPLETED')
+        return Invoice.objects.create(booking=booking, amount=118, is_paid=paid, payment_method='CASH' if paid else None)
+
+    def test_close_register_freezes_the_day(self):
+        snapshot = DailyRegisterSnapshot.objects.get(date=self.today)
+        self.assertEqual(Decimal(snapshot.totals['paid_revenue']), Decimal('236'))
+        self.assertEqual(Decimal(snapshot.totals['cash']), Decimal('236'))
+        self.assertEqual(Decimal(snapshot.totals['tax_collected']), Decimal('36.00'))
+        self.assertEqual(snapshot.totals['booking_count'], 2)
+        self.assertEqual([(p['name'], p['count'], Decimal(p['revenue'])) for p in snapshot.packages], [('Premium Wash', 2, Decimal('236'))])
+        self.assertEqual(snapshot.technicians, [{'username': 'washer', 'name': 'Anu', 'count': 2}])
+        self.assertEqual([row[0] for row in snapshot.ledger], [inv.id for inv in self.closed_invoices])
+
+    def test_reports_read_snapshots_for_locked_days(self):
+        # Rewriting a closed day's raw rows behind the lock's back doesn't change its reports.
+        Invoice.objects.filter(pk__in=[inv.pk for inv in self.closed_invoices]).update(amount=1000)
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/finance/reports/tax_summary/', {'start': self.yesterday, 'end': self.today})
+        self.assertEqual(response.data['total_revenue'], 354.0)
+        self.assertEqual(response.data['total_expenses'], 40.0)
+        self.assertEqual(response.data['tax_collected'], 54.0)
+
+        response = self.client.get('/api/finance/reports/export_ledger/', {'start': self.yesterday, 'end': self.today})
+        ledger = b''.join(response.streaming_content).decode()
+        lines = ledger.strip().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith(f'{self.open_invoice.id},{self.yesterday}'))
+        self.assertNotIn('1000', ledger)
+
+        analytics = self.client.get('/api/finance/analytics/').data
+        self.assertEqual(analytics['packages'], [{'name': 'Premium Wash', 'total_washes': 3, 'total_revenue': 354.0}])
+        self.assertEqual(analytics['top_staff'], [{'name': 'Anu', 'jobs_completed': 3}])
+        self.assertEqual(sum(hour['count'] for hour in analytics['busiest_hours']), 3)
+
+    def test_paying_after_close_needs_an_open_day(self):
+        invoice = self.closed_invoices[0]
+        Invoice.objects.filter(pk=invoice.pk).update(is_paid=False, payment_method=None, paid_at=None)
+
+        # Today is closed, so the payment has no open day to count on.
+        response = self.client.post(f'/api/finance/invoices/{invoice.id}/mark_paid/')
+        self.assertEqual(response.status_code, 400)
+        invoice.refresh_from_db()
+        self.assertFalse(invoice.is_paid)
+
+    def test_unlocking_drops_the_snapshot(self):
+        audit = DailyRegisterAudit.objects.get(date=self.today)
+        audit.is_locked = False
+        audit.save()
+        self.assertFalse(DailyRegisterSnapshot.objects.exists())
+
+
+class ClosedDayCreditTest(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(username='manager', password='password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+
+        # A credit (unpaid) invoice billed yesterday, then yesterday's register closed.
+        self.invoice = Invoice.objects.create(amount=300)
+        Invoice.objects.filter(pk=self.invoice.pk).update(created_at=timezone.now() - timedelta(days=1))
+        rebuild_rollups()
+        DailyRegisterAudit.objects.create(date=self.yesterday, closed_by=self.manager, gross_revenue=0,
+                                          expected_cash_in_till=0, total_expenses=0)
+        self.invoice.refresh_from_db()
+
+    def test_credit_invoice_from_a_closed_day_is_collected_today(self):
+        frozen = DailyRegisterSnapshot.objects.get(date=self.yesterday).totals
+
+        response = self.client.post(f'/api/finance/invoices/{self.invoice.id}/mark_paid/')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.invoice.refresh_from_db()
+        self.assertTrue(self.invoice.is_paid)
+        self.assertEqual(self.invoice.paid_at.date(), self.today)
+
+        # Billed yesterday, paid today: the closed day's figures don't move.
+        self.assertEqual(DailyRegisterSnapshot.objects.get(date=self.yesterday).totals, frozen)
+        self.assertEqual(DailyFinanceRollup.objects.get(date=self.yesterday).revenue, Decimal('300'))
+        self.assertEqual(DailyFinanceRollup.objects.get(date=self.yesterday).paid_revenue, Decimal('0'))
+        self.assertEqual(DailyFinanceRollup.objects.get(date=self.today).cash_revenue, Decimal('300'))
+        summary = self.client.get('/api/finance/reports/tax_summary/', {'start': self.today, 'end': self.today}).data
+        self.assertEqual(summary['total_revenue'], 300.0)
+        incremental = list(DailyFinanceRollup.objects.order_by('date').values_list('date', 'revenue', 'paid_revenue', 'cash_revenue'))
+        rebuild_rollups()
+        self.assertEqual(list(DailyFinanceRollup.objects.order_by('date').values_list('date', 'revenue', 'paid_revenue', 'cash_revenue')), incremental)
+
+    def test_what_a_closed_day_billed_stays_locked(self):
+        self.invoice.amount = 350
+        with self.assertRaises(ValidationError):
+            self.invoice.save()
+        self.invoice.refresh_from_db()
+        with self.assertRaises(ValidationError):
+            self.invoice.delete()
+
+
+class RegisterLockAcrossProcessesTest(TestCase):
+    def setUp(self):
+        self.marker_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(REGISTER_LOCK_VERSION_FILE=f'{self.marker_dir}/register_lock.version')
+        self.settings_override.enable()
+        register_lock._cached = None
+        self.manager = User.objects.create_user(username='manager', password='password', is_staff=True)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        register_lock._cached = None
+        shutil.rmtree(self.marker_dir, ignore_errors=True)
+
+    def test_a_day_closed_by_another_worker_is_locked_here(self):
+        day = timezone.localdate()
+        register_lock.check_register_lock(day)
+        with self.assertNumQueries(0):
+            register_lock.check_register_lock(day)
+
+        # Another worker closes the day: its row commits, then it replaces the marker.
+        DailyRegisterAudit.objects.bulk_create([DailyRegisterAudit(
+            date=day, closed_by=self.manager, gross_revenue=0, expected_cash_in_till=0, total_expenses=0, is_locked=True,
+        )])
+        register_lock._bump_version()
+
+        with self.assertNumQueries(1), self.assertRaises(ValidationError):
+            register_lock.check_register_lock(day)
+        with self.assertNumQueries(0), self.assertRaises(ValidationError):
+            register_lock.check_register_lock(day)
+
+
+class StreamingExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='manager', password='password', is_staff=True))
+        self.today = timezone.localdate()
+        customer = Customer.objects.create(user=User.objects.create_user(username='cust', password='pwd'))
+        vehicle = CustomerVehicle.objects.create(customer=customer.user, make='Test', model='Car', plate_number='KL-14')
+        package = ServicePackage.objects.create(name='Basic', price=300, duration_minutes=30, description='Basic')
+        for i in range(30):
+            booking = Booking.objects.create(customer=customer, vehicle=vehicle, service_package=package,
+                                             time_slot=timezone.now(), status='COMPLETED')
+            Invoice.objects.create(booking=booking, amount=300, is_paid=i % 2 == 0)
+        chemicals = ExpenseCategory.objects.create(name='Chemicals')
+        GeneralExpense.objects.create(amount=75, date=self.today, category=chemicals, description='Foam, "pink"')
+
+    def export(self, url, **params):
+        return self.client.get(url, {'start': self.today, 'end': self.today, **params})
+
+    def test_ledger_streams_csv_with_a_fixed_number_of_queries(self):
+        with self.assertNumQueries(2):
+            response = self.export('/api/finance/reports/export_ledger/')
+            body = b''.join(response.streaming_content).decode()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = body.strip().splitlines()
+        self.assertEqual(lines[0], 'Invoice ID,Date,Customer,Amount,Status,Category')
+        self.assertEqual(len(lines), 31)
+        self.assertTrue(lines[1].endswith(f',{self.today},cust,300.00,Paid,General'))
+
+    def test_ndjson_and_gzip(self):
+        response = self.export('/api/finance/reports/export_ledger/', output='ndjson', compress='gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('.ndjson.gz', response['Content-Disposition'])
+        records = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual(len(records), 30)
+        self.assertEqual(set(records[0]), {'invoice_id', 'date', 'customer', 'amount', 'status', 'category'})
+
+        response = self.export('/api/finance/reports/export_expenses/', compress='gzip')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn(f'{self.today},Chemicals,"Foam, ""pink""",75.00,Auto/Pending', body)
+
+    def test_rejects_bad_parameters_before_streaming(self):
+        self.assertEqual(self.export('/api/finance/reports/export_ledger/', output='xlsx').status_code, 400)
+        self.assertEqual(self.export('/api/finance/reports/export_ledger/', compress='zip').status_code, 400)
+        self.assertEqual(self.client.get('/api/finance/reports/export_ledger/', {'start': '2025-02-30'}).status_code, 400)
+
+
+class ReceivablesAgingTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='manager', password='password', is_staff=True))
+        package = ServicePackage.objects.create(name='Basic', price=100, duration_minutes=30, description='Basic')
+        self.customers = []
+        for name in ('asha', 'binu'):
+            customer = Customer.objects.create(user=User.objects.create_user(username=name, password='pwd', first_name=name.title()), phone_number=f'98{len(name)}')
+            CustomerVehicle.objects.create(customer=customer.user, make='Test', model='Car', plate_number=f'KL-{name}')
+            self.customers.append(customer)
+        # asha: 10, 45, 75 and 120 days old; binu: two 5-day-old invoices and one paid.
+        ages = [(0, 10), (0, 45), (0, 75), (0, 120), (1, 5), (1, 5)]
+        for i, (who, days) in enumerate(ages):
+            self.invoice(self.customers[who], package, 100 * (i + 1), days)
+        self.invoice(self.customers[1], package, 999, 1, is_paid=True)
+
+    def invoice(self, customer, package, amount, days, is_paid=False):
+        booking = Booking.objects.create(customer=customer, vehicle=customer.user.vehicles.first(), service_package=package,
+                                         time_slot=timezone.now(), status='COMPLETED')
+        invoice = Invoice.objects.create(booking=booking, amount=amount, is_paid=is_paid)
+        Invoice.objects.filter(pk=invoice.pk).update(created_at=timezone.now() - timedelta(days=days, hours=1))
+
+    def test_buckets_and_customer_totals(self):
+        with self.assertNumQueries(3):
+            data = self.client.get('/api/finance/dashboard/ar_aging/').data
+        self.assertEqual(data['totals'], {
+            'current': Decimal('1200'), 'days_31_60': Decimal('200'), 'days_61_90': Decimal('300'),
+            'over_90': Decimal('400'), 'total': Decimal('2100'), 'invoice_count': 6,
+        })
+        binu, asha = data['customers']  # largest balance first
+        self.assertEqual((binu['customer'], binu['total'], binu['invoice_count']), ('Binu', Decimal('1100'), 2))
+        self.assertEqual((asha['customer'], asha['over_90'], asha['current']), ('Asha', Decimal('400'), Decimal('100')))
+        self.assertEqual([row['bucket'] for row in data['invoices']['results']],
+                         ['current', 'current', 'current', 'days_31_60', 'days_61_90', 'over_90'])
+        self.assertEqual(data['invoices']['results'][-1]['days_outstanding'], 120)
+
+    def test_detail_is_keyset_paginated_and_filterable(self):
+        first = self.client.get('/api/finance/dashboard/ar_aging/', {'page_size': 4}).data['invoices']
+        self.assertEqual(len(first['results']), 4)
+        second = self.client.get(first['next']).data['invoices']
+        self.assertIsNone(second['next'])
+        self.assertEqual(len(second['results']), 2)
+        self.assertEqual(second['results'][-1]['bucket'], 'over_90')
+
+        data = self.client.get('/api/finance/dashboard/ar_aging/', {'customer': self.customers[1].id}).data
+        self.assertEqual(data['totals']['total'], Decimal('1100'))
+        self.assertEqual(len(data['invoices']['results']), 2)
+
+    def test_outstanding_credit_keeps_its_shape(self):
+        with self.assertNumQueries(1):
+            rows = self.client.get('/api/finance/dashboard/outstanding_credit/').data
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[-1]['status'], 'Overdue')
+        self.assertEqual(rows[0]['status'], 'Pending')
+        self.assertEqual(rows[0]['vehicle'], 'Car (KL-binu)')
+
+
+class KhataStatementTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='manager', password='password', is_staff=True))
+        self.customer = Customer.objects.create(user=User.objects.create_user(username='khata', password='pwd'),
+                                                outstanding_balance=400, credit_limit=5000)
+        other = Customer.objects.create(user=User.objects.create_user(username='other', password='pwd'))
+        self.entry(other, 'CHARGE', 999, 1)
+        for day, kind, amount in [(1, 'CHARGE', 500), (2, 'CHARGE', 300), (3, 'SETTLEMENT', 600), (3, 'CHARGE', 200)]:
+            self.entry(self.customer, kind, amount, day)
+
+    def entry(self, customer, kind, amount, day):
+        entry = KhataLedger.objects.create(customer=customer, transaction_type=kind, amount=amount, description=kind.title())
+        KhataLedger.objects.filter(pk=entry.pk).update(created_at=timezone.make_aware(datetime(2026, 3, day, 10)))
+
+    def url(self, suffix=''):
+        return f'/api/finance/khata/{self.customer.id}/{suffix}'
+
+    def test_running_balance_on_every_page(self):
+        with self.assertNumQueries(3):
+            first = self.client.get(self.url('statement/'), {'page_size': 2}).data
+        self.assertEqual(first['balance'], 400.0)
+        self.assertEqual([(r['amount'], r['running_balance']) for r in first['results']], [(200.0, 400.0), (600.0, 200.0)])
+        second = self.client.get(first['next']).data
+        self.assertIsNone(second['next'])
+        self.assertEqual([r['running_balance'] for r in second['results']], [800.0, 500.0])
+
+        rows = self.client.get(self.url()).data
+        self.assertEqual([r['running_balance'] for r in rows], [400.0, 200.0, 800.0, 500.0])
+
+    def test_balance_as_of_date(self):
+        data = self.client.get(self.url('statement/'), {'as_of': '2026-03-02'}).data
+        self.assertEqual(data['balance'], 800.0)
+        self.assertEqual([r['running_balance'] for r in data['results']], [800.0, 500.0])
+        self.assertEqual(self.client.get(self.url('statement/'), {'as_of': '2026-02-28'}).data['balance'], 0.0)
+        self.assertEqual(self.client.get(self.url('statement/'), {'as_of': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/finance/khata/0/statement/').status_code, 404)
+
+
+class KhataBalanceTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='manager', password='password', is_staff=True, is_superuser=True))
+        self.customer = Customer.objects.create(user=User.objects.create_user(username='khata', password='pwd'),
+                                                phone_number='9847000001', credit_limit=1000)
+
+    def balance(self):
+        self.customer.refresh_from_db()
+        return self.customer.outstanding_balance
+
+    def test_charge_and_settle_keep_ledger_and_balance_equal(self):
+        response = self.client.post('/api/finance/khata/charge/', {'customer_id': self.customer.id, 'amount': '700'})
+        self.assertEqual(response.data['new_balance'], 700.0)
+        response = self.client.post('/api/finance/khata/charge/', {'customer_id': self.customer.id, 'amount': '400'})
+        self.assertEqual((response.status_code, response.data['error']), (400, 'Credit limit exceeded'))
+        response = self.client.post('/api/finance/khata/manual-charge/', {'phone': '9847000001', 'amount': '300'})
+        self.assertEqual(response.data['new_balance'], 1000.0)
+
+        # Overpayment is not kept as credit: only the 1000 due is recorded
+        response = self.client.post('/api/finance/khata/settle/', {'customer_id': self.customer.id, 'amount': '1200'})
+        self.assertEqual(response.data['new_balance'], 0.0)
+        self.assertEqual(KhataLedger.objects.get(transaction_type='SETTLEMENT').amount, Decimal('1000'))
+        self.assertEqual(self.balance(), 0)
+        self.assertEqual(reconcile(), [])
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        self.client.post('/api/finance/khata/charge/', {'customer_id': self.customer.id, 'amount': '250'})
+        Customer.objects.filter(pk=self.customer.pk).update(outstanding_balance=300)
+        [row] = reconcile()
+        self.assertEqual((row['customer_id'], row['stored'], row['ledger'], row['drift']),
+                         (self.customer.id, Decimal('300'), Decimal('250'), Decimal('50')))
+
+        out = StringIO()
+        call_command('reconcile_khata_balances', '--fix', stdout=out)
+        self.assertIn('stored ₹300.00, ledger ₹250', out.getvalue())
+        self.assertIn('Fixed 1 balance(s).', out.getvalue())
+        self.assertEqual(self.balance(), 250)
+        self.assertEqual(reconcile(), [])
+
+
+class InvoicePdfCacheTest(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        settings_override = override_settings(INVOICE_PDF_CACHE_DIR=self.cache_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='manager', password='password', is_staff=True))
+        customer = Customer.objects.create(user=User.objects.create_user(username='pdf', password='pwd'), phone_number='9847012345')
+        vehicle = CustomerVehicle.objects.create(customer=customer.user, make='Test', model='Car', plate_number='KL-07-PDF')
+        package = ServicePackage.objects.create(name='Premium Wash', price=500, duration_minutes=60, description='Premium')
+        self.booking = Booking.objects.create(customer=customer, vehicle=vehicle, service_package=package,
+                                              time_slot=timezone.now(), status='COMPLETED')
+        self.invoice = Invoice.objects.create(booking=self.booking, amount=500)
+
+    def cached_files(self):
+        return sorted(p.name for p in pdfs.Path(self.cache_dir).rglob('*.pdf'))
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_repeat_downloads_come_from_the_cache(self):
+        if pdfs.engine() is None:
+            self.skipTest('No PDF engine installed')
+        first = self.download(f'/api/finance/invoice/{self.booking.id}/pdf/')
+        self.assertTrue(first.startswith(b'%PDF'))
+        self.assertEqual(len(self.cached_files()), 1)
+
+        # Same content from either endpoint is the same cache entry
+        self.assertEqual(self.download(f'/api/finance/invoices/{self.invoice.id}/download_pdf/'), first)
+        self.assertEqual(len(self.cached_files()), 1)
+
+        # Anything printed on the invoice changing gives a new key
+        ServicePackage.objects.filter(pk=self.booking.service_package_id).update(price=550)
+        self.download(f'/api/finance/invoice/{self.booking.id}/pdf/')
+        self.assertEqual(len(self.cached_files()), 2)
+
+    def test_prerender_fills_the_cache_in_the_background(self):
+        if pdfs.engine() is None:
+            self.skipTest('No PDF engine installed')
+        with override_settings(INVOICE_PDF_PRERENDER=False):
+            self.assertEqual(pdfs.prerender([self.booking.id]), [])
+        with override_settings(INVOICE_PDF_PRERENDER=True):
+            futures = pdfs.prerender([self.booking.id])
+            self.assertEqual(len(futures), 1)
+            path = futures[0].result(timeout=60)
+            self.assertEqual(self.cached_files(), [pdfs.Path(path).name])
+            self.assertEqual(pdfs.prerender([self.booking.id]), [])
+
+    def test_bulk_export_streams_a_zip_of_cached_and_new_pdfs(self):
+        if pdfs.engine() is None:
+            self.skipTest('No PDF engine installed')
+        import io
+        import zipfile
+        self.download(f'/api/finance/invoice/{self.booking.id}/pdf/')  # cached
+        other = Customer.objects.create(user=User.objects.create_user(username='other', password='pwd'))
+        vehicle = CustomerVehicle.objects.create(customer=other.user, make='Test', model='Van', plate_number='KL-07-ZIP')
+        for n in range(2):
+            booking = Booking.objects.create(customer=other, vehicle=vehicle, service_package=self.booking.service_package,
+                                             time_slot=timezone.now(), status='COMPLETED')
+            Invoice.objects.create(booking=booking, amount=100 + n)
+
+        response = self.client.get('/api/finance/reports/export_invoice_pdfs/')
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(len(archive.namelist()), 3)
+        self.assertTrue(all(archive.read(name).startswith(b'%PDF') for name in archive.namelist()))
+        self.assertEqual(len(self.cached_files()), 3)
+
+        response = self.client.get('/api/finance/reports/export_invoice_pdfs/', {'customer': other.id})
+        names = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))).namelist()
+        self.assertEqual(len(names), 2)
+        self.assertNotIn(f'invoice_{self.invoice.id}.pdf', ' '.join(names))
+        self.assertEqual(self.client.get('/api/finance/reports/export_invoice_pdfs/', {'start': 'May'}).status_code, 400)
+
+    def test_rendering_never_fetches_remote_resources(self):
+        html = pdfs.render_html(self.booking, self.invoice)
+        self.assertNotIn('url(', html.split('</style>')[0])
+        for url in ('https://fonts.googleapis.com/css2', 'file:///etc/passwd'):
+            with self.assertRaises(ValueError):
+                pdfs._refuse_fetch(url)
+
+
+class ChemicalDeductionTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='manager', password='password', is_staff=True))
+        customer = Customer.objects.create(user=User.objects.create_user(username='cust', password='pwd'))
+        vehicle = CustomerVehicle.objects.create(customer=customer.user, make='Test', model='Car', plate_number='KL-CHEM')
+        self.package = ServicePackage.objects.create(name='Full Detail', price=2500, duration_minutes=180, description='Detail')
+        self.chemicals = [
+            ChemicalInventory.objects.create(name=name, current_volume=100, cost_per_unit=2)
+            for name in ('Foam', 'Shampoo', 'Wax', 'Polish', 'Tyre Shine', 'Glass Cleaner')
+        ]
+        for n, chemical in enumerate(self.chemicals, start=1):
+            RecipeLine.objects.create(package=self.package, chemical=chemical, amount=Decimal(n) / 2)
+        self.booking = Booking.objects.create(customer=customer, vehicle=vehicle, service_package=self.package,
+                                              time_slot=timezone.now(), status='COMPLETED')
+
+    def test_six_chemical_recipe_costs_a_fixed_handful_of_queries(self):
+        DailyFinanceRollup.objects.create(date=timezone.localdate())
+        ChemicalDailyUsage.objects.bulk_create([ChemicalDailyUsage(chemical=c, date=timezone.localdate()) for c in self.chemicals])
+        # lines, savepoint, stock UPDATE, log INSERT, rollup UPDATE, usage SELECT + UPDATE, release
+        with self.assertNumQueries(8):
+            calculate_wash_cost(self.booking)
+        volumes = list(ChemicalInventory.objects.order_by('id').values_list('current_volume', flat=True))
+        self.assertEqual(volumes, [Decimal('99.5'), Decimal('99'), Decimal('98.5'), Decimal('98'), Decimal('97.5'), Decimal('97')])
+        self.assertEqual(ChemicalUsageLog.objects.filter(booking=self.booking).count(), 6)
+        # 0.5 + 1 + ... + 3 = 10.5 units at 2 each
+        self.assertEqual(DailyFinanceRollup.objects.get(date=timezone.localdate()).chemical_cost, Decimal('21'))
+        self.assertEqual(ChemicalDailyUsage.objects.get(chemical=self.chemicals[-1]).amount_used, Decimal('3'))
+
+    def test_package_api_reads_and_writes_recipe_lines(self):
+        url = f'/api/service-packages/{self.package.id}/'
+        self.assertEqual(self.client.get(url).data['chemical_recipe']['Glass Cleaner'], Decimal('3'))
+
+        response = self.client.patch(url, {'chemical_recipe': {'foam': '1.25', 'WAX': 2}}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['chemical_recipe'], {'Foam': Decimal('1.25'), 'Wax': Decimal('2')})
+        self.assertEqual(RecipeLine.objects.filter(package=self.package).count(), 2)
+
+        response = self.client.patch(url, {'chemical_recipe': {'Ceramic Coat': 1}}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ChemicalForecastTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='manager', password='password', is_staff=True))
+        self.today = timezone.localdate()
+        self.foam = ChemicalInventory.objects.create(name='Foam', current_volume=100, cost_per_unit=2, reorder_level=40)
+        self.wax = ChemicalInventory.objects.create(name='Wax', current_volume=50, cost_per_unit=5, reorder_level=10)
+
+    def _log(self, chemical, days_ago, amount):
+        log = ChemicalUsageLog.objects.create(inventory_item=chemical, amount_used=amount)
+        ChemicalUsageLog.objects.filter(pk=log.pk).update(timestamp=timezone.now() - timedelta(days=days_ago))
+        return log
+
+    def usage(self, chemical, days_ago=0):
+        row = ChemicalDailyUsage.objects.filter(chemical=chemical, date=self.today - timedelta(days=days_ago)).first()
+        return row.amount_used if row else Decimal('0')
+
+    def test_usage_rollup_follows_log_writes(self):
+        log = ChemicalUsageLog.objects.create(inventory_item=self.foam, amount_used=3)
+        ChemicalUsageLog.objects.create(inventory_item=self.foam, amount_used=2)
+        self.assertEqual(self.usage(self.foam), Decimal('5'))
+
+        log.amount_used, log.inventory_item = 4, self.wax
+        log.save()
+        self.assertEqual((self.usage(self.foam), self.usage(self.wax)), (Decimal('2'), Decimal('4')))
+
+        log.delete()
+        self.assertEqual(self.usage(self.wax), Decimal('0'))
+
+    def test_rebuild_matches_the_log(self):
+        for days_ago in range(1, 15):
+            self._log(self.foam, days_ago, 2)
+        rebuild_chemical_usage()
+        self.assertEqual(ChemicalDailyUsage.objects.filter(chemical=self.foam).count(), 14)
+        self.assertEqual(self.usage(self.foam, days_ago=3), Decimal('2'))
+
+    def test_forecast_reads_only_the_rollups(self):
+        # Foam: 4/day over the last week, nothing before; Wax: 1/day over four weeks.
+        ChemicalDailyUsage.objects.bulk_create(
+            [ChemicalDailyUsage(chemical=self.foam, date=self.today - timedelta(days=n), amount_used=4) for n in range(1, 8)]
+            + [ChemicalDailyUsage(chemical=self.wax, date=self.today - timedelta(days=n), amount_used=1) for n in range(1, 29)]
+        )
+        with self.assertNumQueries(1):
+            foam, wax = forecast()
+
+        self.assertEqual((foam['burn_rate_short'], foam['burn_rate_long'], foam['burn_rate']), (Decimal('4'), Decimal('1'), Decimal('4')))
+        self.assertEqual(foam['days_left'], 25)
+        self.assertEqual(foam['stockout_date'], self.today + timedelta(days=25))
+        self.assertEqual(foam['reorder_date'], self.today + timedelta(days=15))
+        self.assertFalse(foam['alert'])
+        self.assertTrue(forecast(horizon=15)[0]['alert'])
+
+        self.assertEqual((wax['burn_rate'], wax['days_left'], wax['reorder_date']), (Decimal('1'), 50, self.today + timedelta(days=40)))
+
+    def test_endpoint_lists_alerts(self):
+        ChemicalInventory.objects.create(name='Polish', current_volume=5, cost_per_unit=3, reorder_level=10)
+        response = self.client.get('/api/finance/dashboard/chemical_forecast/', {'horizon': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.data['chemicals']], ['Foam', 'Polish', 'Wax'])
+        self.assertEqual([row['name'] for row in response.data['alerts']], ['Polish'])
+        self.assertIsNone(response.data['chemicals'][0]['stockout_date'])
+
+        self.assertEqual(self.client.get('/api/finance/dashboard/chemical_forecast/', {'window': 'x'}).status_code, 400)
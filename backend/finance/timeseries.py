@@ -0,0 +1,149 @@
+"""
+Time-bucketed finance metrics for charts.
+
+series() returns one entry per bucket between two dates for any of METRICS.
+Day, week and month buckets are a single GROUP BY over DailyFinanceRollup
+(one row per day, see finance.rollups). Hour buckets group the timestamped raw
+rows (invoices, chemical usage) directly. Buckets are truncated in the current
+(shop) timezone, and buckets without activity are filled with zero here.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMonth, TruncWeek
+from django.utils import timezone
+
+# Metric name -> DailyFinanceRollup field
+METRICS = {
+    'revenue': 'revenue',
+    'paid_revenue': 'paid_revenue',
+    'expense': 'expenses',
+    'labor': 'labor_cost',
+    'chemical_cost': 'chemical_cost',
+    'booking_count': 'booking_count',
+}
+# Payroll and expenses are recorded per day, so they have no hourly breakdown.
+HOURLY_METRICS = ('revenue', 'paid_revenue', 'chemical_cost', 'booking_count')
+
+GRANULARITIES = {
+    'hour': TruncHour,
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+MAX_BUCKETS = 2000
+# Shortest length of each bucket in days, to size a request before building it.
+BUCKET_DAYS = {'hour': 1 / 24, 'day': 1, 'week': 7, 'month': 28}
+
+
+class SeriesError(ValueError):
+    """Bad metrics, range or granularity; the message is safe to show to the user."""
+
+
+def series(metrics, start, end, granularity='day'):
+    """
+    [{'bucket': date or datetime, <metric>: value, ...}] for every bucket from
+    `start` to `end` (dates, inclusive), in order.
+    """
+    metrics = list(dict.fromkeys(metrics))
+    unknown = [m for m in metrics if m not in METRICS]
+    if not metrics or unknown:
+        raise SeriesError(f"Unknown metrics {unknown}. Valid options: {list(METRICS)}" if unknown else 'No metrics requested.')
+    if granularity not in GRANULARITIES:
+        raise SeriesError(f'Invalid granularity. Valid options: {list(GRANULARITIES)}')
+    if start > end:
+        raise SeriesError('start must not be after end.')
+    if granularity == 'hour':
+        daily_only = [m for m in metrics if m not in HOURLY_METRICS]
+        if daily_only:
+            raise SeriesError(f'{daily_only} are recorded per day; use day, week or month granularity.')
+
+    if ((end - start).days + 1) / BUCKET_DAYS[granularity] > MAX_BUCKETS:
+        raise SeriesError(f'Range too large: at most {MAX_BUCKETS} {granularity} buckets per request.')
+    buckets = _buckets(start, end, granularity)
+
+    if granularity == 'hour':
+        totals = _hourly_totals(metrics, start, end)
+    else:
+        totals = _rollup_totals(metrics, start, end, granularity)
+
+    rows = []
+    for bucket in buckets:
+        found = totals.get(bucket, {})
+        rows.append({'bucket': bucket, **{m: found.get(m) or 0 for m in metrics}})
+    return rows
+
+
+def _rollup_totals(metrics, start, end, granularity):
+    from .models import DailyFinanceRollup
+    trunc = GRANULARITIES[granularity]
+    rows = (
+        DailyFinanceRollup.objects.filter(date__range=(start, end))
+        .annotate(bucket=trunc('date'))
+        .values('bucket')
+        .annotate(**{m: Sum(METRICS[m]) for m in metrics})
+        .order_by()
+    )
+    return {row.pop('bucket'): row for row in rows}
+
+
+def _hourly_totals(metrics, start, end):
+    from .models import Invoice, ChemicalUsageLog
+    tz = timezone.get_current_timezone()
+    since = timezone.make_aware(datetime.combine(start, time.min), tz)
+    until = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+
+    queries = []
+    invoice_metrics = {}
+    if 'revenue' in metrics:
+        invoice_metrics['revenue'] = Sum('amount')
+    if 'paid_revenue' in metrics:
+        invoice_metrics['paid_revenue'] = Sum('amount', filter=Q(is_paid=True))
+    if 'booking_count' in metrics:
+        invoice_metrics['booking_count'] = Count('booking')
+    if invoice_metrics:
+        queries.append(
+            Invoice.objects.filter(created_at__gte=since, created_at__lt=until)
+            .annotate(bucket=TruncHour('created_at', tzinfo=tz)).values('bucket').annotate(**invoice_metrics)
+        )
+    if 'chemical_cost' in metrics:
+        cost = ExpressionWrapper(F('amount_used') * F('cost_per_unit'),
+                                 output_field=DecimalField(max_digits=12, decimal_places=2))
+        queries.append(
+            ChemicalUsageLog.objects.filter(timestamp__gte=since, timestamp__lt=until)
+            .annotate(bucket=TruncHour('timestamp', tzinfo=tz)).values('bucket').annotate(chemical_cost=Sum(cost))
+        )
+
+    totals = {}
+    for queryset in queries:
+        for row in queryset.order_by():
+            totals.setdefault(row.pop('bucket'), {}).update(row)
+    return totals
+
+
+def _buckets(start, end, granularity):
+    """Every bucket key from start to end, matching what the Trunc functions return."""
+    if granularity == 'hour':
+        tz = timezone.get_current_timezone()
+        # Step in UTC so DST changes yield the real local hours.
+        current = timezone.make_aware(datetime.combine(start, time.min), tz).astimezone(dt_timezone.utc)
+        until = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+        buckets = []
+        while current < until:
+            buckets.append(timezone.localtime(current, tz))
+            current += timedelta(hours=1)
+        return buckets
+
+    if granularity == 'day':
+        first, step = start, lambda d: d + timedelta(days=1)
+    elif granularity == 'week':
+        first, step = start - timedelta(days=start.weekday()), lambda d: d + timedelta(days=7)
+    else:
+        first = start.replace(day=1)
+        step = lambda d: d.replace(year=d.year + d.month // 12, month=d.month % 12 + 1)
+    buckets = []
+    current = first
+    while current <= end:
+        buckets.append(current)
+        current = step(current)
+    return buckets
@@ -5,66 +5,33 @@ from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from django.db.models import Sum, F
 from django.utils import timezone
 from decimal import Decimal
-from .models import Invoice, ChemicalUsageLog, PayrollEntry, GeneralExpense, ExpenseCategory, KhataLedger, DailyRegisterAudit
+from .models import Invoice, ChemicalUsageLog, PayrollEntry, GeneralExpense, ExpenseCategory, KhataLedger, DailyRegisterAudit, DailyFinanceRollup
+from . import timeseries
 from .serializers import InvoiceSerializer, GeneralExpenseSerializer, ExpenseCategorySerializer
 from customers.models import Customer
 from bookings.models import Booking
+from core.query_planner import QueryPlannerMixin
 
 from django.http import HttpResponse
-from django.template.loader import render_to_string, get_template
 
-class InvoiceViewSet(viewsets.ModelViewSet):
+class InvoiceViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
 
     @action(detail=True, methods=['get'])
     def download_pdf(self, request, pk=None):
-        from io import BytesIO
-        try:
-            from xhtml2pdf import pisa
-        except ImportError:
-            return HttpResponse("PDF generation not available (xhtml2pdf not installed).", status=503)
-            
+        from .pdfs import pdf_response
         invoice = self.get_object()
-        
-        # Safely get booking and customer info for the template
         booking = getattr(invoice, 'booking', None)
-        customer_phone = booking.customer.phone_number if booking and booking.customer else ''
-        
-        context = {
-            'invoice': invoice,
-            'booking': booking,
-            'customer_phone': customer_phone,
-        }
-        
-        html_string = render_to_string('finance/invoice_pdf.html', context)
-        
-        result = BytesIO()
-        pdf = pisa.CreatePDF(BytesIO(html_string.encode('utf-8')), dest=result)
-        
-        if pdf.err:
-            return HttpResponse("Error generating PDF.", status=500)
-            
-        response = HttpResponse(result.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.id}.pdf"'
-        return response
-        if HTML is None:
-            return HttpResponse("PDF Generation not available (Missing GTK)", status=503)
-            
-        invoice = self.get_object()
-        html_string = render_to_string('finance/invoice_pdf.html', {'invoice': invoice})
-        
-        pdf_file = HTML(string=html_string).write_pdf()
-        
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.id}.pdf"'
-        return response
+        return pdf_response(booking, invoice, f"invoice_{invoice.id}.pdf")
     
     # Add this inside class InvoiceViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['patch', 'post'])
     def mark_paid(self, request, pk=None):
         """Manually mark an invoice as paid (e.g., cash received later)"""
+        from django.core.exceptions import ValidationError
+        from django.db import transaction
         invoice = self.get_object()
         
         if invoice.is_paid:
@@ -72,17 +39,21 @@ class InvoiceViewSet(viewsets.ModelViewSet):
             
         invoice.is_paid = True
         invoice.payment_method = 'CASH' # Record that this was settled manually
-        invoice.save()
+        try:
+            with transaction.atomic():
+                invoice.save()
 
-        # Update the associated booking status if it exists
-        if hasattr(invoice, 'booking') and invoice.booking:
-            if invoice.booking.status != 'COMPLETED':
-                invoice.booking.status = 'COMPLETED'
-                invoice.booking.save()
+                # Update the associated booking status if it exists
+                if hasattr(invoice, 'booking') and invoice.booking:
+                    if invoice.booking.status != 'COMPLETED':
+                        invoice.booking.status = 'COMPLETED'
+                        invoice.booking.save()
+        except ValidationError as e:
+            return Response({'error': e.messages[0]}, status=400)
 
         return Response({'status': 'Invoice settled successfully'})
 
-class GeneralExpenseViewSet(viewsets.ModelViewSet):
+class GeneralExpenseViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = GeneralExpense.objects.all().select_related('category', 'recorded_by')
     serializer_class = GeneralExpenseSerializer
     permission_classes = [IsAdminUser]
@@ -110,7 +81,7 @@ class GeneralExpenseViewSet(viewsets.ModelViewSet):
         expense.save()
         return Response({'status': 'Expense rejected'})
 
-class ExpenseCategoryViewSet(viewsets.ModelViewSet):
+class ExpenseCategoryViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = ExpenseCategory.objects.all()
     serializer_class = ExpenseCategorySerializer
     permission_classes = [IsAdminUser]
@@ -120,34 +91,17 @@ class DashboardViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def kpi_summary(self, request):
+        # Today's totals are kept in one DailyFinanceRollup row (see finance.rollups)
         today = timezone.localdate()
-        
-        # 1. Revenue Today
-        revenue = Invoice.objects.filter(
-            created_at__date=today
-        ).aggregate(total=Sum('amount'))['total'] or 0.0
-        
-        # 2. Chemical Cost Today
-        chemical_logs = ChemicalUsageLog.objects.filter(timestamp__date=today).select_related('inventory_item')
-        chemical_cost = sum(log.amount_used * log.inventory_item.cost_per_unit for log in chemical_logs)
-
-        # 3. Labor Cost Today
-        labor = PayrollEntry.objects.filter(date=today).aggregate(
-            total=Sum(F('base_wage') + F('commission_earned') + F('tips_earned'))
-        )['total'] or 0.0
-        
-        # 4. General Expenses Today
-        general_expenses = GeneralExpense.objects.filter(date=today).aggregate(
-            total=Sum('amount')
-        )['total'] or 0.0
+        rollup = DailyFinanceRollup.objects.filter(date=today).first() or DailyFinanceRollup(date=today)
 
-        net_profit = float(revenue) - float(chemical_cost) - float(labor) - float(general_expenses)
+        net_profit = float(rollup.revenue) - float(rollup.chemical_cost) - float(rollup.labor_cost) - float(rollup.expenses)
 
         return Response({
-            'revenue_today': revenue,
-            'chemical_cost_today': chemical_cost,
-            'labor_cost_today': labor,
-            'general_expenses_today': general_expenses,
+            'revenue_today': rollup.revenue,
+            'chemical_cost_today': rollup.chemical_cost,
+            'labor_cost_today': rollup.labor_cost,
+            'general_expenses_today': rollup.expenses,
             'net_profit_today': net_profit
         })
 
@@ -156,92 +110,151 @@ class DashboardViewSet(viewsets.ViewSet):
         # Last 7 days revenue
         end_date = timezone.localdate()
         start_date = end_date - timezone.timedelta(days=6)
-        
+
         data = []
-        for i in range(7):
-            d = start_date + timezone.timedelta(days=i)
-            daily_rev = Invoice.objects.filter(created_at__date=d).aggregate(total=Sum('amount'))['total'] or 0.0
-            data.append({'date': d.strftime("%Y-%m-%d"), 'value': daily_rev})
-            
+        for row in timeseries.series(['revenue'], start_date, end_date, 'day'):
+            data.append({'date': row['bucket'].strftime("%Y-%m-%d"), 'value': row['revenue']})
+
         return Response(data)
 
     @action(detail=False, methods=['get'])
     def monthly_trends(self, request):
         # Last 6 months Income vs Expense
         today = timezone.localdate()
+        start_month = today.replace(day=1)
+        for _ in range(5):
+            start_month = (start_month - timezone.timedelta(days=1)).replace(day=1)
+
         data = []
-        
-        for i in range(5, -1, -1):
-            # Simple month iteration logic (can be improved)
-            # Find year and month for (today - i months)
-            target_month = today.month - i
-            target_year = today.year
-            if target_month <= 0:
-                target_month += 12
-                target_year -= 1
-            
-            # Simple filter by month/year
-            month_revenue = Invoice.objects.filter(
-                created_at__year=target_year, 
-                created_at__month=target_month,
-                is_paid=True
-            ).aggregate(total=Sum('amount'))['total'] or 0.0
-            
-            # Expenses (General Expenses) - Could include Payroll/Chem in future
-            month_expense = GeneralExpense.objects.filter(
-                date__year=target_year, 
-                date__month=target_month
-            ).aggregate(total=Sum('amount'))['total'] or 0.0
-            
-            month_name = timezone.datetime(target_year, target_month, 1).strftime("%b")
+        # Expenses (General Expenses) - Could include Payroll/Chem in future
+        for row in timeseries.series(['paid_revenue', 'expense'], start_month, today, 'month'):
             data.append({
-                'month': month_name,
-                'income': float(month_revenue),
-                'expense': float(month_expense)
+                'month': row['bucket'].strftime("%b"),
+                'income': float(row['paid_revenue']),
+                'expense': float(row['expense'])
             })
-            
+
         return Response(data)
-    
+
+    @action(detail=False, methods=['get'])
+    def series(self, request):
+        """
+        Time-bucketed metrics for charts, e.g.
+        ?metrics=revenue,expense&start=2026-01-01&end=2026-12-31&granularity=month
+        Defaults to the last 30 days of revenue by day.
+        """
+        from django.utils.dateparse import parse_date
+        start, end = request.query_params.get('start'), request.query_params.get('end')
+        try:
+            end_date = parse_date(end) if end else timezone.localdate()
+            if end_date is None:
+                raise ValueError
+            start_date = parse_date(start) if start else end_date - timezone.timedelta(days=29)
+            if start_date is None:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'start and end must be valid dates (YYYY-MM-DD)'}, status=400)
+        metrics = [m.strip() for m in request.query_params.get('metrics', 'revenue').split(',') if m.strip()]
+        granularity = request.query_params.get('granularity', 'day')
+
+        try:
+            rows = timeseries.series(metrics, start_date, end_date, granularity)
+        except timeseries.SeriesError as e:
+            return Response({'error': str(e)}, status=400)
+
+        for row in rows:
+            row['bucket'] = row['bucket'].isoformat()
+            for metric in metrics:
+                row[metric] = row[metric] if metric == 'booking_count' else float(row[metric])
+        return Response({
+            'metrics': metrics,
+            'granularity': granularity,
+            'start': start_date,
+            'end': end_date,
+            'buckets': rows
+        })
+
+    @action(detail=False, methods=['get'])
+    def chemical_forecast(self, request):
+        """
+        Burn rates and projected stock-out dates for every chemical, from the
+        daily usage rollups. ?window=<days> sets the short moving average
+        (default 7), ?horizon=<days> how far ahead reorder alerts look (default 14).
+        """
+        from . import forecast
+
+        params = {}
+        for name, default in (('window', forecast.SHORT_WINDOW), ('horizon', forecast.HORIZON)):
+            value = request.query_params.get(name, str(default))
+            if not value.isdigit() or not 0 < int(value) <= 365:
+                return Response({'error': f'{name} must be a number of days between 1 and 365'}, status=400)
+            params[name] = int(value)
+
+        chemicals = forecast.forecast(
+            short_window=params['window'], long_window=max(params['window'], forecast.LONG_WINDOW), horizon=params['horizon'],
+        )
+        return Response({
+            'window': params['window'],
+            'horizon': params['horizon'],
+            'chemicals': chemicals,
+            'alerts': [row for row in chemicals if row['alert']],
+        })
+
     # Add this inside class DashboardViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def outstanding_credit(self, request):
         """Fetch all unpaid invoices for the Accounts Receivable table"""
-        # Find all invoices where is_paid is False
-        unpaid_invoices = Invoice.objects.filter(is_paid=False).select_related('booking')
-        
+        from .receivables import aging_detail, detail_row
+
         data = []
-        for invoice in unpaid_invoices:
-            # Safely extract customer and vehicle info if booking exists
-            customer_name = "Unknown"
-            vehicle_info = "N/A"
-            customer_phone = "No Phone"
-            
-            if hasattr(invoice, 'booking') and invoice.booking:
-                if invoice.booking.customer:
-                    customer = invoice.booking.customer
-                    customer_name = f"{customer.user.first_name} {customer.user.last_name}".strip() or customer.user.username
-                    customer_phone = customer.phone_number
-                vehicle = invoice.booking.vehicle
-                if vehicle:
-                    vehicle_info = f"{vehicle.model} ({vehicle.plate_number})"
-            
+        for row in aging_detail(timezone.now()).order_by('-created_at', '-id'):
+            row = detail_row(row)
             # If invoice is older than 30 days, mark as Overdue
-            days_old = (timezone.now() - invoice.created_at).days
-            status = 'Overdue' if days_old > 30 else 'Pending'
-
             data.append({
-                'id': invoice.id,
-                'customer': customer_name,
-                'customer_phone': customer_phone,
-                'vehicle': vehicle_info,
-                'amount': float(invoice.amount),
-                'date': invoice.created_at.strftime("%Y-%m-%d"),
-                'status': status
+                'id': row['id'],
+                'customer': row['customer'],
+                'customer_phone': row['customer_phone'],
+                'vehicle': row['vehicle'],
+                'amount': row['amount'],
+                'date': row['date'],
+                'status': 'Overdue' if row['days_outstanding'] > 30 else 'Pending'
             })
             
         return Response(data)
 
+    @action(detail=False, methods=['get'])
+    def ar_aging(self, request):
+        """
+        Accounts-receivable aging: totals and per-customer amounts in 0-30 /
+        31-60 / 61-90 / 90+ day buckets, plus the open invoices newest first,
+        keyset-paginated (follow `invoices.next`). ?customer=<id> narrows both.
+        """
+        from bookings.pagination import CreatedAtKeysetPagination
+        from .receivables import open_invoices, aging_summary, aging_detail, detail_row
+
+        now = timezone.now()
+        invoices = open_invoices()
+        customer = request.query_params.get('customer')
+        if customer:
+            if not customer.isdigit():
+                return Response({'error': 'customer must be a customer id'}, status=400)
+            invoices = invoices.filter(customer_ref=int(customer))
+
+        totals, customers = aging_summary(now, invoices)
+        paginator = CreatedAtKeysetPagination()
+        page = paginator.paginate_queryset(aging_detail(now, invoices), request, view=self)
+
+        return Response({
+            'as_of': now,
+            'totals': totals,
+            'customers': customers,
+            'invoices': {
+                'next': paginator.get_next_link(),
+                'results': [detail_row(row) for row in page],
+            },
+        })
+
 class ReportingViewSet(viewsets.ViewSet):
     permission_classes = [IsAdminUser]
 
@@ -256,27 +269,66 @@ class ReportingViewSet(viewsets.ViewSet):
 
     @action(detail=False, methods=['get'])
     def export_ledger(self, request):
-        start = request.query_params.get('start', timezone.localdate().replace(day=1).isoformat())
-        end = request.query_params.get('end', timezone.localdate().isoformat())
-        
-        from .reports import export_ledger_csv
-        csv_data = export_ledger_csv(start, end)
-        
-        response = HttpResponse(csv_data, content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="ledger_{start}_{end}.csv"'
-        return response
+        """Streams the invoice ledger. ?output=csv|ndjson, ?compress=gzip"""
+        from .reports import LEDGER_HEADER, LEDGER_FIELDS, ledger_export_rows
+        return self._export(request, 'ledger', LEDGER_HEADER, LEDGER_FIELDS, ledger_export_rows)
 
     @action(detail=False, methods=['get'])
     def export_expenses(self, request):
+        """Streams the expense register. ?output=csv|ndjson, ?compress=gzip"""
+        from .reports import EXPENSE_HEADER, EXPENSE_FIELDS, expense_export_rows
+        return self._export(request, 'expenses', EXPENSE_HEADER, EXPENSE_FIELDS, expense_export_rows)
+
+    @action(detail=False, methods=['get'])
+    def export_invoice_pdfs(self, request):
+        """
+        Streams a ZIP of invoice PDFs for ?start=&end= (default: this month),
+        optionally ?customer=<id>. Cached PDFs are reused; the rest are
+        rendered across all CPU cores and added as they finish.
+        """
+        from django.utils.dateparse import parse_date
+        from .exports import streaming_zip
+        from .pdfs import engine
+        from .reports import invoice_pdf_entries
+
         start = request.query_params.get('start', timezone.localdate().replace(day=1).isoformat())
         end = request.query_params.get('end', timezone.localdate().isoformat())
-        
-        from .reports import export_expenses_csv
-        csv_data = export_expenses_csv(start, end)
-        
-        response = HttpResponse(csv_data, content_type='text/csv')
-        response['Content-Disposition'] = f'attachment; filename="expenses_{start}_{end}.csv"'
-        return response
+        customer = request.query_params.get('customer')
+        try:
+            start_date, end_date = parse_date(start), parse_date(end)
+            if start_date is None or end_date is None:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'start and end must be valid dates (YYYY-MM-DD)'}, status=400)
+        if customer and not customer.isdigit():
+            return Response({'error': 'customer must be a customer id'}, status=400)
+        if engine() is None:
+            return Response({'error': 'PDF generation not available (install WeasyPrint or xhtml2pdf).'}, status=503)
+
+        name = f"invoices_{start}_{end}" + (f"_customer_{customer}" if customer else '')
+        return streaming_zip(name, invoice_pdf_entries(start_date, end_date, int(customer) if customer else None))
+
+    def _export(self, request, name, header, fields, rows):
+        from django.utils.dateparse import parse_date
+        from .exports import streaming_export, ExportError
+
+        start = request.query_params.get('start', timezone.localdate().replace(day=1).isoformat())
+        end = request.query_params.get('end', timezone.localdate().isoformat())
+        # Rows are read while the response streams, so bad input must be caught now.
+        try:
+            if parse_date(start) is None or parse_date(end) is None:
+                raise ValueError
+        except ValueError:
+            return Response({'error': 'start and end must be valid dates (YYYY-MM-DD)'}, status=400)
+
+        try:
+            return streaming_export(
+                f'{name}_{start}_{end}', header, fields, rows(start, end),
+                output=request.query_params.get('output', 'csv'),
+                compress=request.query_params.get('compress'),
+            )
+        except ExportError as e:
+            return Response({'error': str(e)}, status=400)
 
 class KhataViewSet(viewsets.ViewSet):
     permission_classes = [IsAdminUser]
@@ -284,7 +336,7 @@ class KhataViewSet(viewsets.ViewSet):
     def list(self, request):
         """GET /api/finance/khata/"""
         # Fetch customers with outstanding balance > 0
-        customers = Customer.objects.filter(outstanding_balance__gt=0)
+        customers = Customer.objects.filter(outstanding_balance__gt=0).select_related('user')
         data = []
         for c in customers:
             data.append({
@@ -297,28 +349,51 @@ class KhataViewSet(viewsets.ViewSet):
         return Response(data)
 
     def retrieve(self, request, pk=None):
-        """GET /api/finance/khata/<customer_id>/"""
+        """GET /api/finance/khata/<customer_id>/ - the whole ledger, newest first, with running balances."""
+        from .khata import statement, entry_row
         try:
             customer = Customer.objects.get(pk=pk)
         except Customer.DoesNotExist:
             return Response({'error': 'Customer not found'}, status=404)
-        
-        entries = KhataLedger.objects.filter(customer=customer).order_by('-created_at')
-        data = []
-        for entry in entries:
-            # Need description or formatted name for booking if exists
-            desc = entry.description
-            if entry.related_booking:
-                desc += f" (Booking #{entry.related_booking.id})"
-                
-            data.append({
-                'id': entry.id,
-                'amount': float(entry.amount),
-                'transaction_type': entry.transaction_type,
-                'description': desc,
-                'date': entry.created_at.strftime("%Y-%m-%d %H:%M"),
-            })
-        return Response(data)
+
+        entries = statement(customer.id).order_by('-created_at', '-id')
+        return Response([entry_row(entry) for entry in entries])
+
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """
+        GET /api/finance/khata/<customer_id>/statement/?as_of=YYYY-MM-DD
+        Ledger entries up to `as_of` (default: all), newest first with the
+        balance after each, keyset-paginated (follow `next`), and the balance
+        as of that date.
+        """
+        from django.utils.dateparse import parse_date
+        from bookings.pagination import CreatedAtKeysetPagination
+        from .khata import statement, balance_as_of, entry_row
+
+        as_of = request.query_params.get('as_of')
+        if as_of:
+            try:
+                as_of = parse_date(as_of)
+                if as_of is None:
+                    raise ValueError
+            except ValueError:
+                return Response({'error': 'as_of must be a valid date (YYYY-MM-DD)'}, status=400)
+
+        customer = Customer.objects.filter(pk=pk).values('id', 'outstanding_balance').first()
+        if customer is None:
+            return Response({'error': 'Customer not found'}, status=404)
+
+        paginator = CreatedAtKeysetPagination()
+        page = paginator.paginate_queryset(statement(customer['id'], as_of), request, view=self)
+        return Response({
+            'customer_id': customer['id'],
+            'as_of': as_of,
+            'balance': float(balance_as_of(customer['id'], as_of)),
+            'outstanding_balance': float(customer['outstanding_balance']),
+            'next': paginator.get_next_link(),
+            'results': [entry_row(entry) for entry in page],
+        })
 
     @action(detail=False, methods=['post'])
     def charge(self, request):
@@ -328,14 +403,10 @@ class KhataViewSet(viewsets.ViewSet):
         description = request.data.get('description', 'Khata Charge')
         booking_id = request.data.get('booking_id')
 
-        try:
-            customer = Customer.objects.get(pk=customer_id)
-        except Customer.DoesNotExist:
+        from . import khata
+        if not Customer.objects.filter(pk=customer_id).exists():
             return Response({'error': 'Customer not found'}, status=404)
 
-        if customer.outstanding_balance + amount > customer.credit_limit:
-            return Response({'error': 'Credit limit exceeded'}, status=400)
-
         booking = None
         if booking_id:
             try:
@@ -343,23 +414,16 @@ class KhataViewSet(viewsets.ViewSet):
             except Booking.DoesNotExist:
                 pass
 
-        # Create Charge
-        KhataLedger.objects.create(
-            customer=customer,
-            amount=amount,
-            transaction_type='CHARGE',
-            description=description,
-            related_booking=booking
-        )
-
-        # Update Balance
-        customer.outstanding_balance += amount
-        customer.save()
+        # Ledger entry and balance update in one transaction, limit checked under a row lock
+        try:
+            new_balance = khata.charge(customer_id, amount, description, booking=booking)
+        except khata.CreditLimitExceeded:
+            return Response({'error': 'Credit limit exceeded'}, status=400)
 
         # Mock SMS
-        print(f"[MOCK SMS] Your Kallayi Khata has been charged ₹{amount}. New Balance: ₹{customer.outstanding_balance}.")
+        print(f"[MOCK SMS] Your Kallayi Khata has been charged ₹{amount}. New Balance: ₹{new_balance}.")
 
-        return Response({'status': 'Charge successful', 'new_balance': float(customer.outstanding_balance)})
+        return Response({'status': 'Charge successful', 'new_balance': float(new_balance)})
 
     @action(detail=False, methods=['post'])
     def settle(self, request):
@@ -368,34 +432,20 @@ class KhataViewSet(viewsets.ViewSet):
         amount = Decimal(str(request.data.get('amount', 0)))
         description = request.data.get('description', 'Cash Payment')
 
-        try:
-            customer = Customer.objects.get(pk=customer_id)
-        except Customer.DoesNotExist:
+        from . import khata
+        if not Customer.objects.filter(pk=customer_id).exists():
             return Response({'error': 'Customer not found'}, status=404)
 
         if amount <= 0:
             return Response({'error': 'Amount must be greater than 0'}, status=400)
 
-        # Create Settlement
-        KhataLedger.objects.create(
-            customer=customer,
-            amount=amount,
-            transaction_type='SETTLEMENT',
-            description=description
-        )
-
-        # Update Balance dynamically
-        customer.outstanding_balance -= amount
-        # For simplicity, bounding it to zero if overpaid 
-        if customer.outstanding_balance < 0:
-            customer.outstanding_balance = Decimal('0.00')
-            
-        customer.save()
+        # Balance is bounded at zero: only what is due is applied and recorded
+        applied, new_balance = khata.settle(customer_id, amount, description)
 
         # Mock SMS
-        print(f"[MOCK SMS] Payment received! ₹{amount} has been credited to your Kallayi Khata. New Balance: ₹{customer.outstanding_balance}.")
+        print(f"[MOCK SMS] Payment received! ₹{applied} has been credited to your Kallayi Khata. New Balance: ₹{new_balance}.")
 
-        return Response({'status': 'Settlement successful', 'new_balance': float(customer.outstanding_balance)})
+        return Response({'status': 'Settlement successful', 'new_balance': float(new_balance)})
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
@@ -403,6 +453,7 @@ def close_register(request):
     """
     End-of-Day (EOD) Register Close & Data Lock.
     """
+    from .rollups import paid_date
     user = request.user
     is_authorized = user.is_superuser or user.is_staff
     if not is_authorized and hasattr(user, 'staff_profile'):
@@ -446,10 +497,9 @@ def close_register(request):
     # Calculate Expected Cash In Till
     # 1. Total Cash Payments Received
     cash_payments = Invoice.objects.filter(
-        created_at__date=today,
         is_paid=True,
         payment_method='CASH'
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+    ).annotate(paid_on=paid_date()).filter(paid_on=today).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
 
     # 2. Khata Settlements (Cash received for old debts)
     khata_settlements = KhataLedger.objects.filter(
@@ -511,7 +561,14 @@ def analytics_dashboard(request):
     if not is_authorized:
         return Response({'error': 'Forbidden'}, status=403)
 
-    completed_bookings = Booking.objects.filter(status='COMPLETED')
+    from collections import Counter
+    from .snapshots import live, merge_breakdowns, snapshots_between
+
+    # Closed days are read from their register snapshots; only open days hit bookings.
+    hours, (package_counts, package_revenue), (staff_counts, staff_names) = merge_breakdowns(
+        snapshots_between().values('hours', 'packages', 'technicians')
+    )
+    completed_bookings = live(Booking.objects.filter(status='COMPLETED'), 'created_at__date')
 
     # ── Query 1: Busiest Hours ──────────────────────────────────────────────
     busiest_hours_qs = (
@@ -521,13 +578,14 @@ def analytics_dashboard(request):
         .annotate(count=Count('id'))
         .order_by('hour')
     )
+    hours.update(Counter({row['hour']: row['count'] for row in busiest_hours_qs}))
     busiest_hours = [
         {
-            'hour': f"{(row['hour'] % 12) or 12} {'AM' if row['hour'] < 12 else 'PM'}",
-            'raw_hour': row['hour'],
-            'count': row['count']
+            'hour': f"{(hour % 12) or 12} {'AM' if hour < 12 else 'PM'}",
+            'raw_hour': hour,
+            'count': hours[hour]
         }
-        for row in busiest_hours_qs
+        for hour in sorted(hours)
     ]
 
     # ── Query 2: Package Popularity ─────────────────────────────────────────
@@ -539,16 +597,18 @@ def analytics_dashboard(request):
             total_washes=Count('id'),
             total_revenue=Sum('service_package__price')
         )
-        .order_by('-total_revenue')
     )
-    packages = [
+    for row in package_qs:
+        package_counts[row['service_package__name']] += row['total_washes']
+        package_revenue[row['service_package__name']] += row['total_revenue'] or 0
+    packages = sorted((
         {
-            'name': row['service_package__name'],
-            'total_washes': row['total_washes'],
-            'total_revenue': float(row['total_revenue'] or 0)
+            'name': name,
+            'total_washes': package_counts[name],
+            'total_revenue': float(package_revenue[name])
         }
-        for row in package_qs
-    ]
+        for name in package_counts
+    ), key=lambda p: -p['total_revenue'])
 
     # ── Query 3: Top Staff Performers ───────────────────────────────────────
     staff_qs = (
@@ -556,14 +616,16 @@ def analytics_dashboard(request):
         .filter(technician__isnull=False)
         .values('technician__first_name', 'technician__username')
         .annotate(jobs_completed=Count('id'))
-        .order_by('-jobs_completed')[:10]
     )
+    for row in staff_qs:
+        staff_counts[row['technician__username']] += row['jobs_completed']
+        staff_names[row['technician__username']] = row['technician__first_name'] or row['technician__username']
     top_staff = [
         {
-            'name': row['technician__first_name'] or row['technician__username'],
-            'jobs_completed': row['jobs_completed']
+            'name': staff_names[username],
+            'jobs_completed': jobs
         }
-        for row in staff_qs
+        for username, jobs in staff_counts.most_common(10)
     ]
 
     return Response({
@@ -578,15 +640,10 @@ def analytics_dashboard(request):
 def generate_invoice_pdf(request, booking_id):
     """
     Generate a beautifully branded PDF invoice for a given booking.
-    Uses WeasyPrint for modern CSS and Flexbox support.
+    Served from the PDF cache when this exact invoice was rendered before
+    (see finance.pdfs).
     """
-    from django.template.loader import get_template
-    from django.http import HttpResponse
-
-    try:
-        from weasyprint import HTML
-    except ImportError:
-        return HttpResponse("PDF generation not available (WeasyPrint not installed).", status=503)
+    from .pdfs import pdf_response
 
     try:
         booking = Booking.objects.select_related(
@@ -596,77 +653,8 @@ def generate_invoice_pdf(request, booking_id):
         return HttpResponse("Booking not found.", status=404)
 
     # Try to get associated invoice for payment info
-    invoice = None
-    try:
-        invoice = Invoice.objects.get(booking=booking)
-    except Invoice.DoesNotExist:
-        pass
-
-    customer_phone = booking.customer.phone_number if booking and booking.customer else ''
-
-    context = {
-        'booking': booking,
-        'invoice': invoice,
-        'customer_phone': customer_phone,
-    }
-
-    template = get_template('finance/invoice_pdf.html')
-    html_string = template.render(context)
-
-    try:
-        # WeasyPrint flawlessly renders Flexbox, CSS Variables, and Google Fonts
-        pdf_file = HTML(string=html_string).write_pdf()
-
-        response = HttpResponse(pdf_file, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="Kallayi_Invoice_{booking.id}.pdf"'
-        return response
-    except Exception as e:
-        return HttpResponse(f"Error generating PDF: {str(e)}", status=500)
-    """
-    Generate a beautifully branded PDF invoice for a given booking.
-    Uses xhtml2pdf (pure Python, no GTK dependency).
-    """
-    from io import BytesIO
-
-    try:
-        from xhtml2pdf import pisa
-    except ImportError:
-        return HttpResponse("PDF generation not available (xhtml2pdf not installed).", status=503)
-
-    try:
-        booking = Booking.objects.select_related(
-            'customer__user', 'vehicle', 'service_package'
-        ).get(pk=booking_id)
-    except Booking.DoesNotExist:
-        return HttpResponse("Booking not found.", status=404)
-
-    # Try to get associated invoice for payment info
-    invoice = None
-    try:
-        invoice = Invoice.objects.get(booking=booking)
-    except Invoice.DoesNotExist:
-        pass
-
-    customer_phone = booking.customer.phone_number if booking.customer else ''
-
-    context = {
-        'booking': booking,
-        'invoice': invoice,
-        'customer_phone': customer_phone,
-    }
-
-    template = get_template('finance/invoice_pdf.html')
-    html_string = template.render(context)
-
-    result = BytesIO()
-    pdf = pisa.CreatePDF(BytesIO(html_string.encode('utf-8')), dest=result)
-
-    if pdf.err:
-        return HttpResponse("Error generating PDF.", status=500)
-
-    response = HttpResponse(result.getvalue(), content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Kallayi_Invoice_{booking.id}.pdf"'
-    return response
+    invoice = Invoice.objects.filter(booking=booking).first()
+    return pdf_response(booking, invoice, f"Kallayi_Invoice_{booking.id}.pdf")
 
 
 @api_view(['POST'])
@@ -707,31 +695,17 @@ def manual_khata_charge(request):
         new_user = AuthUser.objects.create_user(username=username, password='Kallayi123!', first_name=name)
         customer = Customer.objects.create(user=new_user, phone_number=phone, credit_limit=Decimal('5000.00'))
 
-    # Credit limit check
-    current_balance = Decimal(str(customer.outstanding_balance))
-    credit_limit = Decimal(str(customer.credit_limit))
-    new_balance = current_balance + amount
-
-    if new_balance > credit_limit:
-        return Response({
-            'error': f'Credit limit exceeded. Current balance: ₹{current_balance}, Limit: ₹{credit_limit}'
-        }, status=400)
-
-    # Apply charge
-    customer.outstanding_balance = new_balance
-    customer.save()
-
-    KhataLedger.objects.create(
-        customer=customer,
-        amount=amount,
-        transaction_type='CHARGE',
-        description=description or 'Manual Khata Entry',
-    )
+    # Credit limit check and charge, atomic under a row lock
+    from . import khata
+    try:
+        new_balance = khata.charge(customer.id, amount, description or 'Manual Khata Entry')
+    except khata.CreditLimitExceeded as e:
+        return Response({'error': str(e)}, status=400)
 
     return Response({
         'status': 'success',
         'customer_name': customer.user.first_name or customer.user.username,
-        'new_balance': float(customer.outstanding_balance),
+        'new_balance': float(new_balance),
         'credit_limit': float(customer.credit_limit),
     })
 
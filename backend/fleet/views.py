@@ -3,8 +3,9 @@ from rest_framework.decorators import action # <-- ADD THIS IMPORT
 from rest_framework.response import Response # <-- ADD THIS IMPORT
 from .models import Vehicle, TechnicianLocation
 from .serializers import VehicleSerializer, TechnicianLocationSerializer
+from core.query_planner import QueryPlannerMixin
 
-class VehicleViewSet(viewsets.ModelViewSet):
+class VehicleViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = Vehicle.objects.all()
     serializer_class = VehicleSerializer
     @action(detail=False, methods=['get'])
@@ -14,17 +15,20 @@ class VehicleViewSet(viewsets.ModelViewSet):
         if not plate:
             return Response({'error': 'No plate provided'}, status=400)
         
-        # Search for exact plate match (case-insensitive)
-        vehicle = Vehicle.objects.filter(plate_number__iexact=plate).select_related('owner__user').first()
-        
-        if vehicle and vehicle.owner:
-            customer_name = vehicle.owner.user.first_name or vehicle.owner.user.username if vehicle.owner.user else "Customer"
+        # Exact plate match (ignoring case, spaces and dashes) across POS and fleet vehicles
+        from customers.search import search_vehicles
+        match = next((
+            hit for hit in search_vehicles(plate)
+            if hit['rank'] == 0 and hit['matched_on'] == 'plate' and hit['customer_id']
+        ), None)
+
+        if match:
             return Response({
-                'phone': vehicle.owner.phone_number,
-                'customer_name': customer_name
+                'phone': match['phone_number'],
+                'customer_name': match['customer_name']
             })
         return Response({'error': 'Not found'}, status=404)
-class TechnicianLocationViewSet(viewsets.ModelViewSet):
+class TechnicianLocationViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = TechnicianLocation.objects.all()
     serializer_class = TechnicianLocationSerializer
     
@@ -37,11 +41,11 @@ class TechnicianLocationViewSet(viewsets.ModelViewSet):
 from .models import ServiceVehicle, FleetLog
 from .serializers import ServiceVehicleSerializer, FleetLogSerializer
 
-class ServiceVehicleViewSet(viewsets.ModelViewSet):
+class ServiceVehicleViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = ServiceVehicle.objects.all()
     serializer_class = ServiceVehicleSerializer
 
-class FleetLogViewSet(viewsets.ModelViewSet):
+class FleetLogViewSet(QueryPlannerMixin, viewsets.ModelViewSet):
     queryset = FleetLog.objects.all()
     serializer_class = FleetLogSerializer
     
@@ -0,0 +1,27 @@
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications.reminders import MockGateway, send_all
+
+
+class Command(BaseCommand):
+    help = 'Measures reminder send throughput against a mock SMS gateway, sequentially and with the concurrent pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=500, help='Messages to send per run')
+        parser.add_argument('--latency', type=float, default=0.05, help='Simulated gateway latency per message (seconds)')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 20, 100], help='Pool sizes to compare')
+        parser.add_argument('--rate', type=float, help='Gateway rate limit (messages per second)')
+
+    def handle(self, *args, **options):
+        messages = [(n, f'+91{9000000000 + n}', f'Reminder {n}') for n in range(options['messages'])]
+        for concurrency in options['concurrency']:
+            gateway = MockGateway(latency=options['latency'], rate_limit=options['rate'])
+            started = time.perf_counter()
+            asyncio.run(send_all(gateway, messages, concurrency))
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'concurrency {concurrency:>4}: {len(messages)} messages in {elapsed:.3f}s ({len(messages) / elapsed:,.0f} msg/s)'
+            )
@@ -1,26 +1,33 @@
 from django.core.management.base import BaseCommand
-from customers.models import Customer
+
+from notifications.reminders import GATEWAYS, default_campaign, dispatch
+
 
 class Command(BaseCommand):
-    help = 'Sends gentle reminder mock SMS to all customers with an outstanding Khata balance'
+    help = 'Sends gentle reminder SMS to all customers with an outstanding Khata balance (resumable per campaign)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gateway', choices=list(GATEWAYS), default='console', help='SMS gateway to send through.')
+        parser.add_argument('--campaign', help='Campaign key; re-running one skips customers already reminded. Defaults to today.')
+        parser.add_argument('--batch-size', type=int, default=500, help='Debtors read, sent and logged per batch.')
+        parser.add_argument('--concurrency', type=int, default=20, help='Messages in flight at once.')
+        parser.add_argument('--rate', type=float, help="Messages per second (overrides the gateway's own limit).")
 
     def handle(self, *args, **options):
-        customers_with_debt = Customer.objects.filter(outstanding_balance__gt=0)
-        
-        if not customers_with_debt.exists():
-            self.stdout.write(self.style.SUCCESS('No customers have an outstanding Khata balance. All is well.'))
-            return
+        gateway = GATEWAYS[options['gateway']]()
+        if options['rate']:
+            gateway.rate_limit = options['rate']
+        campaign = options['campaign'] or default_campaign()
 
-        count = 0
-        for customer in customers_with_debt:
-            name = customer.user.first_name or customer.user.username
-            balance = customer.outstanding_balance
-            
-            # Mock SMS
-            mock_sms = f"Hi {name}, a gentle reminder that your Khata balance is ₹{balance}. Click here to pay: https://kallayi-spa.com/pay"
-            self.stdout.write(self.style.WARNING(f"---\n[SENDING SMS TO {customer.phone_number or 'UNKNOWN NUMBER'}]"))
-            self.stdout.write(mock_sms)
-            
-            count += 1
-            
-        self.stdout.write(self.style.SUCCESS(f'\nSuccessfully sent {count} Khata reminders.'))
+        def progress(stats):
+            self.stdout.write(f"  {stats['sent']} sent, {stats['failed']} failed ({stats['seconds']:.1f}s)")
+
+        stats = dispatch(gateway, campaign, batch_size=options['batch_size'],
+                         concurrency=options['concurrency'], on_batch=progress)
+
+        if not stats['sent'] and not stats['failed']:
+            self.stdout.write(self.style.SUCCESS(f'No customers left to remind in {campaign}. All is well.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f"\nSuccessfully sent {stats['sent']} Khata reminders ({campaign})."))
+        if stats['failed']:
+            self.stdout.write(self.style.WARNING(f"{stats['failed']} failed; run again with --campaign {campaign} to retry them."))
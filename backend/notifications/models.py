@@ -1,5 +1,6 @@
 from django.db import models
 from bookings.models import Booking
+from customers.models import Customer
 
 class NotificationLog(models.Model):
     TYPE_CHOICES = [
@@ -7,12 +8,22 @@ class NotificationLog(models.Model):
         ('EMAIL', 'Email'),
     ]
     
-    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='notifications')
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
+    # Notifications not about a booking (e.g. khata reminders) are logged against the customer
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
+    # Batch send this belongs to (e.g. 'khata-reminder-2026-01-31'); resumed runs skip customers already SENT
+    campaign = models.CharField(max_length=64, blank=True, default='')
     type = models.CharField(max_length=10, choices=TYPE_CHOICES)
     recipient = models.CharField(max_length=255)
     message = models.TextField()
     sent_at = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, default='SENT')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['campaign', 'status', 'customer'], name='notification_campaign_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.type} to {self.recipient} for Booking {self.booking.id}"
+        about = f"Booking {self.booking_id}" if self.booking_id else f"Customer {self.customer_id}"
+        return f"{self.type} to {self.recipient} for {about}"
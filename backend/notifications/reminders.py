@@ -0,0 +1,153 @@
+"""
+Batched khata reminder dispatch.
+
+Debtors are streamed in customer-id order from one query (joined to their
+user for the name), a batch at a time. Each batch is rendered, sent
+concurrently through an SMS gateway (at most `concurrency` requests in flight
+and no faster than the gateway's rate limit), and its results are written to
+NotificationLog with one bulk_create.
+
+A dispatch belongs to a campaign (by default one per day). Customers already
+SENT in the campaign are skipped, so re-running an interrupted or partly
+failed dispatch resumes it: finished batches are not sent again and failures
+are retried.
+"""
+import asyncio
+import time
+
+from django.utils import timezone
+
+from .services import send_sms
+
+REMINDER_TEMPLATE = (
+    "Hi {name}, a gentle reminder that your Khata balance is ₹{balance}. "
+    "Click here to pay: https://kallayi-spa.com/pay"
+)
+SEND_TIMEOUT = 10  # seconds per message
+
+
+class RateLimiter:
+    """Spaces calls at least 1/per_second apart (no limit if per_second is None)."""
+
+    def __init__(self, per_second=None):
+        self.interval = 1 / per_second if per_second else 0
+        self.next_at = 0.0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        at = max(self.next_at, now)
+        self.next_at = at + self.interval
+        if at > now:
+            await asyncio.sleep(at - now)
+
+
+class ConsoleGateway:
+    """Prints each SMS (services.send_sms) until a real provider is wired in."""
+    name = 'console'
+    rate_limit = None
+
+    async def send(self, phone, message):
+        return send_sms(phone, message)
+
+
+class MockGateway:
+    """Simulated provider with network latency, for benchmarks and tests. Fails every `fail_every`-th send."""
+    name = 'mock'
+
+    def __init__(self, latency=0.05, rate_limit=None, fail_every=0):
+        self.latency, self.rate_limit, self.fail_every = latency, rate_limit, fail_every
+        self.sent = []
+
+    async def send(self, phone, message):
+        await asyncio.sleep(self.latency)
+        self.sent.append(phone)
+        return not (self.fail_every and len(self.sent) % self.fail_every == 0)
+
+
+GATEWAYS = {
+    'console': ConsoleGateway,
+    'mock': MockGateway,
+}
+
+
+def default_campaign():
+    return f'khata-reminder-{timezone.localdate().isoformat()}'
+
+
+def debtors(campaign):
+    """Customers owing money with a phone number, not yet reminded in `campaign`, as value dicts."""
+    from customers.models import Customer
+    from .models import NotificationLog
+    done = NotificationLog.objects.filter(campaign=campaign, status='SENT', customer__isnull=False).values('customer_id')
+    return (
+        Customer.objects.filter(outstanding_balance__gt=0).exclude(phone_number='')
+        .exclude(id__in=done)
+        .values('id', 'phone_number', 'outstanding_balance', 'user__first_name', 'user__username')
+        .order_by('id')
+    )
+
+
+def render(rows):
+    return [
+        (row['id'], row['phone_number'], REMINDER_TEMPLATE.format(
+            name=row['user__first_name'] or row['user__username'], balance=row['outstanding_balance'],
+        ))
+        for row in rows
+    ]
+
+
+async def send_all(gateway, messages, concurrency=20, limiter=None):
+    """Send [(key, phone, message)] concurrently; returns [(key, phone, message, ok)] in the same order."""
+    limiter = limiter or RateLimiter(gateway.rate_limit)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send_one(key, phone, message):
+        async with slots:
+            await limiter.wait()
+            try:
+                ok = bool(await asyncio.wait_for(gateway.send(phone, message), SEND_TIMEOUT))
+            except Exception as e:
+                print(f"[Reminder Error] Reminder to {phone} failed: {e}")
+                ok = False
+            return key, phone, message, ok
+
+    return await asyncio.gather(*(send_one(*m) for m in messages))
+
+
+def dispatch(gateway, campaign=None, batch_size=500, concurrency=20, on_batch=None):
+    """
+    Remind every pending debtor of `campaign` (default: today's) through
+    `gateway`. Returns {'campaign', 'sent', 'failed', 'seconds'}. `on_batch`
+    is called with the running totals after each batch is logged.
+    """
+    from .models import NotificationLog
+    campaign = campaign or default_campaign()
+    limiter = RateLimiter(gateway.rate_limit)
+    stats = {'campaign': campaign, 'sent': 0, 'failed': 0, 'seconds': 0.0}
+    started = time.perf_counter()
+
+    def flush(batch):
+        results = asyncio.run(send_all(gateway, render(batch), concurrency, limiter))
+        NotificationLog.objects.bulk_create([
+            NotificationLog(customer_id=customer_id, campaign=campaign, type='SMS', recipient=phone,
+                            message=message, status='SENT' if ok else 'FAILED')
+            for customer_id, phone, message, ok in results
+        ])
+        for *_, ok in results:
+            stats['sent' if ok else 'failed'] += 1
+        stats['seconds'] = time.perf_counter() - started
+        if on_batch:
+            on_batch(stats)
+
+    batch = []
+    for row in debtors(campaign).iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    stats['seconds'] = time.perf_counter() - started
+    return stats
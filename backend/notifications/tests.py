@@ -1,27 +1,31 @@
 from django.test import TestCase
 from django.utils import timezone
 from bookings.models import Booking, ServicePackage
-from customers.models import Customer
-from fleet.models import Vehicle
+from customers.models import Customer, CustomerVehicle
 from notifications.models import NotificationLog
 from django.contrib.auth.models import User
+from io import StringIO
+from django.core.management import call_command
+from notifications.reminders import MockGateway, dispatch
+
 
 class NotificationTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='cust', email='test@example.com', password='pwd')
         self.customer = Customer.objects.create(user=self.user)
-        self.vehicle = Vehicle.objects.create(owner=self.customer, model='Test Car', plate_number='TEST-123')
+        self.vehicle = CustomerVehicle.objects.create(customer=self.user, make='Test', model='Car', plate_number='TEST-123')
         self.package = ServicePackage.objects.create(name='Wash', price=10.0)
 
     def test_booking_creation_notification(self):
-        # Create booking should trigger signal
-        booking = Booking.objects.create(
-            customer=self.customer,
-            vehicle=self.vehicle,
-            service_package=self.package,
-            time_slot=timezone.now(),
-            address='123 St'
-        )
+        # Create booking should trigger signal once the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(
+                customer=self.customer,
+                vehicle=self.vehicle,
+                service_package=self.package,
+                time_slot=timezone.now(),
+                address='123 St'
+            )
         
         # Check log
         self.assertTrue(NotificationLog.objects.filter(booking=booking, type='EMAIL').exists())
@@ -30,21 +34,56 @@ class NotificationTest(TestCase):
         self.assertEqual(log.recipient, 'test@example.com')
 
     def test_booking_completion_notification(self):
-        booking = Booking.objects.create(
-            customer=self.customer,
-            vehicle=self.vehicle,
-            service_package=self.package,
-            time_slot=timezone.now(),
-            address='123 St',
-            status='IN_PROGRESS'
-        )
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.create(
+                customer=self.customer,
+                vehicle=self.vehicle,
+                service_package=self.package,
+                time_slot=timezone.now(),
+                address='123 St',
+                status='IN_PROGRESS'
+            )
         
-        # Update status to COMPLETED
-        booking.status = 'COMPLETED'
-        booking.save()
+        # Update status to COMPLETED (saving again while completed must not notify twice)
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.status = 'COMPLETED'
+            booking.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.save()
         
         # Check log (should have 2 logs now: creation and completion)
         logs = NotificationLog.objects.filter(booking=booking)
         self.assertEqual(logs.count(), 2)
         completion_log = logs.filter(message__contains="is complete").first()
         self.assertIsNotNone(completion_log)
+
+
+class KhataReminderTest(TestCase):
+    def setUp(self):
+        for i, (balance, phone) in enumerate([(500, '9000000001'), (0, '9000000002'), (250, ''), (120, '9000000004'), (80, '9000000005')]):
+            user = User.objects.create_user(username=f'debtor{i}', password='pwd', first_name=f'Debtor{i}' if i else '')
+            Customer.objects.create(user=user, phone_number=phone, outstanding_balance=balance)
+
+    def test_batches_log_results_and_resume(self):
+        gateway = MockGateway(latency=0, fail_every=2)
+        with self.assertNumQueries(3):  # one streamed read, one bulk insert per batch
+            stats = dispatch(gateway, 'test-run', batch_size=2)
+        self.assertEqual((stats['sent'], stats['failed']), (2, 1))
+        self.assertEqual(sorted(gateway.sent), ['9000000001', '9000000004', '9000000005'])
+        log = NotificationLog.objects.get(recipient='9000000001')
+        self.assertEqual((log.campaign, log.status, log.booking), ('test-run', 'SENT', None))
+        self.assertIn('Hi debtor0, a gentle reminder that your Khata balance is ₹500.00', log.message)
+
+        # Re-running the campaign only retries the failure
+        retry = MockGateway(latency=0)
+        self.assertEqual(dispatch(retry, 'test-run')['sent'], 1)
+        self.assertEqual(len(retry.sent), 1)
+        self.assertEqual(dispatch(MockGateway(latency=0), 'test-run')['sent'], 0)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('send_khata_reminders', '--gateway', 'mock', '--campaign', 'cmd', stdout=out)
+        self.assertIn('Successfully sent 3 Khata reminders (cmd).', out.getvalue())
+        out = StringIO()
+        call_command('send_khata_reminders', '--gateway', 'mock', '--campaign', 'cmd', stdout=out)
+        self.assertIn('No customers left to remind in cmd', out.getvalue())
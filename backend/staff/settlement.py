@@ -0,0 +1,83 @@
+"""
+Daily settlement ledger for field staff.
+
+Every figure comes from a correlated subquery on one annotated StaffProfile
+queryset (joined to its user), so the ledger is a single query however many
+staff there are.
+
+The wage, commission and advances shown are the ones settling pays out: the
+stored PayrollEntry once the day is settled, else today's figures from
+finance.payroll.compute (what settling writes to the entry).
+"""
+from decimal import Decimal
+
+from django.db.models import BooleanField, Count, DecimalField, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+FIELD_ROLES = ['WASHER', 'TECHNICIAN', 'DRIVER']
+ADVANCES_CATEGORY = 'Advances'
+
+
+def ledger_queryset(day):
+    """Active field staff annotated with jobs_completed, their PayrollEntry figures (settled_*), is_settled and advances for `day`."""
+    from bookings.models import Booking
+    from finance.models import GeneralExpense, PayrollEntry
+    from finance.payroll import completion_date
+    from .models import StaffProfile
+
+    money = DecimalField(max_digits=10, decimal_places=2)
+    # Counted on the same day payroll credits the commission for them.
+    jobs = (
+        Booking.objects.annotate(day=completion_date())
+        .filter(technician=OuterRef('user'), status='COMPLETED', day=day)
+        .order_by().values('technician').annotate(count=Count('id')).values('count')
+    )
+    advances = (
+        GeneralExpense.objects.filter(recorded_by=OuterRef('user'), category__name=ADVANCES_CATEGORY, date=day)
+        .order_by().values('recorded_by').annotate(total=Sum('amount')).values('total')
+    )
+    payroll = PayrollEntry.objects.filter(staff_user=OuterRef('user'), date=day)
+
+    return (
+        StaffProfile.objects.filter(role__in=FIELD_ROLES, is_active=True, user__is_active=True)
+        .select_related('user')
+        .annotate(
+            jobs_completed=Coalesce(Subquery(jobs, output_field=IntegerField()), 0),
+            settled_wage=Subquery(payroll.values('base_wage')[:1], output_field=money),
+            settled_commission=Subquery(payroll.values('commission_earned')[:1], output_field=money),
+            settled_advances=Subquery(payroll.values('advances')[:1], output_field=money),
+            is_settled=Coalesce(Subquery(payroll.values('is_settled')[:1], output_field=BooleanField()), False),
+            advances=Coalesce(Subquery(advances, output_field=money), Decimal('0')),
+        )
+        .order_by('id')
+    )
+
+
+def ledger(day):
+    """The ledger rows for `day`: one query for the staff plus finance.payroll.compute's, whatever the headcount."""
+    from finance.payroll import compute
+    staff = list(ledger_queryset(day))
+    figures = compute(day, day, users=[profile.user for profile in staff])
+    return [ledger_row(profile, figures.get((profile.user_id, day), {})) for profile in staff]
+
+
+def ledger_row(staff, figures):
+    """Ledger entry for an annotated `staff` row; `figures` is their finance.payroll.compute() row for the day."""
+    if staff.is_settled:
+        base_wage, commission_earned, advances = staff.settled_wage, staff.settled_commission, staff.settled_advances
+    else:
+        base_wage, commission_earned = figures.get('base_wage', 0), figures.get('commission_earned', 0)
+        advances = staff.advances
+    base_wage, commission_earned, advances = float(base_wage), float(commission_earned), float(advances)
+    return {
+        'id': staff.user.id,
+        'name': staff.user.get_full_name() or staff.user.username,
+        'role': staff.get_role_display(),
+        'base_salary': float(staff.base_salary),
+        'base_wage': base_wage,
+        'jobs_completed': staff.jobs_completed,
+        'commission_earned': commission_earned,
+        'advances': advances,
+        'final_payout': base_wage + commission_earned - advances,
+        'status': 'Paid' if staff.is_settled else 'Pending',
+    }
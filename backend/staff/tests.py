@@ -1,3 +1,198 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 from django.test import TestCase
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from bookings.models import Booking, ServicePackage
+from customers.models import Customer, CustomerVehicle
+from finance.models import CommissionRule, DailyFinanceRollup, ExpenseCategory, GeneralExpense, PayrollEntry, PayrollRun
+from finance.payroll import compute, run_payroll
+from staff.models import StaffProfile, TimeEntry
 
-# Create your tests here.
+
+class DailySettlementLedgerTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='manager', password='password', is_staff=True))
+        customer = Customer.objects.create(user=User.objects.create_user(username='cust', password='pwd'))
+        self.vehicle = CustomerVehicle.objects.create(customer=customer.user, make='Test', model='Car', plate_number='KL-STAFF')
+        self.customer = customer
+        self.advances = ExpenseCategory.objects.create(name='Advances')
+
+    def add_staff(self, n):
+        start = StaffProfile.objects.count()
+        return [
+            StaffProfile.objects.create(role='WASHER', base_salary=500, user=User.objects.create_user(
+                username=f'washer{i}', password='pwd', first_name=f'Washer {i}'))
+            for i in range(start, start + n)
+        ]
+
+    def test_ledger_figures(self):
+        washer, idle = self.add_staff(2)
+        now = timezone.now()
+        for status in ('COMPLETED', 'COMPLETED', 'WAITING'):
+            Booking.objects.create(customer=self.customer, vehicle=self.vehicle, technician=washer.user, time_slot=now, status=status)
+        PayrollEntry.objects.create(staff_user=washer.user, date=timezone.localdate(), base_wage=300, commission_earned=120,
+                                    advances=80, is_settled=True)
+        GeneralExpense.objects.create(category=self.advances, amount=50, date=timezone.localdate(), recorded_by=washer.user)
+        GeneralExpense.objects.create(category=self.advances, amount=30, date=timezone.localdate(), recorded_by=washer.user)
+
+        response = self.client.get('/api/staff/daily-settlement/')
+        self.assertEqual(response.status_code, 200)
+        first, second = response.data
+        self.assertEqual(first, {
+            'id': washer.user.id, 'name': 'Washer 0', 'role': 'Washer', 'base_salary': 500.0, 'base_wage': 300.0,
+            'jobs_completed': 2, 'commission_earned': 120.0, 'advances': 80.0, 'final_payout': 340.0, 'status': 'Paid',
+        })
+        # No shifts, jobs or advances: nothing to pay
+        self.assertEqual((second['jobs_completed'], second['base_wage'], second['final_payout'], second['status']), (0, 0.0, 0.0, 'Pending'))
+
+    def test_ledger_shows_what_settling_stores(self):
+        washer, idle = self.add_staff(2)
+        now = timezone.now()
+        package = ServicePackage.objects.create(name='Basic', price=400, description='Basic')
+        StaffProfile.objects.filter(pk=washer.pk).update(hourly_rate=100, commission_rate=10)
+        start = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+        TimeEntry.objects.create(staff=washer, clock_in_time=start, clock_out_time=start + timedelta(hours=2))
+        Booking.objects.create(customer=self.customer, vehicle=self.vehicle, technician=washer.user, service_package=package,
+                               time_slot=now, status='COMPLETED', finished_at=now)
+        GeneralExpense.objects.create(category=self.advances, amount=50, date=timezone.localdate(), recorded_by=washer.user)
+
+        before = self.client.get('/api/staff/daily-settlement/').data
+        for profile in (washer, idle):
+            self.assertEqual(self.client.patch(f'/api/staff/payroll/{profile.user.id}/settle/').status_code, 200)
+        after = self.client.get('/api/staff/daily-settlement/').data
+
+        for profile, row in zip((washer, idle), after):
+            entry = PayrollEntry.objects.get(staff_user=profile.user, date=timezone.localdate())
+            self.assertTrue(entry.is_settled)
+            self.assertEqual(row['status'], 'Paid')
+            self.assertEqual(
+                (row['base_wage'], row['commission_earned'], row['advances'], row['final_payout']),
+                (float(entry.base_wage), float(entry.commission_earned), float(entry.advances),
+                 float(entry.base_wage + entry.commission_earned - entry.advances)),
+            )
+        # 2 h at 100 + 10% of 400 - 50, shown the same before and after settling
+        self.assertEqual(after[0]['final_payout'], 190.0)
+        self.assertEqual([row['final_payout'] for row in before], [row['final_payout'] for row in after])
+
+    def test_jobs_count_on_the_day_they_were_finished(self):
+        washer, = self.add_staff(1)
+        now = timezone.now()
+        yesterday = now - timezone.timedelta(days=1)
+        Booking.objects.create(customer=self.customer, vehicle=self.vehicle, technician=washer.user, time_slot=yesterday,
+                               status='COMPLETED', finished_at=now)
+        Booking.objects.create(customer=self.customer, vehicle=self.vehicle, technician=washer.user, time_slot=yesterday,
+                               status='COMPLETED')
+
+        # Finished today counts today; the one without a finish time stays on its (yesterday's) slot.
+        self.assertEqual(self.client.get('/api/staff/daily-settlement/').data[0]['jobs_completed'], 1)
+
+    def test_query_count_does_not_grow_with_headcount(self):
+        def ledger_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/staff/daily-settlement/')
+            return len(queries), response
+
+        self.add_staff(3)
+        small, _ = ledger_queries()
+        self.add_staff(30)
+        large, response = ledger_queries()
+        self.assertEqual(large, small)
+        self.assertEqual(len(response.data), 33)
+
+
+class PayrollRunTest(TestCase):
+    DAY = date(2026, 3, 10)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='manager', password='password', is_staff=True))
+        customer = Customer.objects.create(user=User.objects.create_user(username='cust', password='pwd'))
+        self.customer = customer
+        self.vehicle = CustomerVehicle.objects.create(customer=customer.user, make='Test', model='Car', plate_number='KL-PAY')
+        self.basic = ServicePackage.objects.create(name='Basic', price=500, description='Basic')
+        rule = CommissionRule.objects.create(name='Detail bonus', flat_amount=20, percentage=15)
+        self.detail = ServicePackage.objects.create(name='Detail', price=499, description='Detail', commission_rule=rule)
+        self.advances = ExpenseCategory.objects.create(name='Advances')
+
+    def at(self, hour, day=None):
+        return timezone.make_aware(datetime.combine(day or self.DAY, datetime.min.time()) + timedelta(hours=hour))
+
+    def add_washer(self, name, day=None):
+        profile = StaffProfile.objects.create(
+            user=User.objects.create_user(username=name, password='pwd'), role='WASHER', hourly_rate=100, commission_rate=10,
+        )
+        for package in (self.basic, self.detail):
+            Booking.objects.create(customer=self.customer, vehicle=self.vehicle, technician=profile.user,
+                                   service_package=package, time_slot=self.at(9, day), status='COMPLETED')
+        TimeEntry.objects.create(staff=profile, clock_in_time=self.at(8, day), clock_out_time=self.at(16.5, day))
+        GeneralExpense.objects.create(category=self.advances, amount=200, date=day or self.DAY, recorded_by=profile.user)
+        return profile
+
+    def test_day_run_applies_commission_wage_and_advance_rules(self):
+        washer = self.add_washer('washer')
+        run = run_payroll('DAY', self.DAY)
+
+        entry = PayrollEntry.objects.get(staff_user=washer.user, date=self.DAY)
+        # profile rate on Basic (10% of 500) + rule on Detail (20 + 15% of 499)
+        self.assertEqual(entry.commission_earned, Decimal('144.85'))
+        self.assertEqual(entry.base_wage, Decimal('850.00'))  # 8.5 h at 100
+        self.assertEqual(entry.advances, Decimal('200.00'))
+        self.assertEqual((run.entry_count, run.total_wages, run.total_commission), (1, Decimal('850.00'), Decimal('144.85')))
+        self.assertEqual(DailyFinanceRollup.objects.get(date=self.DAY).labor_cost, Decimal('994.85'))
+
+    def test_commission_is_dated_by_when_the_job_was_finished(self):
+        washer = self.add_washer('washer')
+        next_day = self.DAY + timedelta(days=1)
+        Booking.objects.filter(technician=washer.user, service_package=self.detail).update(finished_at=self.at(1, next_day))
+
+        figures = compute(self.DAY, next_day)
+        self.assertEqual(figures[(washer.user.id, self.DAY)]['commission_earned'], Decimal('50.00'))
+        self.assertEqual(figures[(washer.user.id, next_day)]['commission_earned'], Decimal('94.85'))
+
+    def test_rerun_is_idempotent_and_leaves_settled_entries_alone(self):
+        washer, settled = self.add_washer('washer'), self.add_washer('settled')
+        run_payroll('WEEK', self.DAY)
+        PayrollEntry.objects.filter(staff_user=settled.user).update(is_settled=True, commission_earned=1)
+        Booking.objects.filter(technician=washer.user, service_package=self.detail).update(status='CANCELLED')
+
+        run_payroll('WEEK', self.DAY)
+        with CaptureQueriesContext(connection) as queries:
+            run = run_payroll('WEEK', self.DAY)
+        self.assertFalse([q for q in queries if q['sql'].startswith(('INSERT', 'UPDATE "finance_payrollentry"'))])
+
+        self.assertEqual(PayrollRun.objects.count(), 1)
+        self.assertEqual((run.start, run.end), (date(2026, 3, 9), date(2026, 3, 15)))
+        self.assertEqual(PayrollEntry.objects.get(staff_user=washer.user).commission_earned, Decimal('50.00'))
+        self.assertEqual(PayrollEntry.objects.get(staff_user=settled.user).commission_earned, Decimal('1.00'))
+        # washer 850 + 50; the settled entry still counts as computed, its edit above bypassed the rollup
+        self.assertEqual(DailyFinanceRollup.objects.get(date=self.DAY).labor_cost, Decimal('1894.85'))
+
+    def test_month_run_query_count_does_not_grow_with_headcount(self):
+        def queries_for_month():
+            with CaptureQueriesContext(connection) as queries:
+                run_payroll('MONTH', self.DAY)
+            return len(queries)
+
+        DailyFinanceRollup.objects.bulk_create([DailyFinanceRollup(date=self.DAY + timedelta(days=n)) for n in range(5)])
+        for n in range(5):
+            self.add_washer(f'small{n}', self.DAY + timedelta(days=n))
+        small = queries_for_month()
+        PayrollEntry.objects.all().delete()
+        PayrollRun.objects.all().delete()
+        for n in range(50):
+            self.add_washer(f'large{n}', self.DAY + timedelta(days=n % 5))
+        self.assertEqual(queries_for_month(), small)
+        self.assertEqual(PayrollRun.objects.get().entry_count, 55)
+
+    def test_endpoint(self):
+        self.add_washer('washer')
+        response = self.client.post('/api/staff/payroll/run/', {'period': 'month', 'date': '2026-03-10'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['start'], response.data['end']), (date(2026, 3, 1), date(2026, 3, 31)))
+        self.assertEqual(response.data['total_advances'], Decimal('200.00'))
+        self.assertEqual(self.client.post('/api/staff/payroll/run/', {'period': 'year'}, format='json').status_code, 400)
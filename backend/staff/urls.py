@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import daily_settlement_ledger, settle_daily_pay, StaffDirectoryViewSet, add_staff_advance, settle_staff_payroll
+from .views import daily_settlement_ledger, settle_daily_pay, StaffDirectoryViewSet, add_staff_advance, settle_staff_payroll, run_payroll
 
 router = DefaultRouter()
 router.register(r'directory', StaffDirectoryViewSet, basename='staff-directory')
@@ -11,4 +11,5 @@ urlpatterns = [
     path('settle-pay/<int:staff_id>/', settle_daily_pay, name='settle-daily-pay'),
     path('advance/<int:staff_id>/', add_staff_advance, name='add-staff-advance'),
     path('payroll/<int:payroll_id>/settle/', settle_staff_payroll, name='settle_payroll'),
+    path('payroll/run/', run_payroll, name='run_payroll'),
 ]
\ No newline at end of file
@@ -65,7 +65,7 @@ export default function StaffTab() {
                                         <tr>
                                             <th className="p-4 pl-6">Worker Info</th>
                                             <th className="p-4 text-center">Jobs Done</th>
-                                            <th className="p-4 text-right">Base Salary</th>
+                                            <th className="p-4 text-right">Wage</th>
                                             <th className="p-4 text-right text-[#01FFFF]">+ Commissions</th>
                                             <th className="p-4 text-right text-[#FF2A6D]">- Advances</th>
                                             <th className="p-4 text-right text-white">Final Payout</th>
@@ -86,7 +86,7 @@ export default function StaffTab() {
                                                 <td className="p-4 text-center">
                                                     <span className="bg-white/10 text-white px-3 py-1 rounded-full text-xs font-bold font-mono">{worker.jobs_completed}</span>
                                                 </td>
-                                                <td className="p-4 text-right font-mono text-gray-400">₹{worker.base_salary}</td>
+                                                <td className="p-4 text-right font-mono text-gray-400">₹{worker.base_wage}</td>
                                                 <td className="p-4 text-right font-mono font-bold text-[#01FFFF]">₹{worker.commission_earned}</td>
                                                 <td className="p-4 text-right font-mono font-bold text-[#FF2A6D]">₹{worker.advances}</td>
                                                 <td className="p-4 text-right font-syncopate font-bold text-lg text-emerald-400 group-hover:scale-110 transition-transform origin-right">
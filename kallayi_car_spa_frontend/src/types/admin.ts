@@ -43,6 +43,7 @@ export interface PayrollWorker {
     role: string;
     jobs_completed?: number;
     base_salary?: number | string;
+    base_wage?: number | string;
     commission_earned?: number | string;
     advances?: number | string;
     final_payout: number;